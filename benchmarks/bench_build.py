@@ -0,0 +1,212 @@
+"""
+Benchmark the SPOC build, i.e., ``download_all_data(extract_source_urls=False)`` and
+``_export_tcestats_as_db()``, for both minimal and full dbs, with synthetic sector data of the given scales.
+
+Each case is run in a fresh process, so that the peak memory (max RSS) of a case is not
+affected by the previous ones. The results are appended to the output file as json lines,
+so that the runs (e.g., before / after a change) can be compared.
+
+Usage, e.g.,
+    python benchmarks/bench_build.py --num_tces 10000 100000 1000000
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from synthetic_data import generate_sector_data  # noqa: E402
+
+CASES = [
+    # (case name, function name, minimal_db)
+    ("download_all_data_minimal", "download_all_data", True),
+    ("download_all_data_full", "download_all_data", False),
+    ("export_db_minimal", "_export_tcestats_as_db", True),
+    ("export_db_full", "_export_tcestats_as_db", False),
+]
+
+
+def _run_case(func_name, minimal_db, kwargs, result_queue):
+    from tess_dv_fast import tess_dv_fast_build
+
+    func = getattr(tess_dv_fast_build, func_name)
+    if func_name == "download_all_data":
+        kwargs = dict(extract_source_urls=False, **kwargs)
+
+    start = time.perf_counter()
+    func(minimal_db=minimal_db, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on Linux (in bytes on macOS)
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+    # the worker processes, in case of num_workers
+    peak_rss_children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit
+    result_queue.put(dict(elapsed_s=elapsed, peak_rss_mb=peak_rss / 2**20, peak_rss_children_mb=peak_rss_children / 2**20))
+
+
+def run_case(base_path, func_name, minimal_db, **kwargs):
+    """Run a build function in a fresh process and return its timing / memory measurements."""
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue()
+    proc = ctx.Process(target=_run_case, args=(func_name, minimal_db, kwargs, result_queue))
+    # the data dir is determined when tess_dv_fast_spec is imported,
+    # so it is passed to the fresh (spawned) process in its environment
+    base_path_orig = os.environ.get("TESS_DB_BASE_PATH")
+    os.environ["TESS_DB_BASE_PATH"] = base_path
+    try:
+        proc.start()
+    finally:
+        if base_path_orig is None:
+            del os.environ["TESS_DB_BASE_PATH"]
+        else:
+            os.environ["TESS_DB_BASE_PATH"] = base_path_orig
+    proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError(f"Benchmark case {func_name}(minimal_db={minimal_db}) failed, exitcode={proc.exitcode}")
+    return result_queue.get()
+
+
+def _file_size_mb(filepath):
+    return os.path.getsize(filepath) / 2**20 if os.path.isfile(filepath) else None
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _env_info():
+    import numpy as np
+    import pandas as pd
+
+    return dict(
+        git_rev=_git_rev(),
+        python=platform.python_version(),
+        pandas=pd.__version__,
+        numpy=np.__version__,
+        machine=platform.machine(),
+        cpu_count=os.cpu_count(),
+    )
+
+
+def run_benchmarks(num_tces_list, output, work_dir=None, num_single_sectors=96, num_multi_sectors=24, cases=None, **kwargs):
+    """Run the benchmark cases for each of the scales in ``num_tces_list``, appending the results to ``output``.
+
+    ``kwargs`` are passed to the build functions, e.g., ``chunksize``.
+    """
+    cases = CASES if cases is None else [c for c in CASES if c[0] in cases]
+    env_info = _env_info()
+    results = []
+    for num_tces in num_tces_list:
+        base_path = tempfile.mkdtemp(prefix=f"tess_dv_fast_bench_{num_tces}_", dir=work_dir)
+        data_dir = f"{base_path}/data/tess_dv_fast"
+        try:
+            print(f"Generating synthetic data of {num_tces} TCEs in {data_dir} ...")
+            sectors = generate_sector_data(
+                data_dir, num_tces, num_single_sectors=num_single_sectors, num_multi_sectors=num_multi_sectors
+            )
+            for case_name, func_name, minimal_db in cases:
+                func_kwargs = {k: v for k, v in kwargs.items() if not (func_name != "download_all_data" and k == "num_workers")}
+                print(f"  {case_name} ...", flush=True)
+                result = run_case(base_path, func_name, minimal_db, **func_kwargs)
+                result.update(
+                    case=case_name,
+                    num_tces=num_tces,
+                    num_sectors=len(sectors),
+                    db_size_mb=_file_size_mb(f"{data_dir}/tess_tcestats.db"),
+                    csv_size_mb=_file_size_mb(f"{data_dir}/tess_tcestats.csv"),
+                    kwargs=func_kwargs,
+                    timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    **env_info,
+                )
+                results.append(result)
+                with open(output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+    return results
+
+
+def print_results(results):
+    print(f"{'num_tces':>10} {'case':<28} {'time (s)':>10} {'peak RSS (MB)':>14} {'db size (MB)':>13}")
+    for r in results:
+        db_size = f"{r['db_size_mb']:.1f}" if r["db_size_mb"] is not None else "-"
+        print(f"{r['num_tces']:>10} {r['case']:<28} {r['elapsed_s']:>10.2f} {r['peak_rss_mb']:>14.1f} {db_size:>13}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the SPOC build with synthetic sector data")
+    parser.add_argument(
+        "--num_tces",
+        dest="num_tces_list",
+        type=int,
+        nargs="+",
+        default=[10000],
+        help="the scales to benchmark, in total number of TCEs, e.g., 10000 100000 1000000",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        default="bench_output.txt",
+        help="the file the results are appended to, as json lines",
+    )
+    parser.add_argument(
+        "--work_dir",
+        dest="work_dir",
+        default=None,
+        help="the directory for the synthetic data and the built db. Default is the system temp directory",
+    )
+    parser.add_argument(
+        "--case",
+        dest="cases",
+        choices=[c[0] for c in CASES],
+        nargs="+",
+        default=None,
+        help="the cases to run. Default is all. The export_db cases need the master csv from a download_all_data case",
+    )
+    parser.add_argument("--num_single_sectors", dest="num_single_sectors", type=int, default=96)
+    parser.add_argument("--num_multi_sectors", dest="num_multi_sectors", type=int, default=24)
+    parser.add_argument(
+        "--num_workers",
+        dest="num_workers",
+        type=int,
+        default=None,
+        help="passed to download_all_data()",
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        default=None,
+        help="passed to download_all_data() and _export_tcestats_as_db()",
+    )
+    args = parser.parse_args()
+
+    build_kwargs = {k: v for k, v in dict(num_workers=args.num_workers, chunksize=args.chunksize).items() if v is not None}
+    results = run_benchmarks(
+        args.num_tces_list,
+        args.output,
+        work_dir=args.work_dir,
+        num_single_sectors=args.num_single_sectors,
+        num_multi_sectors=args.num_multi_sectors,
+        cases=args.cases,
+        **build_kwargs,
+    )
+    print_results(results)
+    print(f"Results appended to {args.output}")
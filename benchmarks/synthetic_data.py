@@ -0,0 +1,194 @@
+"""
+Generate synthetic SPOC sector tcestats csvs and tesscurl DV scripts for benchmarking the build.
+
+The files mimic the ones from MAST, in names, layouts (``RAW_CSV_COLS_V1`` / ``RAW_CSV_COLS_V2``)
+and value formats, so that ``tess_dv_fast_build.download_all_data(extract_source_urls=False)``
+can be run against them at an arbitrary scale.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from tess_dv_fast.tess_dv_fast_build import RAW_CSV_COLS_V1, RAW_CSV_COLS_V2
+from tess_dv_fast.tess_dv_fast_spec import SOURCE_URLS_FILENAME
+
+# the integer columns in the csvs. The rest of the numeric columns are floats
+_INT_COLS = [
+    "tce_num_transits",
+    "tce_chisqgofdof",
+    "tce_ntoi",
+    "tcet_model_chisq",
+    "tcet_model_dof",
+    "bootstrap_transit_count",
+]
+
+_PROV_VALS = ["TIC8.1", "TIC8.2", "Solar", "TIC8.1-Der", "TIC8.2-Der"]
+
+# the sectors with the new columns in RAW_CSV_COLS_V2, approximately the same as the actual ones
+_V2_SINCE_SECTOR = 92
+
+# the leading columns of the csvs, generated for each TCE. The rest are sampled from a pool of rows.
+_KEY_COLS = ["tceid", "ticid", "tce_plnt_num", "sectors", "lastUpdate"]
+
+# number of rows of the pool of the non-key values, formatted to csv once per sector
+_ROWS_POOL_SIZE = 2000
+
+_TCESTATS_URL_BASE = "https://archive.stsci.edu/missions/tess/catalogs/tce"
+_PRODUCT_URL_BASE = "https://mast.stsci.edu/api/v0.1/Download/file/?uri=mast:TESS/product"
+
+
+def _gen_sectors_list(num_single_sectors, num_multi_sectors):
+    """Return the list of (sector_start, sector_end) of the synthetic sectors."""
+    sectors_list = [(s, s) for s in range(1, num_single_sectors + 1)]
+    # multi-sector runs: s0001-s0003, s0001-s0006, ..., and some starting later, e.g., s0014-s0026
+    for i in range(num_multi_sectors):
+        start = 1 if i % 2 == 0 else 14
+        end = min(start + 2 + 3 * (i // 2), max(num_single_sectors, start + 2))
+        sectors_list.append((start, end))
+    return list(dict.fromkeys(sectors_list))  # remove duplicates, if any
+
+
+def _sectors_val(start, end):
+    return f"s{start:04d}-s{end:04d}"
+
+
+def _date_time(start, end):
+    # the timestamp in the filenames, the same for all the files of a sector, e.g., 2018206190142
+    return f"{2018 + start // 13}{206 + end % 150:03d}{190142 + start:06d}"
+
+
+def _gen_rows_pool(rng, cols, start, end, pool_size=_ROWS_POOL_SIZE):
+    """Generate the non-key values of the csv rows, already formatted as csv, e.g., ``"9.0261800000000001,...``.
+
+    Formatting the floats is the bulk of the cost of writing the csvs. The rows of a sector are sampled
+    from the pool, so that generating millions of TCEs does not take hours.
+    """
+    data = {}
+    for col in cols[len(_KEY_COLS) :]:
+        if col in _INT_COLS:
+            data[col] = rng.integers(1, 20000, pool_size)
+        elif col.endswith("_err"):
+            data[col] = np.where(rng.random(pool_size) < 0.3, -1.0, rng.lognormal(-3, 2, pool_size))
+        else:
+            data[col] = rng.lognormal(1, 2, pool_size) * rng.choice([-1, 1], pool_size, p=[0.1, 0.9])
+
+    # tce_sectors: the bit pattern of the sectors observed, e.g., "0100...", 80 chars wide
+    sectors_bits = np.full((pool_size, 80), ord("0"), dtype=np.uint8)
+    bits_range = slice(min(start, 81) - 1, min(end, 80))
+    observed = rng.random(sectors_bits[:, bits_range].shape) < 0.7
+    sectors_bits[:, bits_range] = np.where(observed, ord("1"), ord("0"))
+
+    data.update(
+        tce_limbdark_mod="claret_tess_nonlinear_limb_darkening_model",
+        tce_trans_mod="mandel-agol_geometric_transit_model",
+        tce_full_conv=np.where(rng.random(pool_size) < 0.95, "true", "false"),
+        tcet_full_conv=np.where(rng.random(pool_size) < 0.95, "true", "false"),
+        tce_sectors=sectors_bits.view("S80").ravel().astype(str),
+    )
+    for col in ["tce_steff_prov", "tce_slogg_prov", "tce_smet_prov", "tce_sradius_prov", "tce_sdensity_prov"]:
+        data[col] = rng.choice(_PROV_VALS, pool_size)
+
+    df = pd.DataFrame(data)[cols[len(_KEY_COLS) :]]
+    # floats in the long form as in the csv from MAST, e.g., 9.0261800000000001
+    return df.to_csv(index=False, header=False, float_format="%.17G").splitlines()
+
+
+def _gen_tces(rng, num_tces, ticid_offset):
+    """Return the ticid and tce_plnt_num of the TCEs of a sector, sorted by ticid."""
+    # about 1.3 TCEs per TIC, as in the actual data
+    num_tics = max(1, int(num_tces / 1.3))
+    ticids = np.sort(rng.choice(np.arange(ticid_offset + 1, ticid_offset + num_tics * 50), num_tics, replace=False))
+    tic_idx = np.sort(np.concatenate([np.arange(num_tics), rng.integers(0, num_tics, num_tces - num_tics)]))
+    ticid = ticids[tic_idx]
+    # planet number: 1, 2, ... for the TCEs of a TIC
+    tce_plnt_num = pd.Series(ticid).groupby(ticid).cumcount().to_numpy() + 1
+    return pd.DataFrame(dict(ticid=ticid, tce_plnt_num=tce_plnt_num))
+
+
+def _write_sector_csv(rng, df_tces, filepath, start, end):
+    cols = RAW_CSV_COLS_V2 if end >= _V2_SINCE_SECTOR else RAW_CSV_COLS_V1
+    rows_pool = _gen_rows_pool(rng, cols, start, end, pool_size=min(_ROWS_POOL_SIZE, len(df_tces)))
+    sectors = f"s{start:04d}" if start == end else _sectors_val(start, end)
+    pool_idx = rng.integers(0, len(rows_pool), len(df_tces))
+    with open(filepath, "w") as f:
+        # the comment header, as in the csv from MAST
+        f.write("#Select Statistics Per TCE From the Data Validation XML Files\n")
+        f.write("#Mission = TESS\n")
+        f.write(f"#Search = tess{_date_time(start, end)}\n")
+        f.write(f"#Sectors = {_sectors_val(start, end)}\n")
+        f.write("#Created Date = 2025-09-05\n")
+        f.write("#\n")
+        f.write(",".join(cols) + "\n")
+        f.writelines(
+            f"{t:011d}-{p:02d},{t},{p},{sectors},2025-09-05,{rows_pool[i]}\n"
+            for t, p, i in zip(df_tces["ticid"], df_tces["tce_plnt_num"], pool_idx)
+        )
+
+
+def _write_dv_script(df, filepath, start, end, pin):
+    prefix = f"tess{_date_time(start, end)}-{_sectors_val(start, end)}"
+    # the products of a TIC: dvr.xml, dvt.fits, dvm.pdf, dvr.pdf; the products of a TCE: dvs.pdf
+    names = [
+        f"{prefix}-{ticid:016d}-{pin:05d}_{product}"
+        for ticid in df["ticid"].unique()
+        for product in ["dvr.xml", "dvt.fits", "dvm.pdf", "dvr.pdf"]
+    ]
+    names += [f"{prefix}-{t:016d}-{p:02d}-{pin:05d}_dvs.pdf" for t, p in zip(df["ticid"], df["tce_plnt_num"])]
+    with open(filepath, "w") as f:
+        f.write("#!/bin/sh\n")
+        f.writelines(f"curl -C - -L -o {name} {_PRODUCT_URL_BASE}/{name}\n" for name in names)
+
+
+def generate_sector_data(data_dir, num_tces, num_single_sectors=96, num_multi_sectors=24, seed=42):
+    """Generate the synthetic sector tcestats csvs, tesscurl DV scripts, and the source URLs config
+    in ``data_dir``, with ``num_tces`` TCEs in total, split evenly across the sectors.
+
+    Returns the list of the generated sectors, e.g., ``["s0001-s0001", ...]``.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    sectors_list = _gen_sectors_list(num_single_sectors, num_multi_sectors)
+    num_tces_per_sector = max(1, num_tces // len(sectors_list))
+
+    urls_single, urls_multi = [], []
+    for i, (start, end) in enumerate(sectors_list):
+        df_tces = _gen_tces(rng, num_tces_per_sector, ticid_offset=i * 1000)
+        csv_name = f"tess{_date_time(start, end)}-{_sectors_val(start, end)}_dvr-tcestats.csv"
+        _write_sector_csv(rng, df_tces, f"{data_dir}/{csv_name}", start, end)
+        if start == end:
+            urls_single.append(f"{_TCESTATS_URL_BASE}/{csv_name}")
+            script_name = f"tesscurl_sector_{start}_dv.sh"
+        else:
+            urls_multi.append(f"{_TCESTATS_URL_BASE}/{csv_name}")
+            script_name = f"tesscurl_multisector_{_sectors_val(start, end)}_dv.sh"
+        _write_dv_script(df_tces, f"{data_dir}/{script_name}", start, end, pin=100 + i)
+
+    # the source URLs config, so that the build uses the local synthetic files
+    with open(f"{data_dir}/{SOURCE_URLS_FILENAME}", "w") as f:
+        json.dump(dict(sources_tcestats_single_sector=urls_single, sources_tcestats_multi_sector=urls_multi), f, indent=4)
+
+    return [_sectors_val(start, end) for start, end in sectors_list]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate synthetic SPOC sector data for benchmarking")
+    parser.add_argument("data_dir", help="the directory to write the files to")
+    parser.add_argument("--num_tces", type=int, default=10000, help="the total number of TCEs")
+    parser.add_argument("--num_single_sectors", type=int, default=96)
+    parser.add_argument("--num_multi_sectors", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sectors = generate_sector_data(
+        args.data_dir,
+        args.num_tces,
+        num_single_sectors=args.num_single_sectors,
+        num_multi_sectors=args.num_multi_sectors,
+        seed=args.seed,
+    )
+    print(f"Generated {len(sectors)} sectors with {args.num_tces} TCEs in total in {args.data_dir}")
@@ -0,0 +1,112 @@
+#
+# Reading the source files from archives (tarballs or zip files) without extracting them to disk,
+# e.g., for builds on machines with no access to MAST.
+#
+# A file in an archive is referred to by a member path in the form of ``<archive path>::<member name>``,
+# which can be opened with ``download_utils.open_file()`` like a local file.
+#
+
+import functools
+import io
+import os
+import tarfile
+import zipfile
+
+MEMBER_PATH_SEPARATOR = "::"
+
+
+def member_path(archive_path, member_name):
+    return f"{archive_path}{MEMBER_PATH_SEPARATOR}{member_name}"
+
+
+def is_member_path(path):
+    return MEMBER_PATH_SEPARATOR in str(path)
+
+
+def split_member_path(path):
+    """Return the archive path and the member name of the member path."""
+    archive_path, member_name = str(path).split(MEMBER_PATH_SEPARATOR, 1)
+    return archive_path, member_name
+
+
+@functools.lru_cache(maxsize=None)
+def _read_index(archive_path):
+    """Return the regular files in the archive, ``{member name: TarInfo or ZipInfo}``, in the archive order."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            return {info.filename: info for info in zf.infolist() if not info.is_dir()}
+    elif tarfile.is_tarfile(archive_path):
+        # for compressed tarballs, it is a pass over the entire archive
+        with tarfile.open(archive_path, "r:*") as tf:
+            return {info.name: info for info in tf.getmembers() if info.isfile()}
+    else:
+        raise ValueError(f"Unsupported archive (not a tarball or a zip file): {archive_path}")
+
+
+@functools.lru_cache(maxsize=None)
+def _index_by_basename(archive_path):
+    """Return ``{basename: member name}`` of the regular files in the archive, the last one for duplicates."""
+    return {member_name.rsplit("/", 1)[-1]: member_name for member_name in _read_index(archive_path)}
+
+
+def find_member_path(archive_paths, filename):
+    """Return the member path of the file of the given name (in any directory) in the archives, None if not found.
+
+    If there are multiple ones, the last one is used, i.e., the same one as if the archives were extracted in order.
+    """
+    if isinstance(archive_paths, (str, os.PathLike)):
+        archive_paths = [archive_paths]
+    found = None
+    for archive_path in archive_paths:
+        member_name = _index_by_basename(str(archive_path)).get(filename)
+        if member_name is not None:
+            found = member_path(archive_path, member_name)
+    return found
+
+
+class _MemberReader(io.RawIOBase):
+    """A member of an archive opened for reading, closing the archive as well when it is closed."""
+
+    def __init__(self, f, closables):
+        self._f = f
+        self._closables = closables
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._f.readinto(b)
+
+    def close(self):
+        if not self.closed:
+            for c in self._closables:
+                c.close()
+        super().close()
+
+
+def open_member(path, wrap=None):
+    """Open the member of the archive for reading in binary mode, streamed from the archive.
+
+    ``wrap``: a function that wraps the member file object, e.g., a decompressor for a compressed member.
+
+    Note: for a compressed tarball, opening a member decompresses the archive from the start to the member.
+    Uncompressed tarballs and zip files (compressed or not) are read from the members directly.
+    """
+    archive_path, member_name = split_member_path(path)
+    info = _read_index(archive_path).get(member_name)
+    if info is None:
+        raise FileNotFoundError(f"No member {member_name} in archive {archive_path}")
+
+    if isinstance(info, zipfile.ZipInfo):
+        archive = zipfile.ZipFile(archive_path)
+        f = archive.open(info)
+    else:
+        # a new handle for each member, so that the members can be read concurrently, e.g., in worker processes
+        archive = tarfile.open(archive_path, "r:*")
+        f = archive.extractfile(info)
+
+    closables = [f, archive]
+    if wrap is not None:
+        f = wrap(f)
+        closables.insert(0, f)
+    return io.BufferedReader(_MemberReader(f, closables), buffer_size=1024 * 1024)
@@ -0,0 +1,176 @@
+"""Build both SPOC and TESS-SPOC master CSVs and SQLite databases concurrently."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from . import download_utils, staged_outputs, tce_html_build
+from . import tess_dv_fast_build, tess_spoc_dv_fast_build
+from . import tess_dv_fast_spec, tess_spoc_dv_fast_spec
+
+# number of concurrent downloads of the shared download pool
+DEFAULT_MAX_DOWNLOAD_WORKERS = 8
+
+
+def _get_source_urls_and_paths():
+    """Return the list of (url, local path) of the sources of both builds."""
+    spoc_urls = (
+        tess_dv_fast_spec.sources_dv_sh_single_sector
+        + tess_dv_fast_spec.sources_dv_sh_multi_sector
+        + tess_dv_fast_spec.sources_tcestats_single_sector
+        + tess_dv_fast_spec.sources_tcestats_multi_sector
+    )
+    tess_spoc_urls = tess_spoc_dv_fast_spec.sources_dv_sh_single_sector + tess_spoc_dv_fast_spec.sources_dv_sh_multi_sector
+    return [
+        (url, f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_build._filename(url)}") for url in spoc_urls
+    ] + [
+        (url, f"{tess_spoc_dv_fast_spec.DATA_BASE_DIR}/{tess_spoc_dv_fast_build._filename(url)}") for url in tess_spoc_urls
+    ]
+
+
+def _build_spoc(minimal_db, num_workers, compression, quantize):
+    # the sources have been downloaded: the downloads in the build use the local files
+    with staged_outputs.deferred() as moves:
+        tess_dv_fast_build.download_all_data(
+            minimal_db=minimal_db,
+            extract_source_urls=False,
+            num_workers=num_workers,
+            compression=compression,
+            quantize=quantize,
+        )
+    return moves
+
+
+def _build_tess_spoc(compression):
+    with staged_outputs.deferred() as moves:
+        tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False, compression=compression)
+    return moves
+
+
+def build_all(
+    minimal_db=True,
+    extract_source_urls=True,
+    num_workers=None,
+    compression=None,
+    max_download_workers=DEFAULT_MAX_DOWNLOAD_WORKERS,
+    quantize=False,
+    prerender_html=False,
+):
+    """Build both SPOC and TESS-SPOC master csvs and dbs concurrently.
+
+    The sources of both are downloaded first with a shared download pool. The two builds
+    are then run concurrently in separate processes. Their outputs (master csvs, dbs and manifest)
+    are put in place only after both succeed, i.e., the existing ones are intact if either fails.
+
+    ``num_workers``: the total number of processes for the builds. The TESS-SPOC build takes one,
+    the rest are used to ingest the SPOC sectors in parallel.
+
+    ``minimal_db`` and ``quantize`` apply to the SPOC db.
+
+    ``prerender_html``: pre-render the html of the TCEs of all TICs for the webapp from the new dbs,
+    with ``num_workers`` processes, see ``tce_html_build``.
+    """
+    if extract_source_urls:
+        tess_dv_fast_spec.extract_and_save_source_urls_to_file()
+        tess_spoc_dv_fast_spec.extract_and_save_source_urls_to_file()
+
+    download_utils.download_files(
+        _get_source_urls_and_paths(),
+        download_dir=tess_dv_fast_spec.DATA_BASE_DIR,  # not used: the paths are absolute
+        max_workers=max_download_workers,
+        progress_func=download_utils.print_download_progress,
+        compression=compression,
+    )
+
+    spoc_num_workers = num_workers - 1 if num_workers is not None and num_workers > 2 else None
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        futures = dict(
+            spoc=executor.submit(_build_spoc, minimal_db, spoc_num_workers, compression, quantize),
+            tess_spoc=executor.submit(_build_tess_spoc, compression),
+        )
+        moves_of_builds, errors = {}, {}
+        for name, future in futures.items():
+            try:
+                moves_of_builds[name] = future.result()
+            except Exception as e:
+                print(f"ERROR {name} build failed: {e!r}")
+                errors[name] = e
+
+    if len(errors) > 0:
+        for moves in moves_of_builds.values():
+            staged_outputs.discard(moves)
+        raise next(iter(errors.values()))
+
+    for moves in moves_of_builds.values():
+        staged_outputs.commit(moves)
+
+    if prerender_html:
+        tce_html_build.build_tce_html_db(num_workers=num_workers)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Update master TESS TCE data of both SPOC and TESS-SPOC concurrently")
+    parser.add_argument(
+        "--update",
+        dest="update",
+        action="store_true",
+        help="Update master csvs and sqlite dbs.",
+    )
+    parser.add_argument(
+        "--full_db",
+        dest="minimal_db",
+        action="store_false",
+        default=True,
+        help="make the full SPOC sqlite db. Default is the minimal db for typical use cases / webapp usage",
+    )
+    parser.add_argument(
+        "--quantize",
+        dest="quantize",
+        action="store_true",
+        default=False,
+        help="store the numeric columns of known precision of the SPOC db as scaled integers, for a smaller db",
+    )
+    parser.add_argument(
+        "--prerender_html",
+        dest="prerender_html",
+        action="store_true",
+        default=False,
+        help="pre-render the html of the TCEs of all TICs for the webapp after the dbs are built",
+    )
+    parser.add_argument(
+        "--num_workers",
+        dest="num_workers",
+        type=int,
+        default=None,
+        help="total number of processes for the builds. Default is one for each build.",
+    )
+    parser.add_argument(
+        "--max_download_workers",
+        dest="max_download_workers",
+        type=int,
+        default=DEFAULT_MAX_DOWNLOAD_WORKERS,
+        help="number of concurrent downloads, shared by both builds",
+    )
+    parser.add_argument(
+        "--compression",
+        dest="compression",
+        choices=["gzip", "zstd", "auto"],
+        default=None,
+        help="store the downloaded csvs / scripts compressed. auto: zstd if package zstandard is installed, else gzip",
+    )
+
+    args = parser.parse_args()
+    if not args.update:
+        print("--update must be specified")
+        parser.print_help()
+        parser.exit()
+
+    print(f"Downloading data to create master csvs and sqlite dbs, minimal_db={args.minimal_db}")
+    build_all(
+        minimal_db=args.minimal_db,
+        num_workers=args.num_workers,
+        compression=args.compression,
+        max_download_workers=args.max_download_workers,
+        quantize=args.quantize,
+        prerender_html=args.prerender_html,
+    )
@@ -0,0 +1,239 @@
+#
+# Per-stage profiling of the builds: wall time, CPU time, rows and peak memory of each stage
+#
+# Usage in a build:
+#
+#     with build_profiler.stage("parse_tcestats_csv", sector=sectors_val) as st:
+#         df = ...
+#         st.set_rows(len(df))
+#
+# Profiling is disabled by default, in which case ``stage()`` returns a shared no-op stage,
+# i.e., the overhead is a function call and a None check per stage.
+#
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import os
+import sys
+import time
+
+# the active profiler, None if profiling is disabled
+_profiler = None
+
+
+def _read_peak_rss():
+    """Return the peak RSS (in bytes) of the process since the start or since the last ``_reset_peak_rss()``,
+    0 if it is not available on the platform, e.g., on Windows.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024  # in kB
+    except OSError:
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of the process to the current RSS (Linux only). Return True if it is supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class _NoOpStage:
+    def set_rows(self, num_rows):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_OP_STAGE = _NoOpStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, sector):
+        self._profiler = profiler
+        self.record = dict(name=name, sector=sector, rows=None)
+        self.peak_rss = 0
+
+    def set_rows(self, num_rows):
+        self.record["rows"] = int(num_rows)
+
+    def __enter__(self):
+        stack = self._profiler._stack
+        if len(stack) > 0:
+            # the peak of the enclosing stage so far, before it is reset for this stage
+            stack[-1].peak_rss = max(stack[-1].peak_rss, _read_peak_rss())
+        if self._profiler.is_peak_rss_per_stage:
+            _reset_peak_rss()
+        stack.append(self)
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_s = time.perf_counter() - self._wall_start
+        cpu_s = time.process_time() - self._cpu_start
+        self.peak_rss = max(self.peak_rss, _read_peak_rss())
+        stack = self._profiler._stack
+        stack.pop()
+        if len(stack) > 0:
+            stack[-1].peak_rss = max(stack[-1].peak_rss, self.peak_rss)
+
+        self.record.update(
+            wall_s=round(wall_s, 6),
+            cpu_s=round(cpu_s, 6),
+            peak_rss_mb=round(self.peak_rss / 2**20, 3),
+            depth=len(stack),
+            pid=os.getpid(),
+        )
+        if exc_type is not None:
+            self.record["error"] = f"{exc_type.__name__}: {exc_value}"
+        self._profiler.records.append(self.record)
+        return False
+
+
+class BuildProfiler:
+    """Record the wall time, CPU time, rows and peak RSS of each stage of a build."""
+
+    def __init__(self, build_name):
+        self.build_name = build_name
+        self.records = []
+        self._stack = []
+        self._started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        # the peak RSS of a stage is the peak during the stage if the peak can be reset (Linux),
+        # otherwise it is the peak of the process up to the end of the stage
+        self.is_peak_rss_per_stage = _reset_peak_rss()
+
+    def stage(self, name, sector=None):
+        return _Stage(self, name, sector)
+
+    def add_records(self, records):
+        """Add the stage records collected elsewhere, e.g., in a worker process."""
+        self.records.extend(records)
+
+    def summary(self):
+        """Return the totals of the stages, grouped by the stage name, in the order first seen."""
+        summary = {}
+        for r in self.records:
+            s = summary.setdefault(r["name"], dict(count=0, wall_s=0.0, cpu_s=0.0, rows=None, peak_rss_mb=0.0))
+            s["count"] += 1
+            s["wall_s"] = round(s["wall_s"] + r["wall_s"], 6)
+            s["cpu_s"] = round(s["cpu_s"] + r["cpu_s"], 6)
+            if r["rows"] is not None:
+                s["rows"] = (s["rows"] or 0) + r["rows"]
+            s["peak_rss_mb"] = max(s["peak_rss_mb"], r["peak_rss_mb"])
+        return summary
+
+    def _get_peak_rss(self):
+        # the peak of the process is the max of the stages, as the peak is reset at the start of each stage
+        peaks = [r["peak_rss_mb"] * 2**20 for r in self.records if r["pid"] == os.getpid()]
+        return max(peaks + [_read_peak_rss()])
+
+    def report(self):
+        return dict(
+            build=self.build_name,
+            started_at=self._started_at,
+            wall_s=round(time.perf_counter() - self._wall_start, 6),
+            cpu_s=round(time.process_time() - self._cpu_start, 6),
+            peak_rss_mb=round(self._get_peak_rss() / 2**20, 3),
+            is_peak_rss_per_stage=self.is_peak_rss_per_stage,
+            summary=self.summary(),
+            stages=self.records,
+        )
+
+    def save_report(self, report_path):
+        with open(f"{report_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(f"{report_path}.tmp", report_path)
+
+    def print_summary(self):
+        print(f"{'stage':<24} {'count':>6} {'wall (s)':>10} {'cpu (s)':>10} {'rows':>10} {'peak RSS (MB)':>14}")
+        for name, s in self.summary().items():
+            rows = s["rows"] if s["rows"] is not None else "-"
+            print(
+                f"{name:<24} {s['count']:>6} {s['wall_s']:>10.2f} {s['cpu_s']:>10.2f} {rows:>10} {s['peak_rss_mb']:>14.1f}"
+            )
+
+
+def enable(build_name):
+    """Enable profiling of the stages, returning the profiler."""
+    global _profiler
+    _profiler = BuildProfiler(build_name)
+    return _profiler
+
+
+def disable():
+    """Disable profiling, returning the profiler that was active, if any."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def is_enabled():
+    return _profiler is not None
+
+
+def stage(name, sector=None):
+    """Return a context manager measuring the given stage, or a no-op one if profiling is disabled."""
+    if _profiler is None:
+        return _NO_OP_STAGE
+    return _profiler.stage(name, sector)
+
+
+def add_records(records):
+    if _profiler is not None:
+        _profiler.add_records(records)
+
+
+def call_profiled(enabled, func, *args, **kwargs):
+    """Call ``func`` (typically in a worker process), profiled if ``enabled``.
+
+    Returns the result and the stage records, to be added to the profiler of the parent
+    process with ``add_records()``.
+    """
+    global _profiler
+    if not enabled:
+        return func(*args, **kwargs), []
+    profiler_orig = _profiler
+    profiler = enable("worker")
+    try:
+        return func(*args, **kwargs), profiler.records
+    finally:
+        _profiler = profiler_orig
+
+
+@contextmanager
+def profiling(build_name, report_path, enabled=True):
+    """Profile the stages of the build in the block, writing the JSON report to ``report_path`` at the end,
+    even if the build fails.
+    """
+    if not enabled:
+        yield None
+        return
+    profiler = enable(build_name)
+    try:
+        yield profiler
+    finally:
+        disable()
+        profiler.save_report(report_path)
+        profiler.print_summary()
+        print(f"Build profile saved to: {report_path}")
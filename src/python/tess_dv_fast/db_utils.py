@@ -0,0 +1,270 @@
+#
+# SQLite utilities for bulk loading dataframes into a new database, and the shared schema of the tcestats dbs
+#
+
+from contextlib import closing
+import copy
+from datetime import datetime, timezone
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import uuid
+
+import pandas as pd
+
+# The pragmas for loading data to a database being built from scratch (in a temporary file).
+# Durability during the load is not needed: if the build fails, the partial database is discarded anyway.
+BULK_LOAD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -256 * 1024,  # negative: in KiB, i.e., 256MiB
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
+# A tcestats row with 100+ columns is over 1Kb. Larger pages than the default 4096
+# make a row fit in a page with less wasted space, resulting in a smaller file.
+DEFAULT_PAGE_SIZE = 8192
+
+# number of rows per executemany() call, to bound the memory of the rows converted to python objects
+DEFAULT_BATCH_SIZE = 20000
+
+
+def connect_for_bulk_load(db_path, page_size=DEFAULT_PAGE_SIZE):
+    """Connect to a (new) database with the pragmas for bulk loading."""
+    con = sqlite3.connect(db_path)
+    cursor = con.cursor()
+    # page_size is in effect only if it is set before the database is created,
+    # or by a subsequent VACUUM for an existing database
+    cursor.execute(f"pragma page_size = {int(page_size)};")
+    for name, value in BULK_LOAD_PRAGMAS.items():
+        cursor.execute(f"pragma {name} = {value};")
+    cursor.close()
+    return con
+
+
+def create_table(con, table_name, df, primary_key=None):
+    """Create the table for the given dataframe, with the same column types as ``df.to_sql()`` would use.
+
+    If ``primary_key`` columns are specified, the table is a clustered ``WITHOUT ROWID`` table,
+    i.e., the rows are stored in the order of the primary key.
+    """
+    sql = pd.io.sql.get_schema(df, table_name, keys=primary_key, con=con)
+    if primary_key is not None:
+        sql += " WITHOUT ROWID"
+    cursor = con.cursor()
+    cursor.execute(sql)
+    cursor.close()
+
+
+def _to_rows(df):
+    # missing values (NaN, None, pd.NA, etc.) are converted to None, i.e., NULL,
+    # and the rest to python objects, the same as ``to_sql()``
+    cols = [df[col].to_numpy(dtype=object, na_value=None) for col in df.columns]
+    return zip(*cols)
+
+
+def insert_df(con, table_name, df, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert the rows of the dataframe to the existing table, with batched ``executemany()``."""
+    col_names = ", ".join(f'"{col}"' for col in df.columns)
+    placeholders = ", ".join(["?"] * len(df.columns))
+    sql = f'insert into "{table_name}" ({col_names}) values ({placeholders});'
+    cursor = con.cursor()
+    try:
+        for start in range(0, len(df), batch_size):
+            cursor.executemany(sql, _to_rows(df.iloc[start : start + batch_size]))
+    finally:
+        cursor.close()
+
+
+def finalize_db(con):
+    """Commit the loaded data, update the statistics for the query planner, and compact the database."""
+    con.commit()
+    cursor = con.cursor()
+    cursor.execute("analyze;")
+    con.commit()
+    # VACUUM cannot be run within a transaction
+    cursor.execute("vacuum;")
+    cursor.close()
+
+
+#
+# Sectors dimension table: the sectors of the TCEs, e.g., s0014-s0086, are stored in the tcestats tables
+# as a small integer ``sectors_id`` referencing the table, rather than the text in every row.
+# A view of the tcestats table, named as the table was, resolves the ids back to the text,
+# so that the queries (and the clients such as the Go webapp) are unchanged.
+#
+
+SECTORS_TABLE = "sectors"
+
+
+def to_sectors_id(sectors):
+    """Convert the sectors values, e.g., ``s0014-s0086``, to the ids in the sectors table, e.g., ``140086``.
+
+    The id is derived from the value itself (``start * 10000 + end``), so that the ids are the same
+    across the chunks, partial builds and incremental updates of a db, without a lookup.
+    """
+    sectors = pd.Series(sectors)
+    start = sectors.str.slice(1, 5).astype("int64")
+    end = sectors.str.slice(7, 11).astype("int64")
+    return start * 10000 + end
+
+
+def create_sectors_table(con, table_name):
+    """(Re-)create the sectors table with the sectors referenced by the given tcestats table."""
+    cursor = con.cursor()
+    cursor.execute(f'drop table if exists "{SECTORS_TABLE}";')
+    cursor.execute(
+        f"""create table "{SECTORS_TABLE}" (
+            id INTEGER PRIMARY KEY,
+            sectors TEXT NOT NULL,
+            sector_start INTEGER NOT NULL,
+            sector_end INTEGER NOT NULL,
+            span INTEGER NOT NULL,
+            is_multi INTEGER NOT NULL
+        );"""
+    )
+    cursor.execute(
+        f"""insert into "{SECTORS_TABLE}"
+        select id, printf('s%04d-s%04d', id / 10000, id % 10000), id / 10000, id % 10000,
+            id % 10000 - id / 10000 + 1, id / 10000 != id % 10000
+        from (select distinct sectors_id as id from "{table_name}") order by id;"""
+    )
+    cursor.close()
+
+
+def create_view_with_sectors(
+    con, view_name, table_name, extra_columns=None, quantized_columns=None, details_table=None, key_columns=None
+):
+    """Create the view of the tcestats table, with column ``sectors`` (the text) in place of ``sectors_id``,
+    followed by the ``extra_columns``, a list of ``(name, sql expression)``, and ``sectors_span``.
+
+    ``quantized_columns``: ``{name: decimals}`` of the columns stored as scaled integers, see ``quantize()``.
+    They are decoded back to REAL in the view.
+
+    ``details_table``: if specified, the table of the other columns of the rows, with the same ``key_columns``.
+    It is joined by the key, with its columns following the ones of the table.
+    """
+    quantized_columns = quantized_columns or {}
+
+    def select_of(c, alias):
+        if c == "sectors_id":
+            return "s.sectors AS sectors"
+        elif c in quantized_columns:
+            decoded = sql_dequantize(f'{alias}."{c}"', quantized_columns[c])
+            return f'{decoded} AS "{c}"'
+        return f'{alias}."{c}"'
+
+    col_names = [row[1] for row in con.execute(f'pragma table_info("{table_name}");')]
+    select_list = [select_of(c, "t") for c in col_names]
+    from_clause = f'"{table_name}" t join "{SECTORS_TABLE}" s on s.id = t.sectors_id'
+    if details_table is not None:
+        details_col_names = [row[1] for row in con.execute(f'pragma table_info("{details_table}");')]
+        select_list += [select_of(c, "d") for c in details_col_names if c not in key_columns]
+        # with USING, the key columns can be referred to unqualified, e.g., in the extra columns
+        from_clause += f' join "{details_table}" d using ({", ".join(key_columns)})'
+    select_list += [f'{expr} AS "{name}"' for name, expr in (extra_columns or [])]
+    select_list.append("s.span AS sectors_span")
+    cursor = con.cursor()
+    cursor.execute(f'drop view if exists "{view_name}";')
+    cursor.execute(f'create view "{view_name}" as select {", ".join(select_list)} from {from_clause};')
+    cursor.close()
+
+
+#
+# Quantized storage: the values of a REAL column with a known precision, e.g., the epoch with 2 decimals,
+# are stored as integers scaled by 10**decimals. SQLite stores an integer in 1 - 8 bytes depending on
+# its magnitude, e.g., 3 bytes for an epoch of 1454.05 (145405), vs 8 bytes for any REAL.
+# The values are decoded back to REAL in the view of the table, so that the queries are unchanged.
+#
+
+
+def quantize(values, decimals):
+    """Round the values to the given number of decimals, scaled to integers (nullable ``Int64``)."""
+    return (pd.Series(values).astype("float64") * 10**decimals).round().astype("Int64")
+
+
+def sql_dequantize(sql_expr, decimals):
+    """Return the sql expression decoding the quantized values of ``sql_expr`` back to REAL.
+
+    The division of the integer by the (exact) power of 10 is correctly rounded, i.e., the decoded value
+    is the same as the one of the value rounded to the given number of decimals.
+    """
+    return f"({sql_expr} / {10**decimals}.0)"
+
+
+#
+# Metadata of a db, e.g., the schema version and the id of the build, in a key / value table,
+# with the values encoded as json. It is written at the end of a build, and read by the query modules
+# to tell the dbs (and the builds of a db) apart without probing the data.
+#
+
+METADATA_TABLE = "db_metadata"
+
+# the versions of the schemas of the dbs (by the kind of db), in the metadata of the dbs.
+# To be bumped for incompatible changes of the schema of the db
+SCHEMA_VERSIONS = {
+    "spoc": 1,
+    "tess_spoc": 1,
+    "tce_html": 1,
+}
+
+
+def new_build_metadata(db_kind, con=None, table_name=None, sources=None, **kwargs):
+    """Return the metadata of a new build of the db of the given kind (a key of ``SCHEMA_VERSIONS``),
+    with its schema version, a new unique build id, the build time and the given ``kwargs``.
+
+    If ``table_name`` of the tcestats table is given, the number of rows of each sectors in the table (with ``con``).
+    If ``sources`` (a list of URLs / filenames) is given, the hash of the sources.
+    """
+    metadata = dict(
+        schema_version=SCHEMA_VERSIONS[db_kind],
+        build_id=uuid.uuid4().hex,
+        build_time=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **kwargs,
+    )
+    if table_name is not None:
+        metadata["num_rows_of_sectors"] = dict(
+            con.execute(
+                f'select s.sectors, count(*) from "{table_name}" t join "{SECTORS_TABLE}" s on s.id = t.sectors_id '
+                "group by s.sectors order by s.sectors;"
+            ).fetchall()
+        )
+    if sources is not None:
+        metadata["sources_hash"] = hashlib.sha256("\n".join(sources).encode("utf-8")).hexdigest()
+    return metadata
+
+
+def save_metadata(con, metadata):
+    """(Re-)create the metadata table with the given ``{key: value}``."""
+    cursor = con.cursor()
+    cursor.execute(f'drop table if exists "{METADATA_TABLE}";')
+    cursor.execute(f'create table "{METADATA_TABLE}" (key TEXT PRIMARY KEY, value TEXT NOT NULL);')
+    cursor.executemany(
+        f'insert into "{METADATA_TABLE}" (key, value) values (?, ?);',
+        [(k, json.dumps(v)) for k, v in metadata.items()],
+    )
+    cursor.close()
+
+
+@functools.lru_cache(maxsize=16)
+def _read_metadata_of_file(db_path, file_stat_key):
+    # file_stat_key: only for caching, so that the metadata is re-read once the db file is replaced
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as con:
+        (has_table,) = con.execute("select count(*) from sqlite_master where name = ?;", (METADATA_TABLE,)).fetchone()
+        if not has_table:
+            return None
+        return {k: json.loads(v) for k, v in con.execute(f'select key, value from "{METADATA_TABLE}";')}
+
+
+def read_metadata(db_path):
+    """Return the metadata of the db, None for a db with no metadata, e.g., from an older build.
+
+    It is cached by the identity of the db file (inode, size, modification time), i.e., the db
+    is queried only when it is replaced, e.g., by a new build.
+    """
+    stat = os.stat(db_path)
+    metadata = _read_metadata_of_file(str(db_path), (stat.st_ino, stat.st_size, stat.st_mtime_ns))
+    return copy.deepcopy(metadata)
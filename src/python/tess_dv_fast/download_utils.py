@@ -2,14 +2,36 @@
 # Generic file download utilities that support file-based cache
 #
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import gzip
+import json
 import os
 import re
 import shutil
 import time
 import warnings
+from pathlib import Path
 from types import SimpleNamespace
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+
+from . import archive_utils
+
+try:
+    import zstandard
+
+    _HAS_ZSTANDARD = True
+except Exception:
+    _HAS_ZSTANDARD = False
+
+# default number of concurrent transfers in download_files()
+DEFAULT_MAX_WORKERS = 4
+
+# the file extensions of the supported compressions of the downloaded files.
+# The compressed files can be read with open_file(), decompressed transparently.
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
 
 
 def _policy_always_use(url, filename):
@@ -41,40 +63,324 @@ def _create_policy_ttl_in_days(ttl_in_days):
     return _create_policy_ttl_in_seconds(ttl_in_days * 86400)
 
 
+def _policy_revalidate(url, filename):
+    # A marker policy: the local file is revalidated with the server by download_file(),
+    # with a conditional request using the ETag / Last-Modified saved with the file.
+    # The local file is used if the server responds 304 Not Modified.
+    return False
+
+
 CachePolicy = SimpleNamespace(
     ALWAYS_USE=_policy_always_use,
     ALWAYS_REJECT=_policy_always_reject,
     TTL_IN_SECONDS=_create_policy_ttl_in_seconds,
     TTL_IN_DAYS=_create_policy_ttl_in_days,
+    REVALIDATE=_policy_revalidate,
 )
 
 
-def _create_local_filename(url, filename, download_dir):
+def _validators_filename(local_filename):
+    # the sidecar file storing the HTTP validators (ETag / Last-Modified) of a downloaded file
+    return f"{local_filename}.validators.json"
+
+
+def _read_validators(local_filename):
+    try:
+        with open(_validators_filename(local_filename), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_validators(local_filename, response):
+    validators = dict(
+        url=response.url,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+    if validators["etag"] is None and validators["last_modified"] is None:
+        # the server does not support conditional requests for the file
+        Path(_validators_filename(local_filename)).unlink(missing_ok=True)
+        return
+    with open(_validators_filename(local_filename), "w") as f:
+        json.dump(validators, f)
+
+
+def _create_local_filename(url, filename, download_dir, compression=None):
     if filename is not None:
         local_filename = filename
     else:
         local_filename = url.split("/")[-1]
         local_filename = re.sub(r"\?.*$", "", local_filename)
 
+    if compression is not None:
+        local_filename += COMPRESSION_EXTENSIONS[compression]
     return os.path.join(download_dir, local_filename)
 
 
-def _do_download_file(url, filename=None, download_dir=None):
+def resolve_compression(compression):
+    """Resolve ``"auto"`` to the best compression available: zstd if package ``zstandard`` is installed, else gzip."""
+    if compression == "auto":
+        return "zstd" if _HAS_ZSTANDARD else "gzip"
+    if compression not in (None, *COMPRESSION_EXTENSIONS.keys()):
+        raise ValueError(f"Unsupported compression: {compression}")
+    if compression == "zstd":
+        _check_zstandard()
+    return compression
+
+
+def _check_zstandard(filename=None):
+    if not _HAS_ZSTANDARD:
+        of_file = f" of {filename}" if filename is not None else ""
+        raise ImportError(
+            f"zstd compression{of_file} requires package zstandard. "
+            'Install it with the extra zstd, e.g., pip install tess-dv-fast"[zstd]"'
+        )
+
+
+def _compression_of(filename):
+    for compression, ext in COMPRESSION_EXTENSIONS.items():
+        if filename.endswith(ext):
+            return compression
+    return None
+
+
+def resolve_local_filename(filename, source_archive=None):
+    """Return the path of the local file, or its compressed variant, e.g., ``<filename>.gz``, whichever exists.
+
+    If ``source_archive`` (the path or a list of paths of tarballs / zip files) is specified,
+    the file of the same name in the archives, if any, is used instead, returned as a member path.
+
+    If none exists, ``filename`` is returned as is.
+    """
+    if source_archive is not None:
+        basename = os.path.basename(filename)
+        for ext in ["", *COMPRESSION_EXTENSIONS.values()]:
+            path = archive_utils.find_member_path(source_archive, f"{basename}{ext}")
+            if path is not None:
+                return path
+    for ext in ["", *COMPRESSION_EXTENSIONS.values()]:
+        if os.path.isfile(f"{filename}{ext}"):
+            return f"{filename}{ext}"
+    return filename
+
+
+def open_file(filename):
+    """Open the local file, which could be compressed, for reading in binary mode.
+
+    The compressed files, e.g., the ones downloaded with ``compression``, are decompressed
+    transparently as they are read, without inflating them to disk.
+
+    ``filename`` can also be a member of an archive, see ``archive_utils.member_path()``.
+    It is streamed from the archive, without being extracted to disk.
+    """
+    compression = _compression_of(filename)
+    if archive_utils.is_member_path(filename):
+        if compression == "gzip":
+            return archive_utils.open_member(filename, wrap=lambda f: gzip.GzipFile(fileobj=f, mode="rb"))
+        elif compression == "zstd":
+            _check_zstandard(filename)
+            return archive_utils.open_member(
+                filename, wrap=lambda f: zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            )
+        else:
+            return archive_utils.open_member(filename)
+    elif compression == "gzip":
+        return gzip.open(filename, "rb")
+    elif compression == "zstd":
+        _check_zstandard(filename)
+        # read_across_frames: a resumed download consists of multiple frames
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), read_across_frames=True, closefd=True)
+    else:
+        return open(filename, "rb")
+
+
+def _open_compressed_writer(out_file, compression):
+    # A resumed download is appended to the partial file as a new gzip member / zstd frame,
+    # which are decompressed as one file.
+    if compression == "gzip":
+        # mtime=0: the same content results in the same compressed bytes
+        return gzip.GzipFile(fileobj=out_file, mode="wb", mtime=0)
+    elif compression == "zstd":
+        return zstandard.ZstdCompressor().stream_writer(out_file, closefd=False)
+    else:
+        raise ValueError(f"Unsupported compression: {compression}")
+
+
+def _remove_other_variants(local_filename):
+    # e.g., the uncompressed file from an earlier download, so that resolve_local_filename() is unambiguous
+    base_filename = local_filename
+    compression = _compression_of(local_filename)
+    if compression is not None:
+        base_filename = local_filename[: -len(COMPRESSION_EXTENSIONS[compression])]
+    for ext in ["", *COMPRESSION_EXTENSIONS.values()]:
+        filename = f"{base_filename}{ext}"
+        if filename != local_filename:
+            Path(filename).unlink(missing_ok=True)
+            Path(_validators_filename(filename)).unlink(missing_ok=True)
+
+
+def create_session(pool_maxsize=DEFAULT_MAX_WORKERS):
+    """Create a requests session that keeps up to ``pool_maxsize`` connections per host for reuse."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _is_retryable_error(e):
+    if isinstance(e, requests.HTTPError):
+        # server side / throttling errors are typically transient,
+        # while the client side ones (e.g., 404) are not.
+        status_code = e.response.status_code if e.response is not None else None
+        return status_code is not None and (status_code >= 500 or status_code == 429)
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+def _get_resume_offset(local_filename_temp, validators):
+    # the number of bytes of the file received so far
+    if _compression_of(local_filename_temp[: -len(".download")]) is None:
+        return os.path.getsize(local_filename_temp)
+    else:
+        # for a compressed partial file, the number is saved when the download is interrupted,
+        # after the partial file is properly closed, i.e., with the compressed stream finalized.
+        return validators.get("num_bytes", 0)
+
+
+def _get_resume_headers(local_filename_temp):
+    """Return the headers to resume the partially downloaded temporary file, or `None` if it cannot be resumed."""
+    validators = _read_validators(local_filename_temp)
+    if not os.path.isfile(local_filename_temp) or validators is None:
+        return None
+    offset = _get_resume_offset(local_filename_temp, validators)
+    if offset == 0:
+        return None
+    # If-Range: the server sends the remaining bytes only if the file is unchanged,
+    # otherwise, the whole (new) file. A weak ETag cannot be used for If-Range.
+    etag = validators.get("etag")
+    if_range = etag if etag is not None and not etag.startswith("W/") else validators.get("last_modified")
+    if if_range is None:
+        return None
+    return {"Range": f"bytes={offset}-", "If-Range": if_range}
+
+
+def _is_content_range_resumable(response, resume_headers):
+    # the range sent must start from the end of the partial file, e.g., "bytes 1000-1999/2000"
+    offset = resume_headers["Range"][len("bytes=") : -len("-")]
+    return response.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+
+
+def _remove_partial_file(local_filename_temp):
+    Path(local_filename_temp).unlink(missing_ok=True)
+    Path(_validators_filename(local_filename_temp)).unlink(missing_ok=True)
+
+
+def _update_num_bytes_received(local_filename_temp, num_bytes):
+    validators = _read_validators(local_filename_temp)
+    if validators is None:
+        return
+    if num_bytes is None:
+        validators.pop("num_bytes", None)
+    else:
+        validators["num_bytes"] = num_bytes
+    with open(_validators_filename(local_filename_temp), "w") as f:
+        json.dump(validators, f)
+
+
+def _do_download_file_once(url, local_filename, session, validators=None):
+    """Download the file. Return `False` if it is not modified according to the given `validators`."""
+    http_get = session.get if session is not None else requests.get
+    # write to a temporary file. If successful, make it the real local file
+    # it is to prevent interrupted download leaving a partial file.
+    # A partial temporary file from an interrupted download is resumed if possible.
+    local_filename_temp = f"{local_filename}.download"
+    compression = _compression_of(local_filename)
+
+    headers = {}
+    if validators is not None:
+        if validators.get("etag") is not None:
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified") is not None:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    resume_headers = _get_resume_headers(local_filename_temp)
+    if resume_headers is not None:
+        headers.update(resume_headers)
+
+    with http_get(url, stream=True, headers=headers) as response:
+        if response.status_code == 304:
+            return False
+        if resume_headers is not None and (
+            response.status_code == 416
+            or (response.status_code == 206 and not _is_content_range_resumable(response, resume_headers))
+        ):
+            # the partial file is not valid, e.g., larger than the file on the server. Start over.
+            _remove_partial_file(local_filename_temp)
+            return _do_download_file_once(url, local_filename, session, validators=validators)
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            mode = "ab"
+            num_bytes = _get_resume_offset(local_filename_temp, _read_validators(local_filename_temp))
+        else:
+            # the entire file is sent, the server does not support / accept the range
+            mode = "wb"
+            num_bytes = 0
+            _save_validators(local_filename_temp, response)
+        # the count saved is only valid if the download is interrupted cleanly, see below.
+        _update_num_bytes_received(local_filename_temp, None)
+        try:
+            with open(local_filename_temp, mode) as out_file:
+                out = _open_compressed_writer(out_file, compression) if compression is not None else out_file
+                with out:
+                    for block in iter(lambda: response.raw.read(1024 * 1024), b""):
+                        out.write(block)
+                        num_bytes += len(block)
+        except Urllib3HTTPError as e:
+            # e.g., the connection is dropped in the middle of the transfer.
+            # The partial temporary file is kept for the retries to resume.
+            _update_num_bytes_received(local_filename_temp, num_bytes)
+            raise requests.ConnectionError(e, response=response) from e
+
+    os.replace(local_filename_temp, local_filename)
+    if os.path.isfile(_validators_filename(local_filename_temp)):
+        _update_num_bytes_received(local_filename_temp, None)
+        os.replace(_validators_filename(local_filename_temp), _validators_filename(local_filename))
+    else:
+        Path(_validators_filename(local_filename)).unlink(missing_ok=True)
+    _remove_other_variants(local_filename)
+    return True
+
+
+def _do_download_file(
+    url,
+    filename=None,
+    download_dir=None,
+    session=None,
+    max_retries=0,
+    backoff_factor=1.0,
+    validators=None,
+    compression=None,
+):
+    """Download the file. Return `False` if it is not modified according to the given `validators`."""
     if download_dir is None:
         download_dir = ""
     os.makedirs(download_dir, exist_ok=True)
 
-    local_filename = _create_local_filename(url, filename, download_dir)
+    local_filename = _create_local_filename(url, filename, download_dir, compression)
 
-    with requests.get(url, stream=True) as response:
-        response.raise_for_status()
-        # write to a temporary file. If successful, make it the real local file
-        # it is to prevent interrupted download leaving a partial file
-        local_filename_temp = f"{local_filename}.download"
-        with open(local_filename_temp, "wb") as out_file:
-            shutil.copyfileobj(response.raw, out_file)
-        os.replace(local_filename_temp, local_filename)
-    return local_filename
+    for attempt in range(max_retries + 1):
+        try:
+            return _do_download_file_once(url, local_filename, session, validators=validators)
+        except requests.RequestException as e:
+            if attempt >= max_retries or not _is_retryable_error(e):
+                raise
+            # exponential backoff, e.g., 1s, 2s, 4s, ...
+            wait_in_seconds = backoff_factor * (2**attempt)
+            warnings.warn(
+                f"Failed to download {url} (attempt {attempt + 1}). Retry in {wait_in_seconds}s. Error: {e}"
+            )
+            time.sleep(wait_in_seconds)
 
 
 def download_file(
@@ -83,20 +389,134 @@ def download_file(
     download_dir=None,
     cache_policy_func=None,
     return_is_cache_used=False,
+    session=None,
+    max_retries=0,
+    backoff_factor=1.0,
+    compression=None,
 ):
+    """Download the file to ``download_dir``, unless the local file can be used per ``cache_policy_func``.
+
+    If ``compression`` (``"gzip"``, ``"zstd"``, or ``"auto"``) is specified, the file is stored compressed,
+    with the corresponding extension, e.g., ``.gz``, appended to the local filename.
+    Use ``open_file()`` to read it.
+    """
     if download_dir is None:
         download_dir = ""
 
+    compression = resolve_compression(compression)
     is_cache_used = False
-    local_filename = _create_local_filename(url, filename, download_dir)
+    validators = None
+    local_filename = _create_local_filename(url, filename, download_dir, compression)
     if os.path.isfile(local_filename):
-        if cache_policy_func is None or cache_policy_func(url, local_filename):
+        if cache_policy_func is CachePolicy.REVALIDATE:
+            # if there are no validators saved, the file is downloaded unconditionally
+            validators = _read_validators(local_filename)
+        elif cache_policy_func is None or cache_policy_func(url, local_filename):
             is_cache_used = True
 
     if not is_cache_used:
-        _do_download_file(url, filename, download_dir)
+        is_downloaded = _do_download_file(
+            url,
+            filename,
+            download_dir,
+            session=session,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            validators=validators,
+            compression=compression,
+        )
+        # case not modified since the last download
+        is_cache_used = not is_downloaded
 
     if return_is_cache_used:
         return local_filename, is_cache_used
     else:
         return local_filename
+
+
+def print_download_progress(url, local_filename, is_cache_used, num_done, num_total):
+    """The ``progress_func`` of ``download_files()`` in the builds: print the downloaded files, not the cached ones."""
+    if not is_cache_used:
+        print(f"DEBUG Downloaded ({num_done}/{num_total}) to {local_filename} from: {url}")
+
+
+def download_files(
+    url_filename_list,
+    download_dir=None,
+    cache_policy_func=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    max_retries=3,
+    backoff_factor=1.0,
+    session=None,
+    progress_func=None,
+    compression=None,
+):
+    """Download a list of files concurrently, reusing the connections.
+
+    Parameters
+    ----------
+    url_filename_list : list of (url, filename) pairs
+        ``filename`` can be ``None``, in which case it is derived from the url.
+    cache_policy_func : callable
+        One of ``CachePolicy``. If not specified, the existing local files are used.
+        With ``CachePolicy.REVALIDATE``, the existing local files are revalidated with conditional requests.
+    max_workers : int
+        The maximum number of concurrent transfers.
+    max_retries, backoff_factor :
+        Transient errors (connection errors, HTTP 5xx / 429) are retried up to ``max_retries`` times,
+        waiting ``backoff_factor * 2 ** attempt`` seconds before each retry.
+        A retry resumes the partially downloaded file with a range request if the server supports it.
+    session : requests.Session
+        The session to use. If not specified, a session with a connection pool for
+        ``max_workers`` connections is used.
+    progress_func : callable
+        If specified, it is called as each file is done (in the order of completion) with
+        ``(url, local_filename, is_cache_used, num_done, num_total)``.
+    compression : str
+        If specified, the files are stored compressed. See ``download_file()``.
+
+    Returns
+    -------
+    list of (local_filename, is_cache_used) pairs, in the same order as ``url_filename_list``.
+    """
+    url_filename_list = list(url_filename_list)
+    num_total = len(url_filename_list)
+    num_done = 0
+    close_session = False
+    if session is None:
+        session = create_session(pool_maxsize=max_workers)
+        close_session = True
+
+    def do_download(url_filename):
+        url, filename = url_filename
+        return download_file(
+            url,
+            filename=filename,
+            download_dir=download_dir,
+            cache_policy_func=cache_policy_func,
+            return_is_cache_used=True,
+            session=session,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            compression=compression,
+        )
+
+    results = [None] * num_total
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_idx = {
+                executor.submit(do_download, url_filename): i
+                for i, url_filename in enumerate(url_filename_list)
+            }
+            for future in as_completed(future_to_idx):
+                idx = future_to_idx[future]
+                local_filename, is_cache_used = future.result()
+                results[idx] = (local_filename, is_cache_used)
+                num_done += 1
+                if progress_func is not None:
+                    url = url_filename_list[idx][0]
+                    progress_func(url, local_filename, is_cache_used, num_done, num_total)
+    finally:
+        if close_session:
+            session.close()
+    return results
@@ -0,0 +1,57 @@
+#
+# Putting the outputs of a build (master csv, db, manifest) in place, optionally deferred,
+# so that the outputs of multiple builds can be put in place together, only after all of them succeed.
+#
+# A build writes an output to a temporary file, then calls ``move_into_place(tmp, dest)``.
+# In a ``deferred()`` block, the move is recorded instead, and the temporary file is the current
+# version of the output for the rest of the build, see ``current_path()``.
+#
+
+from contextlib import contextmanager
+from pathlib import Path
+import shutil
+
+# the moves deferred in the current deferred() block, None if not deferred
+_deferred_moves = None
+
+
+def move_into_place(src, dest):
+    """Move the (temporary) file ``src`` to ``dest``, overwriting it, unless it is deferred."""
+    if _deferred_moves is None:
+        shutil.move(src, dest)
+    else:
+        _deferred_moves.append((str(src), str(dest)))
+
+
+def current_path(dest):
+    """Return the path of the current version of ``dest``, i.e., the temporary file if its move is deferred."""
+    if _deferred_moves is not None:
+        for src, dest_deferred in reversed(_deferred_moves):
+            if dest_deferred == str(dest):
+                return src
+    return dest
+
+
+@contextmanager
+def deferred():
+    """Defer the moves in the block, yielding the list of the deferred moves,
+    to be done with ``commit()``, or undone with ``discard()``.
+    """
+    global _deferred_moves
+    moves_orig, _deferred_moves = _deferred_moves, []
+    try:
+        yield _deferred_moves
+    finally:
+        _deferred_moves = moves_orig
+
+
+def commit(moves):
+    """Do the deferred moves, in the order they were made."""
+    for src, dest in moves:
+        shutil.move(src, dest)
+
+
+def discard(moves):
+    """Remove the temporary files of the deferred moves, leaving the existing outputs intact."""
+    for src, _ in moves:
+        Path(src).unlink(missing_ok=True)
@@ -0,0 +1,154 @@
+"""
+Render the HTML fragments of the SPOC and TESS-SPOC TCEs of a TIC for the webapp, and read the pre-rendered
+fragments of a TIC from the db built by ``tce_html_build`` (a compressed blob per TIC, keyed by ticid).
+
+The fragments are deterministic for given SPOC and TESS-SPOC dbs. With the pre-rendered db,
+a webapp request is a single indexed read instead of the db queries and the rendering.
+The pre-rendered db records the build ids of the dbs it is rendered from, so that the fragments
+are not used once either db is replaced by a new build.
+"""
+
+from collections import namedtuple
+from contextlib import closing
+import os
+import re
+import sqlite3
+import zlib
+
+from . import db_utils
+from . import tess_dv_fast  # standard SPOC TCEs
+from . import tess_spoc_dv_fast  # HLSP TESS-SPOC TCEs
+from .tess_dv_fast_spec import DATA_BASE_DIR, TCE_HTML_DBNAME
+
+SPOC_SORTABLE_COLUMNS = [0, 4, 5, 6, 7, 8, 9, 10, 11]
+SPOC_TABLE_ID = "table_spoc"
+TESS_SPOC_TABLE_ID = "table_tess_spoc"
+
+# the rendered fragments of the TCEs of a TIC
+TceHtml = namedtuple("TceHtml", ["num_spoc_tces", "num_tess_spoc_tces", "spoc_html", "tess_spoc_html"])
+
+_DB_TABLE = "tce_html"
+
+
+def apply_table_styling(content: str, table_id: str, sortable_cols: list = None) -> str:
+    """Apply standard table styling and sorting to rendered content.
+
+    Args:
+        content: HTML content from display_tce_infos()
+        table_id: ID to assign to the table
+        sortable_cols: List of column indices to make sortable
+
+    Returns:
+        Styled HTML content
+    """
+    # custom id for the table for javascript functions
+    # - the ids of the cells are prefixed by the (random) id of the table from pandas Styler too,
+    #   replace them as well so that the content is deterministic
+    match = re.search('<table id="([^"]+)"', content)
+    if match is not None:
+        content = content.replace(f'id="{match[1]}', f'id="{table_id}')
+
+    if sortable_cols:
+        # make table searchable / sortable by https://github.com/javve/list.js
+        content = content.replace("<tbody", '<tbody class="list"')
+        for i in sortable_cols:
+            content = content.replace(
+                f'class="col_heading level0 col{i}"',
+                f'class="col_heading level0 col{i} sort" data-sort="col{i}"',
+            )
+
+    return content
+
+
+def render_spoc_content(df_spoc):
+    """Render SPOC TCE content as HTML.
+
+    Returns:
+        HTML content string
+    """
+    spoc_content = tess_dv_fast.display_tce_infos(df_spoc, return_as="html", no_tce_html="No SPOC TCE")
+    spoc_content = apply_table_styling(spoc_content, SPOC_TABLE_ID, SPOC_SORTABLE_COLUMNS)
+    return spoc_content
+
+
+def render_tess_spoc_content(df_tess_spoc):
+    """Render TESS-SPOC TCE content as HTML.
+
+    Returns:
+        HTML content with TESS-SPOC table and duplicate-hiding controls
+    """
+    if len(df_tess_spoc) < 1:
+        # no TESS-SPOC: render nothing
+        return ""
+
+    # case have TESS-SPOC content
+    tess_spoc_content = tess_spoc_dv_fast.display_tce_infos(df_tess_spoc, return_as="html")
+    tess_spoc_content = apply_table_styling(tess_spoc_content, TESS_SPOC_TABLE_ID)
+
+    tess_spoc_content = f"""
+<hr>
+<h2>TESS-SPOC TCEs</h2>
+<div id="tessSpocDupCtr">
+  <span id="tessSpocDupMsg"></span>
+  <button id="hideShowInSpocCtl" onclick="document.body.classList.toggle('show_in_spoc');"></button>
+</div>
+{tess_spoc_content}
+"""
+    return tess_spoc_content
+
+
+def render_tce_html(df_spoc, df_tess_spoc):
+    """Render the fragments of the given SPOC and TESS-SPOC TCEs (of a TIC), returning a ``TceHtml``."""
+    return TceHtml(
+        num_spoc_tces=len(df_spoc),
+        num_tess_spoc_tces=len(df_tess_spoc),
+        spoc_html=render_spoc_content(df_spoc),
+        tess_spoc_html=render_tess_spoc_content(df_tess_spoc),
+    )
+
+
+#
+# The pre-rendered fragments db
+#
+
+
+def _db_path():
+    return f"{DATA_BASE_DIR}/{TCE_HTML_DBNAME}"
+
+
+def _get_source_build_ids():
+    """Return the build ids of the SPOC and TESS-SPOC dbs, the ones the fragments are rendered from."""
+    return {
+        name: (metadata or {}).get("build_id")
+        for name, metadata in [
+            ("spoc", tess_dv_fast.get_db_metadata()),
+            ("tess_spoc", tess_spoc_dv_fast.get_db_metadata()),
+        ]
+    }
+
+
+def get_prerendered_tce_html(tic):
+    """Return the pre-rendered fragments of the TIC as a ``TceHtml``,
+    None if the TIC is not pre-rendered, or there is no pre-rendered db of the current SPOC and TESS-SPOC dbs.
+    """
+    db_path = _db_path()
+    if not os.path.isfile(db_path):
+        return None
+    # the metadata are cached until the dbs are replaced
+    metadata = db_utils.read_metadata(db_path)
+    if metadata is None or metadata.get("source_build_ids") != _get_source_build_ids():
+        return None  # stale, i.e., either db has been rebuilt since
+    with closing(sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)) as con:
+        row = con.execute(
+            f"select num_spoc_tces, num_tess_spoc_tces, spoc_html, tess_spoc_html from {_DB_TABLE} where ticid = ?;",
+            (int(tic),),
+        ).fetchone()
+    if row is None:
+        return None
+    num_spoc_tces, num_tess_spoc_tces, spoc_html, tess_spoc_html = row
+    return TceHtml(
+        num_spoc_tces,
+        num_tess_spoc_tces,
+        zlib.decompress(spoc_html).decode("utf-8"),
+        zlib.decompress(tess_spoc_html).decode("utf-8"),
+    )
@@ -0,0 +1,172 @@
+"""
+Pre-render the HTML fragments of the SPOC and TESS-SPOC TCEs of all the TICs to a db for the webapp,
+see ``tce_html``. It needs to be rebuilt whenever either db is rebuilt.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from pathlib import Path
+import sqlite3
+import zlib
+
+from . import build_profiler, db_utils, staged_outputs
+from . import tess_dv_fast  # standard SPOC TCEs
+from . import tess_spoc_dv_fast  # HLSP TESS-SPOC TCEs
+from .tce_html import _DB_TABLE, _db_path, _get_source_build_ids, render_tce_html
+
+# number of TICs rendered per task: the TCEs of the TICs are queried by a range of ticid
+DEFAULT_BATCH_NUM_TICS = 2000
+
+
+def _compress(html):
+    return zlib.compress(html.encode("utf-8"), 9)
+
+
+def _get_all_tics():
+    """Return the sorted ticids of all the TCEs of both SPOC and TESS-SPOC dbs."""
+    tics = set()
+    for query_module, view_name in [(tess_dv_fast, "tess_tcestats"), (tess_spoc_dv_fast, "tess_spoc_tcestats")]:
+        with closing(sqlite3.connect(query_module._db_uri(), uri=True)) as con:
+            tics.update(row[0] for row in con.execute(f"select distinct ticid from {view_name};"))
+    return sorted(tics)
+
+
+def _render_tics_in_range(ticid_min, ticid_max):
+    """Render the fragments of the TICs with TCEs in the range of ticid (inclusive),
+    returning the rows of the db table, in the order of ticid.
+
+    The TCEs are queried and rendered the same way as ``get_tce_infos_of_tic()`` of a TIC in the webapp.
+    """
+    with build_profiler.stage("render_html") as st:
+        params = [int(ticid_min), int(ticid_max)]
+        df_spoc = tess_dv_fast._query_tcestats_from_db(
+            f"select * from tess_tcestats where ticid between ? and ? {tess_dv_fast._SQL_ORDER_BY}", params=params
+        )
+        tess_dv_fast._add_helpful_columns_to_tcestats(df_spoc)
+        df_tess_spoc = tess_spoc_dv_fast._query_tcestats_from_db(
+            f"select * from tess_spoc_tcestats where ticid between ? and ? {tess_spoc_dv_fast._SQL_ORDER_BY}",
+            params=params,
+        )
+        tess_spoc_dv_fast._add_helpful_columns_to_tcestats(df_tess_spoc)
+
+        # the TCEs of a TIC, in the standard sort order from the query
+        spoc_of_tic = dict(list(df_spoc.groupby("ticid", sort=False)))
+        tess_spoc_of_tic = dict(list(df_tess_spoc.groupby("ticid", sort=False)))
+
+        rows = []
+        for tic in sorted(set(spoc_of_tic) | set(tess_spoc_of_tic)):
+            tce_html = render_tce_html(
+                spoc_of_tic.get(tic, df_spoc.iloc[0:0]).reset_index(drop=True),
+                tess_spoc_of_tic.get(tic, df_tess_spoc.iloc[0:0]).reset_index(drop=True),
+            )
+            rows.append(
+                (
+                    int(tic),
+                    tce_html.num_spoc_tces,
+                    tce_html.num_tess_spoc_tces,
+                    _compress(tce_html.spoc_html),
+                    _compress(tce_html.tess_spoc_html),
+                )
+            )
+        st.set_rows(len(rows))
+    return rows
+
+
+def _render_batches(batches, num_workers=None):
+    """Yield the rendered rows of the batches, ``(ticid_min, ticid_max)``, in the same order as the batches.
+
+    If ``num_workers`` is greater than 1, the batches are rendered in parallel in a process pool.
+    """
+    if num_workers is None or num_workers <= 1:
+        for ticid_min, ticid_max in batches:
+            yield _render_tics_in_range(ticid_min, ticid_max)
+        return
+
+    # keep a bounded number of batches in flight, so that the rendered ones do not pile up in memory
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        batches_iter = iter(batches)
+        pending = deque()
+
+        def submit_next():
+            batch = next(batches_iter, None)
+            if batch is not None:
+                pending.append(
+                    executor.submit(
+                        build_profiler.call_profiled, build_profiler.is_enabled(), _render_tics_in_range, *batch
+                    )
+                )
+
+        for _ in range(num_workers * 2):
+            submit_next()
+        while len(pending) > 0:
+            rows, stage_records = pending.popleft().result()
+            build_profiler.add_records(stage_records)
+            submit_next()
+            yield rows
+
+
+def build_tce_html_db(num_workers=None, batch_num_tics=DEFAULT_BATCH_NUM_TICS):
+    """Pre-render the fragments of the TCEs of all the TICs in the SPOC and TESS-SPOC dbs to the db,
+    to be served by the webapp. It needs to be rebuilt whenever either db is rebuilt.
+
+    If ``num_workers`` is greater than 1, the TICs are rendered in parallel with the given number of processes.
+    """
+    source_build_ids = _get_source_build_ids()
+    tics = _get_all_tics()
+    batches = [
+        (tics[i], tics[min(i + batch_num_tics, len(tics)) - 1]) for i in range(0, len(tics), batch_num_tics)
+    ]
+    print(f"DEBUG Pre-render the html of {len(tics)} TICs in {len(batches)} batches...")
+
+    db_path_tmp = f"{_db_path()}.tmp"
+    Path(db_path_tmp).unlink(missing_ok=True)
+    con = db_utils.connect_for_bulk_load(db_path_tmp)
+    try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
+        con.execute(
+            f"""create table {_DB_TABLE} (
+                ticid INTEGER PRIMARY KEY,
+                num_spoc_tces INTEGER NOT NULL,
+                num_tess_spoc_tces INTEGER NOT NULL,
+                spoc_html BLOB NOT NULL,
+                tess_spoc_html BLOB NOT NULL
+            );"""
+        )
+        for rows in _render_batches(batches, num_workers):
+            with build_profiler.stage("db_insert") as st:
+                con.executemany(f"insert into {_DB_TABLE} values (?, ?, ?, ?, ?);", rows)
+                st.set_rows(len(rows))
+        with build_profiler.stage("db_finalize"):
+            db_utils.save_metadata(con, db_utils.new_build_metadata("tce_html", source_build_ids=source_build_ids))
+            db_utils.finalize_db(con)
+    finally:
+        con.close()
+
+    staged_outputs.move_into_place(db_path_tmp, _db_path())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-render the html of the TCEs of all TICs for the webapp")
+    parser.add_argument(
+        "--update",
+        dest="update",
+        action="store_true",
+        help="Update the pre-rendered html db from the SPOC and TESS-SPOC sqlite dbs.",
+    )
+    parser.add_argument(
+        "--num_workers",
+        dest="num_workers",
+        type=int,
+        default=None,
+        help="number of worker processes to render the html in parallel. Default is serial.",
+    )
+
+    args = parser.parse_args()
+    if not args.update:
+        print("--update must be specified")
+        parser.print_help()
+        parser.exit()
+
+    build_tce_html_db(num_workers=args.num_workers)
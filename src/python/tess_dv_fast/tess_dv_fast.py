@@ -13,25 +13,36 @@ from typing import Callable, Optional, Union
 import numpy as np
 import pandas as pd
 
+from . import db_utils
 from .tess_dv_fast_common import (
     ARRAY_LIKE_TYPES,
     R_EARTH_TO_R_JUPITER,
+    SECTORS_MASK_COLUMNS,
     add_html_column_units,
+    count_sectors,
     format_codes,
     format_exomast_id,
     format_offset_n_sigma,
+    sql_covers_sector,
 )
 from .tess_dv_fast_spec import (
     DATA_BASE_DIR,
     TCESTATS_DBNAME,
     TCESTATS_FILENAME,
+    get_tcestats_csv_dtypes,
 )
 
 
-def read_tcestats_csv(**kwargs) -> pd.DataFrame:
+def read_tcestats_csv(low_precision: bool = False, **kwargs) -> pd.DataFrame:
+    """Read the master tcestats csv, with the declared dtypes of the columns.
+
+    If `low_precision` is True, the uncertainties and the stellar parameters are read as float32.
+    The `dtype` in `kwargs`, if any, takes precedence over the declared ones.
+    """
     # for ~230k rows of TCE stats data, it took 4-10secs, taking up 200+Mb memory.
     csv_path = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
-    return pd.read_csv(csv_path, comment="#", dtype={"tce_sectors": str}, **kwargs)
+    dtype = {**get_tcestats_csv_dtypes(low_precision), **kwargs.pop("dtype", {})}
+    return pd.read_csv(csv_path, comment="#", dtype=dtype, **kwargs)
 
 
 def _db_uri():
@@ -40,14 +51,22 @@ def _db_uri():
 
 def _query_tcestats_from_db(sql: str, **kwargs) -> pd.DataFrame:
     with sqlite3.connect(_db_uri(), uri=True) as con:
+        df = pd.read_sql(sql, con, **kwargs)
         # convert the 0/1 value in column `tce_sradius_prov_is_solar` to bool
-        df = pd.read_sql(sql, con, dtype={"tce_sradius_prov_is_solar": bool}, **kwargs)
+        # - cast the column directly: read_sql(dtype=...) casts the entire dataframe, a large part of a query's CPU
+        df["tce_sradius_prov_is_solar"] = df["tce_sradius_prov_is_solar"].astype(bool)
         # to avoid "PerformanceWarning: DataFrame is highly fragmented."
         # in subsequent codes such as _add_helpful_columns_to_tcestats()
         df = df.copy()
         return df
 
 
+# the standard sort order of TCEs: by ticid, then the ones spanning more sectors first
+# (see `sectors_span` in _add_helpful_columns_to_tcestats()), then by exomast_id.
+# - sectors_span is from the sectors table of the db, e.g., for s0014-s0086, it is 86 - 14 + 1 = 73
+_SQL_ORDER_BY = "order by ticid, sectors_span desc, exomast_id"
+
+
 def _get_tcestats_of_tic_from_db(
     tic: Union[int, float, str, tuple, list],
 ) -> pd.DataFrame:
@@ -58,7 +77,7 @@ def _get_tcestats_of_tic_from_db(
     #   handle missing columns though
     if isinstance(tic, (int, float, str)) or np.isscalar(tic):
         return _query_tcestats_from_db(
-            "select * from tess_tcestats where ticid = ?",
+            f"select * from tess_tcestats where ticid = ? {_SQL_ORDER_BY}",
             params=[int(tic)],
         )
     elif isinstance(tic, ARRAY_LIKE_TYPES):
@@ -70,7 +89,7 @@ def _get_tcestats_of_tic_from_db(
         tic = [int(v) for v in tic]
         in_params_place_holder = ",".join(["?" for i in range(len(tic))])
         return _query_tcestats_from_db(
-            f"select * from tess_tcestats where ticid in ({in_params_place_holder})",
+            f"select * from tess_tcestats where ticid in ({in_params_place_holder}) {_SQL_ORDER_BY}",
             params=tic,
         )
     else:
@@ -83,20 +102,71 @@ def get_tce_infos_of_tic(
     tic: Union[int, float, str, tuple, list],
     tce_filter_func: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
 ) -> pd.DataFrame:
+    # the result is in the standard sort order, sorted by the query,
+    # so that it is predictable for tce_filter_func
     df = _get_tcestats_of_tic_from_db(tic)
     _add_helpful_columns_to_tcestats(df)
-    # sort the result to the standard form
-    # so that it is predictable for tce_filter_func
-    df = df.sort_values(
-        by=["ticid", "sectors_span", "exomast_id"], ascending=[True, False, True]
-    )
     if tce_filter_func is not None and len(df) > 0:
         df = tce_filter_func(df)
 
     return df
 
 
+def get_tce_infos_covering_sector(
+    sector: int,
+    tic: Optional[Union[int, float, str, tuple, list]] = None,
+) -> pd.DataFrame:
+    """Return the TCEs covering the given sector, i.e., with observations in the sector,
+    optionally only the ones of the given TIC(s), in the standard sort order.
+
+    The coverage is tested on the sector coverage bitmasks in the db, see ``to_sectors_masks()``.
+    """
+    sql = f"select * from tess_tcestats where {sql_covers_sector(sector)}"
+    params = []
+    if tic is not None:
+        tic = [int(tic)] if isinstance(tic, (int, float, str)) or np.isscalar(tic) else [int(v) for v in tic]
+        sql += f" and ticid in ({','.join(['?'] * len(tic))})"
+        params = tic
+    df = _query_tcestats_from_db(f"{sql} {_SQL_ORDER_BY}", params=params)
+    _add_helpful_columns_to_tcestats(df)
+    return df
+
+
+def get_tce_details(exomast_id: str) -> Optional[pd.Series]:
+    """Return all the parameters of the TCE of the given id, e.g., ``TIC261136679S0001S0001TCE1``,
+    None if there is no such TCE.
+
+    The full db stores the parameters not needed by ``display_tce_infos()`` apart from the ones queried
+    by ``get_tce_infos_of_tic()``, so that they are read only on demand. For the minimal db,
+    only the parameters in the db are returned.
+    """
+    match = re.fullmatch(r"TIC(\d+)S(\d{4})S(\d{4})TCE(\d+)", exomast_id.strip().upper())
+    if match is None:
+        raise ValueError(f"Invalid TCE id: {exomast_id}")
+    ticid, sector_start, sector_end, tce_plnt_num = match.groups()
+
+    with sqlite3.connect(_db_uri(), uri=True) as con:
+        (is_full_db,) = con.execute(
+            "select count(*) from sqlite_master where name = 'tess_tcestats_full';"
+        ).fetchone()
+    view_name = "tess_tcestats_full" if is_full_db else "tess_tcestats"
+    df = _query_tcestats_from_db(
+        f"select * from {view_name} where ticid = ? and sectors = ? and tce_plnt_num = ?",
+        params=[int(ticid), f"s{sector_start}-s{sector_end}", int(tce_plnt_num)],
+    )
+    if len(df) < 1:
+        return None
+    _add_helpful_columns_to_tcestats(df)
+    return df.iloc[0]
+
+
 def _add_helpful_columns_to_tcestats(df: pd.DataFrame) -> None:
+    # the columns are precomputed in the db (see _get_db_generated_columns() of the build),
+    # only the ones not in the tcestats are derived here, e.g., for the tcestats from the master csv
+    def add_if_missing(col, func):
+        if col not in df.columns:
+            df[col] = func()
+
     def get_sectors_span(sectors_str):
         match = re.match(r"s(\d+)-s(\d+)", sectors_str)
         if match is None:
@@ -105,8 +175,12 @@ def _add_helpful_columns_to_tcestats(df: pd.DataFrame) -> None:
 
         return end - start + 1
 
-    # convert the bit pattern in tce_sectors column to number of sectors a TCE covers
-    df["tce_num_sectors"] = df["tce_sectors"].str.count("1")
+    # the number of sectors a TCE covers, from the sector coverage bitmasks,
+    # or the bit pattern in tce_sectors column if there is none
+    if all(col in df.columns for col in SECTORS_MASK_COLUMNS):
+        add_if_missing("tce_num_sectors", lambda: count_sectors(df))
+    else:
+        add_if_missing("tce_num_sectors", lambda: df["tce_sectors"].str.count("1"))
     # OPEN: column "sectors_span" is added as a workaround to
     # ensure the default sort (TCEs with most sectors come first) work properly
     #
@@ -121,19 +195,24 @@ def _add_helpful_columns_to_tcestats(df: pd.DataFrame) -> None:
     # Workaround solution:
     # add a new column "sectors_span" that count the span of a (multi-sector) TCE,
     # e.g., for s0014-0086, it is 86 - 14 + 1 = 73
+    # - it is resolved from the sectors table by the db query. Derive it for the tcestats from elsewhere.
     #
-    df["sectors_span"] = [get_sectors_span(s) for s in df["sectors"]]
-    df["tce_prad_jup"] = df["tce_prad"] * R_EARTH_TO_R_JUPITER
-    df["tce_depth_pct"] = df["tce_depth"] / 10000
-    df["tce_ditco_msky_sig"] = (
-        df["tce_ditco_msky"] / df["tce_ditco_msky_err"]
-    )  # TicOffset sig
-    df["tce_ditco_jsky_sig"] = (
-        df["tce_ditco_jsky"] / df["tce_ditco_jsky_err"]
+    add_if_missing("sectors_span", lambda: [get_sectors_span(s) for s in df["sectors"]])
+    add_if_missing("tce_prad_jup", lambda: df["tce_prad"] * R_EARTH_TO_R_JUPITER)
+    add_if_missing("tce_depth_pct", lambda: df["tce_depth"] / 10000)
+    add_if_missing("tce_ditco_msky_sig", lambda: df["tce_ditco_msky"] / df["tce_ditco_msky_err"])  # TicOffset sig
+    add_if_missing(
+        "tce_ditco_jsky_sig", lambda: df["tce_ditco_jsky"] / df["tce_ditco_jsky_err"]
     )  # TicOffset (joint difference image) sig
-    df["tce_dicco_msky_sig"] = (
-        df["tce_dicco_msky"] / df["tce_dicco_msky_err"]
-    )  # OotOffset sig
+    add_if_missing("tce_dicco_msky_sig", lambda: df["tce_dicco_msky"] / df["tce_dicco_msky_err"])  # OotOffset sig
+
+    # the TicOffset to be shown: for no ditco_jsky cases, the err is -1.0 in the CSVs
+    # - case no TicOffset-jnt (or it's genuinely N/A): use the classic one
+    no_ditco_jsky = df["tce_ditco_jsky_err"] < 0
+    add_if_missing("tce_tic_offset", lambda: df["tce_ditco_jsky"].where(~no_ditco_jsky, df["tce_ditco_msky"]))
+    add_if_missing(
+        "tce_tic_offset_sig", lambda: df["tce_ditco_jsky_sig"].where(~no_ditco_jsky, df["tce_ditco_msky_sig"])
+    )
 
     # Note: model's stellar density, `starDensitySolarDensity` in dvr xml, is not available in csv
 
@@ -170,15 +249,6 @@ def _format_depth(val_str):
         return depth_pct
 
 
-def _encode_tic_offset_str(r):
-    # for no ditco_jsky cases, the err is -1.0 in the CSVs
-    if r["tce_ditco_jsky_err"] < 0:
-        # case no TicOffset-jnt (or it's genuinely N/A)
-        return f"""{r["tce_ditco_msky"]}|{r["tce_ditco_msky_sig"]}"""
-    else:
-        return f"""{r["tce_ditco_jsky"]}|{r["tce_ditco_jsky_sig"]}"""
-
-
 def display_tce_infos(
     df: pd.DataFrame,
     return_as: Optional[str] = None,
@@ -242,7 +312,7 @@ def display_tce_infos(
     # encode multiple values in a column to support conditional formatting
     # in display
 
-    df["TicOffset"] = [_encode_tic_offset_str(r) for _, r in df.iterrows()]
+    df["TicOffset"] = df["tce_tic_offset"].astype(str) + "|" + df["tce_tic_offset_sig"].astype(str)
     df["OotOffset"] = (
         df["tce_dicco_msky"].astype(str) + "|" + df["tce_dicco_msky_sig"].astype(str)
     )
@@ -306,3 +376,14 @@ def get_high_watermarks() -> dict[str, str]:
             high_watermarks_dict[row[0]] = row[1]
         cursor.close()
     return high_watermarks_dict
+
+
+def get_db_metadata() -> Optional[dict]:
+    """Return the metadata of the SPOC db: ``schema_version``, ``build_id`` (unique to a build),
+    ``build_time``, ``minimal_db``, ``num_rows_of_sectors``, ``sources_hash``, etc.
+    None for a db of an older build without the metadata.
+
+    It is cached until the db is replaced, e.g., by a new build, i.e., it is cheap to call per request,
+    e.g., to key the caches of the query results by ``build_id``.
+    """
+    return db_utils.read_metadata(f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}")
@@ -1,23 +1,33 @@
 """Build and manage SPOC TCE master CSV and SQLite database."""
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import os
 import re
 import shutil
 import sqlite3
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from .tcestats_utils import (
     is_odd_even_depth_diff_significant,
     is_weak_secondary_significant,
 )
+from .tess_dv_fast_common import R_EARTH_TO_R_JUPITER, SECTORS_MASK_COLUMNS, count_sectors, to_sectors_masks
 from .tess_dv_fast_spec import (
+    BUILD_MANIFEST_FILENAME,
+    BUILD_PROFILE_FILENAME,
     DATA_BASE_DIR,
     TCESTATS_DBNAME,
     TCESTATS_FILENAME,
+    get_tcestats_csv_dtypes,
 )
 
+from . import build_profiler, db_utils, download_utils, staged_outputs
 from . import tess_dv_fast_spec as spec
 
 
@@ -51,7 +61,7 @@ def _add_exomast_id(df):
     return new_df
 
 
-def _get_dv_products_of_sectors(sectors):
+def _get_dv_products_script_path(sectors):
     # sectors: the value of sectors column in csv, e.g., s0002-s0072
     sector_start, sector_end = sectors.split("-")
     if sector_start == sector_end:
@@ -69,47 +79,124 @@ def _get_dv_products_of_sectors(sectors):
     else:
         # case multi-sector
         script_name = f"{DATA_BASE_DIR}/tesscurl_multisector_{sectors}_dv.sh"
+    # the script could have been downloaded compressed
+    return download_utils.resolve_local_filename(script_name)
+
+
+# DV product filenames in tesscurl_*_dv.sh are in a fixed-width layout, e.g.,
+#   tess2018206190142-s0001-s0001-0000000024265684-01-00366_dvs.pdf
+#   tess2018206190142-s0001-s0001-0000000024265684-00366_dvr.xml
+#   ^   ^             ^           ^                ^  ^
+#   0   4 (date_time) 18 (sectors) 30 (ticid)      47 50 (pin for dvs, 47 for others)
+# format reference: https://archive.stsci.edu/missions-and-data/tess/data-products
+_DV_PRODUCT_TYPES = ["dvs.pdf", "dvm.pdf", "dvr.pdf", "dvr.xml", "dvt.fits"]
+
+# column name of each type of the DV products (other than dvs) in the master csv
+_DV_PRODUCT_COLS = {
+    "dvm.pdf": "dvm",
+    "dvr.pdf": "dvr",
+    "dvr.xml": "dvr_xml",
+    "dvt.fits": "dvt",
+}
+
+
+def _parse_dv_products_script(script_name):
+    """Parse the DV product filenames in a tesscurl_*_dv.sh in a single pass.
+
+    Returns a table of all the DV products, with columns
+    ``ticid``, ``tce_plnt_num`` (0 for non-dvs products), ``sectors``, ``date_time``, ``pin``,
+    ``product_type`` (e.g., ``dvs.pdf``) and ``filename``, in the order of the script.
+    """
+    with download_utils.open_file(script_name) as f:
+        # each line is in the form of: curl -C - -L -o <filename> <url>
+        # extract the filenames with a regex over the entire content, much faster than line by line
+        filenames = re.findall(rb"^curl [^\n]*?-o (\S+) ", f.read(), flags=re.MULTILINE)
+
+    # classify the files by type, skipping files of other types, if any
+    names = np.array(filenames, dtype=bytes)
+    product_type = np.full(len(names), None, dtype=object)
+    for t in _DV_PRODUCT_TYPES:
+        product_type[np.char.endswith(names, f"_{t}".encode())] = t
+    is_dv_product = pd.notna(product_type)
+    names, product_type = names[is_dv_product], product_type[is_dv_product]
+    is_dvs = product_type == "dvs.pdf"
+
+    if len(names) < 1:
+        # no DV products, e.g., an empty script: the positions below do not apply
+        return pd.DataFrame(
+            {
+                "ticid": np.array([], dtype=np.int64),
+                "tce_plnt_num": np.array([], dtype=np.int64),
+                "sectors": np.array([], dtype=str),
+                "date_time": np.array([], dtype=str),
+                "pin": np.array([], dtype=np.int64),
+                "product_type": np.array([], dtype=str),
+                "filename": np.array([], dtype=str),
+            }
+        )
+
+    # extract the components from their fixed positions in the filenames,
+    # as a 2D array of characters (padded with null bytes)
+    chars = names.view(np.uint8).reshape(len(names), names.itemsize)
 
-    filename = pd.read_csv(
-        script_name,
-        comment="#",
-        sep=" ",
-        names=["curl", "C", "-", "L", "o", "filename", "url"],
-        usecols=["filename"],
-    )["filename"]
-
-    dvs_filename = filename[filename.str.contains("_dvs.pdf")]
-    dvs = dvs_filename.str.extract(
-        rf"tess\d+-{sectors}-0+?(?P<ticid>[1-9]\d+)-(?P<tce_plnt_num>\d\d)-"
+    def to_int(start, end, rows=slice(None)):
+        # rows: the rows that the positions apply to. The values of the other rows are meaningless
+        digits = chars[:, start:end].astype(np.int64) - ord("0")
+        if not ((digits[rows] >= 0) & (digits[rows] <= 9)).all():
+            raise ValueError(
+                f"Unexpected DV product filename in {script_name}: non-digits in [{start}:{end}]"
+            )
+        return digits @ (10 ** np.arange(end - start - 1, -1, -1, dtype=np.int64))
+
+    def to_str(start, end):
+        return chars[:, start:end].copy().view(f"S{end - start}").ravel().astype(str)
+
+    if not (
+        (chars[:, 0:4] == np.frombuffer(b"tess", dtype=np.uint8)).all(axis=1)
+        & (chars[:, [17, 29, 46]] == ord("-")).all(axis=1)
+        & (~is_dvs | (chars[:, 49] == ord("-")))
+    ).all():
+        raise ValueError(f"Unexpected DV product filename layout in {script_name}")
+
+    return pd.DataFrame(
+        {
+            "ticid": to_int(30, 46),
+            "tce_plnt_num": np.where(is_dvs, to_int(47, 49, is_dvs), 0),
+            "sectors": to_str(18, 29),
+            "date_time": to_str(4, 17),
+            "pin": np.where(is_dvs, to_int(50, 55, is_dvs), to_int(47, 52, ~is_dvs)),
+            "product_type": product_type,
+            "filename": names.astype(str),
+        }
     )
-    dvs.ticid = dvs.ticid.astype("int64")
-    dvs.tce_plnt_num = dvs.tce_plnt_num.astype(int)
-    dvs["dvs"] = dvs_filename
-    # in case multiple runs for the same TIC-sector, use the last one only
-    dvs = dvs.groupby(by=["ticid", "tce_plnt_num"], as_index=False).last()
-
-    def get_products_of_type(colname, filename_suffix):
-        product_filename = filename[filename.str.contains(filename_suffix)]
-        df = product_filename.str.extract(rf"tess\d+-{sectors}-0+?(?P<ticid>[1-9]\d+)-")
-        df.ticid = df.ticid.astype("int64")
-        df[colname] = product_filename
-        # in case multiple runs for the same TIC-sector, use the last one only
-        df = df.groupby(by="ticid", as_index=False).last()
-        return df
 
-    dvm = get_products_of_type("dvm", "_dvm.pdf")
-    dvr = get_products_of_type("dvr", "_dvr.pdf")
-    dvr_xml = get_products_of_type("dvr_xml", "_dvr.xml")
-    dvt = get_products_of_type("dvt", "_dvt.fits")
 
-    res = dvs
-    for df in [dvm, dvr, dvr_xml, dvt]:
-        res = pd.merge(res, df, on="ticid", how="left", validate="many_to_one")
+def _get_dv_products_of_sectors(sectors, script_name=None):
+    # sectors: the value of sectors column in csv, e.g., s0002-s0072
+    # script_name: the path to the dv sh of the sectors, derived from the sectors if not specified
+    #
+    # Returns the filenames of dvs, dvm, dvr, dvr_xml and dvt of the TCEs,
+    # keyed by ticid and tce_plnt_num
+    if script_name is None:
+        script_name = _get_dv_products_script_path(sectors)
+
+    products = _parse_dv_products_script(script_name)
+    products = products[products["sectors"] == sectors]
+    is_dvs = products["product_type"] == "dvs.pdf"
+
+    # dvs is per TCE, the other products are per TIC
+    dvs = products[is_dvs][["ticid", "tce_plnt_num", "filename"]]
+    dvs = dvs.rename(columns={"filename": "dvs"})
+    # in case multiple runs for the same TIC-sector, use the last one only
+    dvs = dvs.drop_duplicates(subset=["ticid", "tce_plnt_num"], keep="last")
 
-    res["sectors"] = sectors
-    res = _add_exomast_id(res)
-    res.drop(["ticid", "tce_plnt_num", "sectors"], axis="columns", inplace=True)
-    return res
+    others = products[~is_dvs].drop_duplicates(subset=["ticid", "product_type"], keep="last")
+    others = others.pivot(index="ticid", columns="product_type", values="filename")
+    others = others.reindex(columns=_DV_PRODUCT_COLS.keys()).rename(columns=_DV_PRODUCT_COLS)
+    others.columns.name = None
+
+    res = pd.merge(dvs, others, left_on="ticid", right_index=True, how="left", validate="many_to_one")
+    return res.reset_index(drop=True)
 
 
 # csv column description (not completely up-to-date):
@@ -131,14 +218,18 @@ RAW_CSV_COLS_V2 = RAW_CSV_COLS_V2.split(",")
 def _read_raw_sector_tcestats_csv(filepath):
     """Read the raw/original (sector-level) tcestats CSVs downloaded from MAST"""
     def _do_read(usecols):
-        df = pd.read_csv(
-            filepath,
-            comment="#",
-            # additional columns starting from s0095 / s0001-s0092
-            # to get around the complication in the appended csv
-            # use a fixed set of columns (from sector 1 csv)
-            usecols=usecols,
-        )
+        # the csv could have been downloaded compressed
+        with download_utils.open_file(filepath) as f:
+            df = pd.read_csv(
+                f,
+                comment="#",
+                # additional columns starting from s0095 / s0001-s0092
+                # to get around the complication in the appended csv
+                # use a fixed set of columns (from sector 1 csv)
+                usecols=usecols,
+                # declared dtypes, e.g., the bit pattern of tce_sectors is kept as is
+                dtype=get_tcestats_csv_dtypes(),
+            )
 
         if len(df.columns) != len(usecols):
             raise ValueError(
@@ -167,74 +258,364 @@ def _read_raw_sector_tcestats_csv(filepath):
         return df
 
 
-def _append_to_tcestats_csv(filepath, sectors_val, dest):
-    print(f"DEBUG appending to master tcestats csv from: {filepath}")
-
+def _get_sector_tcestats(filepath, sectors_val, dv_sh_path=None):
+    """Return the tcestats of a sector, with exomast_id and the filenames of the DV products."""
     # base tcestats csv of a sector
-    df = _read_raw_sector_tcestats_csv(filepath)
+    with build_profiler.stage("parse_tcestats_csv", sectors_val) as st:
+        df = _read_raw_sector_tcestats_csv(filepath)
+        st.set_rows(len(df))
+
+    # filenames of dvs, dvm, etc.
+    with build_profiler.stage("parse_dv_script", sectors_val) as st:
+        df_filenames = _get_dv_products_of_sectors(sectors_val, dv_sh_path)
+        st.set_rows(len(df_filenames))
+
+    with build_profiler.stage("merge", sectors_val) as st:
+        # replace sectors column with a uniform format, e.g., s0002-s0002
+        # that describes the actual range for both single sector and multi sector csvs
+        df["sectors"] = sectors_val
+
+        # uniquely identify a TCE across all sectors
+        df = _add_exomast_id(df)
+
+        # include filenames of dvs, dvm, etc.
+        df = pd.merge(df, df_filenames, on=["ticid", "tce_plnt_num"], validate="one_to_one")
+        st.set_rows(len(df))
+    return df
+
+
+def _get_sector_tcestats_of_sources(sector_sources, num_workers=None):
+    """Yield the tcestats of the given sector sources, in the same order as the sources.
+
+    If ``num_workers`` is greater than 1, the sectors are processed in parallel in a process pool.
+    """
+    if num_workers is None or num_workers <= 1:
+        for source in sector_sources:
+            yield source, _get_sector_tcestats(
+                source["tcestats_path"], source["sectors_val"], source["dv_sh_path"]
+            )
+        return
+
+    # submit the sectors to the pool, keeping a bounded number of them in flight,
+    # so that the results of the completed sectors do not pile up in memory
+    # while the earlier (typically larger multi-sector) ones are still being processed.
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        sources_iter = iter(sector_sources)
+        pending = deque()
+
+        def submit_next():
+            source = next(sources_iter, None)
+            if source is not None:
+                # the stages in the worker processes are profiled there, and collected here
+                future = executor.submit(
+                    build_profiler.call_profiled,
+                    build_profiler.is_enabled(),
+                    _get_sector_tcestats,
+                    source["tcestats_path"],
+                    source["sectors_val"],
+                    source["dv_sh_path"],
+                )
+                pending.append((source, future))
+
+        for _ in range(num_workers * 2):
+            submit_next()
+        while len(pending) > 0:
+            source, future = pending.popleft()
+            df, stage_records = future.result()
+            build_profiler.add_records(stage_records)
+            submit_next()
+            yield source, df
+
+
+def _append_to_tcestats_csv(df, dest):
+    with build_profiler.stage("append_csv", df["sectors"].iloc[0] if len(df) > 0 else None) as st:
+        # only write header when the file is first created
+        write_header = not os.path.isfile(dest)
+        df.to_csv(dest, index=False, header=write_header, mode="a")
+        st.set_rows(len(df))
+
+
+def _download_sources(urls, compression=None):
+    with build_profiler.stage("download") as st:
+        results = download_utils.download_files(
+            [(url, _filename(url)) for url in urls],
+            download_dir=DATA_BASE_DIR,
+            progress_func=download_utils.print_download_progress,
+            compression=compression,
+        )
+        st.set_rows(sum(1 for _, is_cache_used in results if not is_cache_used))  # the number of files downloaded
+    return [filepath for filepath, _ in results]
+
+
+def _get_sector_sources(source_archive=None):
+    """Return the list of sector sources, each a dict of sectors_val and the URL / local path of the csv and dv sh.
+
+    ``source_archive``: the archive(s) of the sources. The local path of a source in the archives
+    is the member path, see ``archive_utils``. The ones not in the archives are looked up in the data dir.
+    """
+    # the dv sh URLs are derived from the tcestats csv URLs, i.e., they are 1-to-1 in the same order
+    tcestats_urls = spec.sources_tcestats_single_sector + spec.sources_tcestats_multi_sector
+    dv_sh_urls = spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector
+
+    def local_path(url):
+        # the local file could have been downloaded compressed
+        return download_utils.resolve_local_filename(f"{DATA_BASE_DIR}/{_filename(url)}", source_archive)
+
+    return [
+        dict(
+            sectors_val=re.search(r"s\d{4}-s\d{4}", url)[0],  # e.g., s0002-s0002
+            tcestats_url=url,
+            tcestats_path=local_path(url),
+            dv_sh_url=dv_sh_url,
+            dv_sh_path=local_path(dv_sh_url),
+        )
+        for url, dv_sh_url in zip(tcestats_urls, dv_sh_urls)
+    ]
 
-    # replace sectors column with a uniform format, e.g., s0002-s0002
-    # that describes the actual range for both single sector and multi sector csvs
-    df["sectors"] = sectors_val
 
-    # uniquely identify a TCE across all sectors
-    df = _add_exomast_id(df)
+#
+# Build manifest: the list of sector sources used to build the master csv / db
+# - it is used to incrementally update the master csv / db, i.e., to only
+#   ingest the sectors that are new or whose sources have been changed.
+#
+
 
-    # include filenames of dvs, dvm, etc.
-    df_filenames = _get_dv_products_of_sectors(sectors_val)
-    df = pd.merge(df, df_filenames, on="exomast_id", validate="one_to_one")
+def _file_info(url, filepath):
+    # the size and hash of the (decompressed) content, so that they do not depend on
+    # whether the file is stored compressed or not
+    sha256 = hashlib.sha256()
+    size = 0
+    with download_utils.open_file(filepath) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+            size += len(block)
+    return dict(url=url, size=size, sha256=sha256.hexdigest())
 
-    # only write header when the file is first created
-    write_header = not os.path.isfile(dest)
-    df.to_csv(dest, index=False, header=write_header, mode="a")
 
+def _get_sector_source_info(source):
+    return dict(
+        tcestats=_file_info(source["tcestats_url"], source["tcestats_path"]),
+        dv_sh=_file_info(source["dv_sh_url"], source["dv_sh_path"]),
+    )
 
-def download_all_data(minimal_db=False, extract_source_urls=True):
-    """Download all relevant data locally."""
-    from . import download_utils
+
+def _read_build_manifest():
+    manifest_path = staged_outputs.current_path(f"{DATA_BASE_DIR}/{BUILD_MANIFEST_FILENAME}")
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_build_manifest(minimal_db, sector_infos, master_csv=True, quantize=False):
+    # master_csv: whether the master csv is written in the build
+    manifest_path = f"{DATA_BASE_DIR}/{BUILD_MANIFEST_FILENAME}"
+    manifest = dict(minimal_db=minimal_db, quantize=quantize, master_csv=master_csv, sectors=sector_infos)
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    staged_outputs.move_into_place(f"{manifest_path}.tmp", manifest_path)
+
+
+def _get_sectors_to_ingest(manifest, sector_infos):
+    """Return the sectors that are new / changed, and the sectors that are no longer in the sources."""
+
+    def same_sources(info1, info2):
+        return info1["tcestats"] == info2["tcestats"] and info1["dv_sh"] == info2["dv_sh"]
+
+    prev_sector_infos = manifest["sectors"]
+    sectors_changed = [
+        sectors_val
+        for sectors_val, info in sector_infos.items()
+        if sectors_val not in prev_sector_infos
+        or not same_sources(info, prev_sector_infos[sectors_val])
+    ]
+    sectors_removed = [
+        sectors_val for sectors_val in prev_sector_infos if sectors_val not in sector_infos
+    ]
+    return sectors_changed, sectors_removed
+
+
+def _can_build_incrementally(manifest, minimal_db, quantize=False):
+    return (
+        manifest is not None
+        and manifest.get("minimal_db") == minimal_db
+        and manifest.get("quantize", False) == quantize
+        and (
+            not manifest.get("master_csv", True)
+            or os.path.isfile(f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}")
+        )
+        and os.path.isfile(f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}")
+        # i.e., not a db of an older schema
+        and _has_db_table(f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}", _DB_TABLE)
+        and (minimal_db or _has_db_table(f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}", _DB_DETAILS_TABLE))
+    )
+
+
+def _has_db_table(db_path, table_name):
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return con.execute("select count(*) from sqlite_master where name = ?;", (table_name,)).fetchone()[0] > 0
+    finally:
+        con.close()
+
+
+def download_all_data(
+    minimal_db=False,
+    extract_source_urls=True,
+    incremental=False,
+    num_workers=None,
+    stream_to_db=False,
+    write_csv=True,
+    chunksize=None,
+    compression=None,
+    source_archive=None,
+    quantize=False,
+):
+    """Download all relevant data locally.
+
+    If ``incremental`` is True, only the sectors that are new or whose sources have been
+    changed since the last build are (re-)ingested to the master csv and db.
+    It falls back to a full build if there is no usable build manifest from a previous build.
+
+    If ``num_workers`` is greater than 1, the sectors are ingested in parallel with
+    the given number of worker processes. The result is identical to the serial build.
+
+    If ``stream_to_db`` is True, the tcestats of each sector is written to the db directly,
+    rather than being converted from the master csv after all sectors are merged.
+    The master csv is still written as a side output, unless ``write_csv`` is False.
+
+    ``chunksize``: if specified, the master csv is converted to the db in chunks of the given
+    number of rows, to bound the memory needed.
+
+    ``compression``: if specified (``"gzip"``, ``"zstd"`` or ``"auto"``), the downloaded sector csvs
+    and dv sh scripts are stored compressed. They are read without being decompressed to disk.
+
+    ``source_archive``: if specified, the path (or a list of paths) of the tarballs / zip files of the
+    sector csvs and dv sh scripts, e.g., for offline builds. The sources are read from the archives directly,
+    without being downloaded or extracted to disk. The source URLs are from the local json config file,
+    i.e., ``extract_source_urls`` is typically False.
+
+    ``quantize``: if True, the columns in ``_DB_QUANTIZED_COLUMNS`` are stored in the db as integers
+    scaled to their precision, for a smaller db. They are decoded back in the view ``tess_tcestats``,
+    i.e., the queries are unchanged, with the values rounded to the precision.
+    """
+    if not stream_to_db and not write_csv:
+        raise ValueError("write_csv=False is only supported with stream_to_db=True")
 
     # web-scrape the listing pages to get the list of URLs, save locally
     if extract_source_urls:
         spec.extract_and_save_source_urls_to_file()
     # else for cases the urls have been extracted and saved in the local json config file
 
-    # dv products download scripts (for urls to the products)
-    # - they need to be first downloaded: as creating master csv below relies on the scripts
-    for url in spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector:
-        filename = _filename(url)
-        filepath, is_cache_used = download_utils.download_file(
-            url,
-            filename=filename,
-            download_dir=DATA_BASE_DIR,
-            return_is_cache_used=True,
+    if source_archive is None:
+        # dv products download scripts (for urls to the products)
+        # - they need to be first downloaded: as creating master csv below relies on the scripts
+        _download_sources(spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector, compression)
+        _download_sources(spec.sources_tcestats_single_sector + spec.sources_tcestats_multi_sector, compression)
+
+    sector_sources = _get_sector_sources(source_archive)
+    with build_profiler.stage("hash_sources") as st:
+        sector_infos = {s["sectors_val"]: _get_sector_source_info(s) for s in sector_sources}
+        st.set_rows(len(sector_infos))
+
+    manifest = _read_build_manifest() if incremental else None
+    if incremental and not _can_build_incrementally(manifest, minimal_db, quantize):
+        print("DEBUG No usable build manifest from previous build. Do a full build instead.")
+        manifest = None
+
+    if manifest is not None:
+        _update_all_data_incrementally(
+            minimal_db, manifest, sector_sources, sector_infos, num_workers, quantize
         )
-        if not is_cache_used:
-            print(f"DEBUG Downloaded to {filepath} from: {url}")
+        return
 
-    # for tce stats csv files, download and merge them to a single csv
+    # for tce stats csv files, merge them to a single csv
     # - first write to a temporary master csv. Once done, overwrite the existing master (if any)
     dest_csv_tmp = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}.tmp"
     dest_csv = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
     Path(dest_csv_tmp).unlink(missing_ok=True)
-    for url in spec.sources_tcestats_single_sector + spec.sources_tcestats_multi_sector:
-        filename = _filename(url)
 
-        filepath, is_cache_used = download_utils.download_file(
-            url,
-            filename=filename,
-            download_dir=DATA_BASE_DIR,
-            return_is_cache_used=True,
-        )
-        if not is_cache_used:
-            print(f"DEBUG Downloaded to {filepath} from: {url}")
+    def ingest_sectors():
+        for source, df in _get_sector_tcestats_of_sources(sector_sources, num_workers):
+            if write_csv:
+                print(f"DEBUG appending to master tcestats csv from: {source['tcestats_path']}")
+                _append_to_tcestats_csv(df, dest_csv_tmp)
+            sector_infos[source["sectors_val"]]["num_rows"] = len(df)
+            yield df
+
+    if stream_to_db:
+        # write each sector to the db as it is processed, without the master csv round trip,
+        # so that only one sector is in memory at any time.
+        print(f"DEBUG Stream tcestats of each sector to sqlite db, minimal_db={minimal_db}...")
+        with build_profiler.stage("export_db"):
+            _build_tcestats_db(
+                (_to_db_df(df, minimal_db, quantize) for df in ingest_sectors()), minimal_db, quantize=quantize
+            )
+    else:
+        for _ in ingest_sectors():
+            pass
+    if write_csv:
+        staged_outputs.move_into_place(dest_csv_tmp, dest_csv)
+
+    if not stream_to_db:
+        # convert the master csv into a sqlite db for speedier query by ticid
+        print(f"DEBUG Convert master tcestats csv to sqlite db, minimal_db={minimal_db}...")
+        _export_tcestats_as_db(minimal_db, chunksize=chunksize, quantize=quantize)
+
+    _save_build_manifest(minimal_db, sector_infos, master_csv=write_csv, quantize=quantize)
+
+
+def _update_all_data_incrementally(
+    minimal_db, manifest, sector_sources, sector_infos, num_workers=None, quantize=False
+):
+    sectors_changed, sectors_removed = _get_sectors_to_ingest(manifest, sector_infos)
+    if len(sectors_changed) == 0 and len(sectors_removed) == 0:
+        print("DEBUG No new or changed sectors. The master csv and db are up-to-date.")
+        return
+    print(
+        f"DEBUG Incremental update. Sectors to (re-)ingest: {sectors_changed} ; sectors to remove: {sectors_removed}"
+    )
+
+    for sectors_val, info in sector_infos.items():
+        if sectors_val not in sectors_changed:
+            info["num_rows"] = manifest["sectors"][sectors_val]["num_rows"]
+
+    dfs = []
+    sector_sources_changed = [s for s in sector_sources if s["sectors_val"] in sectors_changed]
+    for source, df in _get_sector_tcestats_of_sources(sector_sources_changed, num_workers):
+        print(f"DEBUG ingesting tcestats csv from: {source['tcestats_path']}")
+        sector_infos[source["sectors_val"]]["num_rows"] = len(df)
+        dfs.append(df)
+
+    sectors_to_replace = sectors_changed + sectors_removed
+    master_csv = manifest.get("master_csv", True)
+    if master_csv:
+        _update_tcestats_csv(dfs, sectors_to_replace, manifest["sectors"].keys())
+    with build_profiler.stage("export_db"):
+        _update_tcestats_db(dfs, sectors_to_replace, minimal_db, quantize)
+
+    _save_build_manifest(minimal_db, sector_infos, master_csv=master_csv, quantize=quantize)
+
+
+def _update_tcestats_csv(dfs, sectors_to_replace, existing_sectors):
+    dest_csv_tmp = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}.tmp"
+    dest_csv = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
+    Path(dest_csv_tmp).unlink(missing_ok=True)
 
-        sectors_val = re.search(r"s\d{4}-s\d{4}", url)[0]  # e.g., s0002-s0002
-        _append_to_tcestats_csv(filepath, sectors_val, dest_csv_tmp)
-    shutil.move(dest_csv_tmp, dest_csv)
+    # the rows of the existing sectors need to be filtered out only if some of them are replaced,
+    # i.e., the common case of adding new sectors requires no rewrite.
+    if len(set(existing_sectors).intersection(sectors_to_replace)) > 0:
+        # use chunks to avoid loading the entire master csv to memory
+        for df_chunk in _read_tcestats_csv(chunksize=100000):
+            df_chunk = df_chunk[~df_chunk["sectors"].isin(sectors_to_replace)]
+            write_header = not os.path.isfile(dest_csv_tmp)
+            df_chunk.to_csv(dest_csv_tmp, index=False, header=write_header, mode="a")
+    else:
+        shutil.copyfile(dest_csv, dest_csv_tmp)
 
-    # convert the master csv into a sqlite db for speedier query by ticid
-    print(f"DEBUG Convert master tcestats csv to sqlite db, minimal_db={minimal_db}...")
-    _export_tcestats_as_db(minimal_db)
+    for df in dfs:
+        _append_to_tcestats_csv(df, dest_csv_tmp)
+    staged_outputs.move_into_place(dest_csv_tmp, dest_csv)
 
 
 def _get_high_watermarks_from_spec():
@@ -268,10 +649,23 @@ def _save_high_watermarks_to_db(con):
     cursor.close()
 
 
+def _save_db_metadata(con, minimal_db, quantize=False):
+    sources = (
+        spec.sources_tcestats_single_sector
+        + spec.sources_tcestats_multi_sector
+        + spec.sources_dv_sh_single_sector
+        + spec.sources_dv_sh_multi_sector
+    )
+    metadata = db_utils.new_build_metadata(
+        "spoc", con, _DB_TABLE, sources=sources, minimal_db=minimal_db, quantize=quantize
+    )
+    db_utils.save_metadata(con, metadata)
+
+
 # minimal list of columns in db in order to support display_tce_infos
 # the resulting db is about 30% of the full db
 _MIN_DB_COLS = [
-    "exomast_id",
+    # "exomast_id",  # will be generated
     "ticid",
     "tce_prad",  # for deriving: "Rp in Rj"
     "tce_time0bt",  #  "Epoch"
@@ -291,7 +685,7 @@ _MIN_DB_COLS = [
     "dvs",  # will be replaced by generated version to save space
     # "dvm",  # will be generated
     # "dvr",  # will be generated
-    "tce_sectors",  # for deriving "tce_num_sectors"
+    "tce_sectors",  # for deriving the sector coverage bitmasks, for "tce_num_sectors"
     # the following are components of a TCE's identifier, required
     # to generate dvs, dvm, dvr columns
     "tce_plnt_num",
@@ -307,21 +701,81 @@ _MIN_DB_COLS = [
     "tce_ws_maxmes",
 ]
 
+# The full db is split by the columns: the ones of the minimal db, i.e., the ones for display_tce_infos(), are stored
+# in the main table, queried with the view ``tess_tcestats`` as fast as the minimal db. The rest of the parameters
+# are stored in the details table with the same primary key, queried on demand with the view ``tess_tcestats_full``
+# of all the columns, e.g., by get_tce_details() of the query module.
+# - the columns of the main table derived in _to_db_df(), besides the ones in _MIN_DB_COLS
+_DB_MAIN_DERIVED_COLS = [
+    "tce_sradius_prov_is_solar",
+    "tce_bin_oedp_stat_is_sig",
+    "tce_ws_maxmes_is_sig",
+    *SECTORS_MASK_COLUMNS,
+    "tce_num_sectors",
+    "sectors_id",
+    "_dv_date_time",
+    "_dv_pin",
+    # the overrides of the products in the view tess_tcestats, see _to_db_df()
+    "_dvs_override",
+    "_dvm_override",
+    "_dvr_override",
+]
+# - the columns in _MIN_DB_COLS only used to derive the ones above, not in the minimal db
+_DB_MIN_SOURCE_ONLY_COLS = ["tce_sectors", "tce_sradius_prov", "tce_bin_oedp_stat", "tce_ws_maxmes"]
+
+
+def _split_db_columns(columns):
+    """Split the columns of the db (in the form of ``_to_db_df()``) into the ones of the main table
+    and the ones of the details table, excluding the primary key. The latter is empty for the minimal db.
+    """
+
+    def in_main_table(c):
+        return (
+            c in _DB_PRIMARY_KEY
+            or c in _DB_MAIN_DERIVED_COLS
+            or (c in _MIN_DB_COLS and c not in _DB_MIN_SOURCE_ONLY_COLS)
+        )
 
-def _read_tcestats_csv(**kwargs):
+    return [c for c in columns if in_main_table(c)], [c for c in columns if not in_main_table(c)]
+
+
+# the precision of the columns stored as scaled integers in a quantized db, ``{column: decimals}``,
+# at or above the precision shown in display_tce_infos, and the precision of the sources if it is lower,
+# e.g., the epoch has 2 decimals in the sources. The sentinels, e.g., -1 for the errors, are kept exactly.
+_DB_QUANTIZED_COLUMNS = {
+    "tce_prad": 4,  # Earth radii, shown as Rj with 4 decimals
+    "tce_time0bt": 2,
+    "tce_period": 6,
+    "tce_duration": 5,  # shown with 4 decimals
+    "tce_impact": 4,  # shown with 2 decimals
+    "tce_depth": 2,  # ppm, shown as percent with 4 decimals, i.e., 1 ppm
+    # the offsets are in arcsec
+    "tce_ditco_msky": 4,
+    "tce_ditco_msky_err": 4,
+    "tce_ditco_jsky": 4,
+    "tce_ditco_jsky_err": 4,
+    "tce_dicco_msky": 4,
+    "tce_dicco_msky_err": 4,
+}
+
+
+def _read_tcestats_csv(csv_path=None, **kwargs):
     # for ~230k rows of TCE stats data, it took 4-10secs, taking up 200+Mb memory.
-    csv_path = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
-    return pd.read_csv(csv_path, comment="#", dtype={"tce_sectors": str}, **kwargs)
+    if csv_path is None:
+        # the master csv of the current build, if it is not put in place yet
+        csv_path = staged_outputs.current_path(f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}")
+    dtype = {**get_tcestats_csv_dtypes(), **kwargs.pop("dtype", {})}
+    return pd.read_csv(csv_path, comment="#", dtype=dtype, **kwargs)
 
 
-def _export_tcestats_as_db(minimal_db=False):
-    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
-    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
+def _to_db_df(df, minimal_db, quantize=False):
+    """Convert the tcestats from the master csv to the form to be saved in the db.
 
-    usecols = None if not minimal_db else _MIN_DB_COLS
-    df = _read_tcestats_csv(
-        usecols=usecols,
-    )
+    If ``quantize`` is True, the columns in ``_DB_QUANTIZED_COLUMNS`` are stored as scaled integers.
+    """
+    if minimal_db:
+        # keep the column order of the master csv, i.e., the same as read_csv(usecols=...)
+        df = df[[c for c in df.columns if c in _MIN_DB_COLS]]
 
     # To avoid "PerformanceWarning: DataFrame is highly fragmented" ib subsequent calls
     # - the df from read_csv above tends to be fragmented,
@@ -355,56 +809,562 @@ def _export_tcestats_as_db(minimal_db=False):
     #
     # END create columns to flag warnings in UI
 
+    # the sector coverage as integer bitmasks, after tce_sectors, for counting / filtering by the sectors covered
+    # without parsing the bit pattern string, which is also inaccurate for the long multi-sector TCEs
+    df_masks = to_sectors_masks(df["tce_sectors"], df["sectors"])
+    loc = df.columns.get_loc("tce_sectors") + 1
+    for i, col in enumerate(df_masks.columns):
+        df.insert(loc + i, col, df_masks[col].to_numpy())
+    # stored rather than generated in the view, as there is no popcount in SQLite
+    df.insert(loc + len(df_masks.columns), "tce_num_sectors", count_sectors(df_masks))
     if minimal_db:
-        # replace dvs / dvm  / dvr columns with a much more compact representation
-        match = df["dvs"].str.extract(r"tess(?P<date_time>\d+)-.+-(?P<pin>\d+)_dvs")
-        # date_time: the associated timestamp
-        # pin: the pipeline run
-        # filename format reference: https://archive.stsci.edu/missions-and-data/tess/data-products
-        df["_dv_date_time"] = match.date_time
-        df["_dv_pin"] = match.pin.astype(int)
-        # dvs, dvm, dvr can be dynamically derived from above columns and the existing TCE identifier columns
-        df.drop(columns=["dvs"], inplace=True)
+        # the bit pattern string (up to 80 characters) is replaced by the bitmasks
+        df.drop(columns=["tce_sectors"], inplace=True)
+
+    # replace dvs / dvm  / dvr (and dvr_xml / dvt of the full db) columns with a much more compact representation
+    match = df["dvs"].str.extract(r"tess(?P<date_time>\d+)-.+-(?P<pin>\d+)_dvs")
+    # date_time: the associated timestamp
+    # pin: the pipeline run
+    # filename format reference: https://archive.stsci.edu/missions-and-data/tess/data-products
+    df["_dv_date_time"] = match.date_time
+    df["_dv_pin"] = match.pin.astype(int)
+    if not minimal_db:
+        # the products of a TIC could be from a different run from the one of the dvs of the TCE,
+        # the filenames of such products (or "" for missing ones) are kept as is in the override columns
+        for col, product_type in _DB_DV_PRODUCT_TYPES.items():
+            filenames = df[col].fillna("")
+            df[f"_{col}_override"] = filenames.where(filenames != _dv_filenames(df, product_type), None)
+    # dvs, dvm, dvr can be dynamically derived from above columns and the existing TCE identifier columns
+    df.drop(columns=[c for c in _DB_DV_PRODUCT_TYPES if c in df.columns], inplace=True)
+
+    # exomast_id can be dynamically derived from the TCE identifier columns
+    if "exomast_id" in df.columns:
+        df.drop(columns=["exomast_id"], inplace=True)
+
+    # replace the sectors (text) with the id in the sectors table, in place
+    df.insert(df.columns.get_loc("sectors"), "sectors_id", db_utils.to_sectors_id(df["sectors"]).to_numpy())
+    df.drop(columns=["sectors"], inplace=True)
+
+    if quantize:
+        # after the flags above are derived from the values in full precision
+        for col, decimals in _DB_QUANTIZED_COLUMNS.items():
+            if col in df.columns:
+                df[col] = db_utils.quantize(df[col], decimals)
+
+    return df
+
+
+# the DV product columns in the db, and their product types. The full db has all of them, the minimal db dvs, dvm, dvr
+_DB_DV_PRODUCT_TYPES = {
+    "dvs": "dvs.pdf",
+    "dvm": "dvm.pdf",
+    "dvr": "dvr.pdf",
+    "dvr_xml": "dvr.xml",
+    "dvt": "dvt.fits",
+}
+
+
+def _dv_filenames(df, product_type):
+    """Return the filenames of the DV products of the given type of the TCEs, derived from the TCE identifier columns,
+    ``_dv_date_time`` and ``_dv_pin``, the same as the ones in the view of the db, see ``_sql_dv_filename()``.
+    """
+    # e.g., tess2018206190142-s0001-s0001-0000000261136679-01-00366_dvs.pdf, tess2018206190142-s0001-s0001-0000000261136679-00366_dvm.pdf
+    prefix = "tess" + df["_dv_date_time"] + "-" + df["sectors"] + "-" + df["ticid"].astype(str).str.zfill(16) + "-"
+    pin = df["_dv_pin"].astype(str).str.zfill(5)
+    if product_type == "dvs.pdf":
+        return prefix + df["tce_plnt_num"].astype(str).str.zfill(2) + "-" + pin + "_dvs.pdf"
+    return prefix + pin + f"_{product_type}"
+
+
+def _sql_dv_filename(product_type):
+    prefix = "'tess' || _dv_date_time || '-' || sectors || '-' || substr('0000000000000000'|| ticid, -16, 16)  || '-'"
+    pin = "substr('00000' || _dv_pin, -5, 5)"
+    if product_type == "dvs.pdf":
+        return f"{prefix} ||  substr('00' || tce_plnt_num, -2, 2) || '-' || {pin} || '_dvs.pdf'"
+    return f"{prefix} || {pin} || '_{product_type}'"
+
+
+def _get_db_generated_columns(minimal_db, quantize=False, full_view=False):
+    """Return the columns of the view of the db derived from the other columns, as a list of ``(name, sql expression)``.
+
+    ``full_view``: the columns of the view ``tess_tcestats_full`` of the full db, i.e., with the DV products
+    that are not in ``tess_tcestats``.
+    """
+
+    def value_of(name):
+        # the value of the column, decoded if it is quantized
+        if quantize and name in _DB_QUANTIZED_COLUMNS:
+            return db_utils.sql_dequantize(f't."{name}"', _DB_QUANTIZED_COLUMNS[name])
+        return f't."{name}"'
+
+    # the same as _add_exomast_id()
+    columns = [("exomast_id", "'TIC' || ticid || upper(replace(sectors, '-', '')) || 'TCE' || tce_plnt_num")]
+    product_cols = list(_DB_DV_PRODUCT_TYPES) if full_view else ["dvs", "dvm", "dvr"]
+    for col in product_cols:
+        product_type = _DB_DV_PRODUCT_TYPES[col]
+        if minimal_db:
+            columns.append((col, _sql_dv_filename(product_type)))
+        else:
+            # the override, if any, with "" for the missing products
+            override = f"_{col}_override"
+            columns.append(
+                (col, f"CASE WHEN {override} IS NULL THEN {_sql_dv_filename(product_type)} ELSE nullif({override}, '') END")
+            )
+
+    def ratio_of(numerator, denominator):
+        # the same as the division in pandas, i.e., +/-inf for a non-zero value divided by zero,
+        # NULL (NaN) for 0 / 0. A division by zero is NULL in SQLite
+        num, den = value_of(numerator), value_of(denominator)
+        return f"CASE WHEN {den} = 0 THEN (CASE WHEN {num} > 0 THEN 1e999 WHEN {num} < 0 THEN -1e999 END) ELSE {num} / {den} END"
+
+    # the columns used by the query / display, the same as the ones derived in
+    # _add_helpful_columns_to_tcestats() of the query module, so that they need not be derived per query
+    ditco_msky_sig = ratio_of("tce_ditco_msky", "tce_ditco_msky_err")
+    ditco_jsky_sig = ratio_of("tce_ditco_jsky", "tce_ditco_jsky_err")
+    # TicOffset: the one from the joint difference image if there is one, i.e., its error is not -1
+    no_ditco_jsky = f"{value_of('tce_ditco_jsky_err')} < 0"
+    columns += [
+        ("tce_prad_jup", f"{value_of('tce_prad')} * {R_EARTH_TO_R_JUPITER!r}"),
+        ("tce_depth_pct", f"{value_of('tce_depth')} / 10000.0"),
+        ("tce_ditco_msky_sig", ditco_msky_sig),
+        ("tce_ditco_jsky_sig", ditco_jsky_sig),
+        ("tce_dicco_msky_sig", ratio_of("tce_dicco_msky", "tce_dicco_msky_err")),
+        ("tce_tic_offset", f"CASE WHEN {no_ditco_jsky} THEN {value_of('tce_ditco_msky')} ELSE {value_of('tce_ditco_jsky')} END"),
+        ("tce_tic_offset_sig", f"CASE WHEN {no_ditco_jsky} THEN {ditco_msky_sig} ELSE {ditco_jsky_sig} END"),
+    ]
+    return columns
+
+
+def _create_sectors_table_and_view(con, minimal_db, quantize=False):
+    # the rows reference the sectors table by sectors_id.
+    # the view, named as the table was, has the sectors (text), exomast_id and the DV product filenames,
+    # and the quantized columns decoded, so that the queries of the db are unchanged
+    db_utils.create_sectors_table(con, _DB_TABLE)
+    quantized_columns = _DB_QUANTIZED_COLUMNS if quantize else None
+    db_utils.create_view_with_sectors(
+        con,
+        "tess_tcestats",
+        _DB_TABLE,
+        extra_columns=_get_db_generated_columns(minimal_db, quantize),
+        quantized_columns=quantized_columns,
+    )
+    if not minimal_db:
+        # all the columns of the full db, with the ones of the details table
+        db_utils.create_view_with_sectors(
+            con,
+            "tess_tcestats_full",
+            _DB_TABLE,
+            extra_columns=_get_db_generated_columns(minimal_db, quantize, full_view=True),
+            quantized_columns=quantized_columns,
+            details_table=_DB_DETAILS_TABLE,
+            key_columns=_DB_PRIMARY_KEY,
+        )
+
+
+# the table of the tcestats rows. They are queried with the view ``tess_tcestats``
+_DB_TABLE = "tess_tcestats_data"
+
+# the table of the columns of the full db not in the minimal db, with the same primary key, see _split_db_columns()
+_DB_DETAILS_TABLE = "tess_tcestats_details_data"
+
+# the tcestats table is clustered by the primary key, so that the TCEs of a TIC are stored together
+_DB_PRIMARY_KEY = ["ticid", "sectors_id", "tce_plnt_num"]
+
+# the sql type of a column, determined the same way as pandas `to_sql()` does for sqlite
+_SQL_TYPES = {"string": "TEXT", "floating": "REAL", "integer": "INTEGER", "boolean": "INTEGER"}
+
+
+def _get_sql_types_of_df(df):
+    """Return the sql types of the columns of the dataframe, None for the numeric columns with no values at all."""
+
+    def sql_type_of_no_values(col):
+        # a string column, e.g., the DV product overrides, is TEXT regardless of its values, as in `to_sql()`
+        if not pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            return "TEXT"
+        return None  # no information on the type from this chunk
+
+    return {
+        col: (
+            _SQL_TYPES.get(pd.api.types.infer_dtype(df[col], skipna=True), "TEXT")
+            if not df[col].isna().all()
+            else sql_type_of_no_values(col)
+        )
+        for col in df.columns
+    }
+
+
+def _merge_sql_types(sql_types_list):
+    """Merge the sql types of the chunks of a table, each in the form of `_get_sql_types_of_df()`."""
+    sql_types = {}
+    for chunk_sql_types in sql_types_list:
+        for col, sql_type in chunk_sql_types.items():
+            prev_sql_type = sql_types.get(col)
+            if sql_type is None:
+                sql_types.setdefault(col, None)
+            elif prev_sql_type is None or prev_sql_type == sql_type:
+                sql_types[col] = sql_type
+            elif {prev_sql_type, sql_type} == {"INTEGER", "REAL"}:
+                sql_types[col] = "REAL"
+            else:
+                sql_types[col] = "TEXT"
+    # columns with no values at all would be float (all NaN) in pandas
+    return {col: sql_type if sql_type is not None else "REAL" for col, sql_type in sql_types.items()}
+
+
+def _get_sql_types_of_chunks(dfs):
+    """Determine the sql types of the columns of the table made up of the given chunks of dataframes.
+
+    The types are the same as if the chunks were concatenated into one dataframe for `to_sql()`.
+    It is needed as the type of a column in a chunk could differ from the one of the whole table,
+    e.g., an int column in one chunk could be a float column in others because of missing values.
+    """
+    return _merge_sql_types(_get_sql_types_of_df(df) for df in dfs)
+
+
+def _create_tcestats_tables_of_df(con, df):
+    """Create the tables of the tcestats of the columns of the dataframe, in the form of ``_to_db_df()``:
+    the main table, and the details table if there are columns not in the main table (the full db).
+    """
+    main_cols, details_cols = _split_db_columns(df.columns)
+    db_utils.create_table(con, _DB_TABLE, df[main_cols], primary_key=_DB_PRIMARY_KEY)
+    if len(details_cols) > 0:
+        db_utils.create_table(con, _DB_DETAILS_TABLE, df[_DB_PRIMARY_KEY + details_cols], primary_key=_DB_PRIMARY_KEY)
+
+
+def _create_tcestats_table(con, sql_types):
+    # use a one-row sample of the columns to generate the same DDL as `to_sql()`
+    sample_values = {"TEXT": "", "REAL": 0.0, "INTEGER": 0}
+    df_sample = pd.DataFrame({col: [sample_values[t]] for col, t in sql_types.items()})
+    _create_tcestats_tables_of_df(con, df_sample)
+
+
+def _insert_tcestats(con, df):
+    """Insert the tcestats, in the form of ``_to_db_df()``, to the main table (and the details table of the full db)."""
+    main_cols, details_cols = _split_db_columns(df.columns)
+    db_utils.insert_df(con, _DB_TABLE, df[main_cols])
+    if len(details_cols) > 0:
+        db_utils.insert_df(con, _DB_DETAILS_TABLE, df[_DB_PRIMARY_KEY + details_cols])
+
+
+def _export_tcestats_as_db(minimal_db=False, chunksize=None, quantize=False):
+    """Convert the master csv to the db.
+
+    If ``chunksize`` is specified, the master csv is read and converted in chunks of the given
+    number of rows, so that the memory needed is bounded. The resulting db is the same.
+
+    ``quantize``: store the columns in ``_DB_QUANTIZED_COLUMNS`` as scaled integers, see ``download_all_data()``.
+    """
+    usecols = None if not minimal_db else _MIN_DB_COLS
+    with build_profiler.stage("export_db"):
+        if chunksize is None:
+            with build_profiler.stage("read_master_csv") as st:
+                df = _read_tcestats_csv(
+                    usecols=usecols,
+                )
+                st.set_rows(len(df))
+            with build_profiler.stage("to_db_df") as st:
+                df = _to_db_df(df, minimal_db, quantize)
+                st.set_rows(len(df))
+
+            _build_tcestats_db([df], minimal_db, quantize=quantize)
+        else:
+
+            def read_db_df_chunks():
+                for df_chunk in _read_tcestats_csv(usecols=usecols, chunksize=chunksize):
+                    yield _to_db_df(df_chunk, minimal_db, quantize)
+
+            # first pass: determine the table schema, the same as the one from a non-chunked export
+            with build_profiler.stage("db_schema"):
+                sql_types = _get_sql_types_of_chunks(read_db_df_chunks())
+            _build_tcestats_db(read_db_df_chunks(), minimal_db, sql_types=sql_types, quantize=quantize)
+
+    # keep the manifest in sync in case the db is re-exported with a different minimal_db / quantize,
+    # so that a subsequent incremental build would not update the db of another schema
+    manifest = _read_build_manifest()
+    if manifest is not None and (
+        manifest.get("minimal_db") != minimal_db or manifest.get("quantize", False) != quantize
+    ):
+        _save_build_manifest(minimal_db, manifest["sectors"], manifest.get("master_csv", True), quantize=quantize)
+
+
+def _build_tcestats_db(dfs, minimal_db, sql_types=None, quantize=False):
+    """Create the db from the tcestats, given as an iterable of dataframes in the form of `_to_db_df()`.
+
+    ``sql_types``: the sql types of the columns. If not specified, they are determined
+    from the first dataframe, the same way as ``to_sql()``.
+    """
+    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
+    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
 
     Path(db_path_tmp).unlink(missing_ok=True)
-    con = sqlite3.connect(db_path_tmp)
+    con = db_utils.connect_for_bulk_load(db_path_tmp)
     try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
-        df.to_sql("tess_tcestats", con, if_exists="replace", index=False)
+        if sql_types is not None:
+            _create_tcestats_table(con, sql_types)
+        for i, df in enumerate(dfs):
+            with build_profiler.stage("db_insert") as st:
+                if i == 0 and sql_types is None:
+                    _create_tcestats_tables_of_df(con, df)
+                # insert in the primary key order, to fill the pages of the clustered tables sequentially
+                _insert_tcestats(con, df.sort_values(_DB_PRIMARY_KEY))
+                st.set_rows(len(df))
+
+        # no separate index on ticid is needed: it is the leading column of the primary key
+
+        with build_profiler.stage("db_finalize"):
+            _finalize_tcestats_db(con, minimal_db, quantize)
+    finally:
+        con.close()
+
+    staged_outputs.move_into_place(db_path_tmp, db_path)
 
-        # nice-to-have, but not critical
-        sql_index = "create index tess_tcestats_ticid on tess_tcestats(ticid);"
+
+def _finalize_tcestats_db(con, minimal_db, quantize=False):
+    _create_sectors_table_and_view(con, minimal_db, quantize)
+
+    _save_high_watermarks_to_db(con)
+    _save_db_metadata(con, minimal_db, quantize)
+
+    db_utils.finalize_db(con)
+
+
+def _update_tcestats_db(dfs, sectors_to_replace, minimal_db, quantize=False):
+    """Replace the rows of the given sectors in the existing db with the new tcestats."""
+    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
+    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
+
+    # update a copy of the existing db, so that the existing one is intact in case of errors
+    shutil.copyfile(db_path, db_path_tmp)
+    con = db_utils.connect_for_bulk_load(db_path_tmp)
+    try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
         cursor = con.cursor()
-        cursor.execute(sql_index)
+        for table in [_DB_TABLE] if minimal_db else [_DB_TABLE, _DB_DETAILS_TABLE]:
+            cursor.executemany(
+                f"delete from {table} where sectors_id = ?;",
+                [(int(sectors_id),) for sectors_id in db_utils.to_sectors_id(sectors_to_replace)],
+            )
+        cursor.execute("drop table high_watermarks;")
         cursor.close()
 
-        if minimal_db:  # create dvs, dvm, dvm as generated columns to save space
-            # generated column is available from SQLite version 3.31.0 (2020-01-22).
-            # So modern Python3 would all work.
-            # https://www.sqlite.org/gencol.html
-            # OPEN: Check sqlite version to guard against old version with `sqlite3.sqlite_version_info`
+        for df in dfs:
+            with build_profiler.stage("db_insert") as st:
+                df = _to_db_df(df, minimal_db, quantize)
+                _insert_tcestats(con, df)
+                st.set_rows(len(df))
+
+        with build_profiler.stage("db_finalize"):
+            # the sectors of the deleted / new rows
+            db_utils.create_sectors_table(con, _DB_TABLE)
+            _save_high_watermarks_to_db(con)
+            # of the db as updated, with a new build id
+            _save_db_metadata(con, minimal_db, quantize)
+
+            # also reclaims the space of the deleted rows
+            db_utils.finalize_db(con)
+    finally:
+        con.close()
+
+    staged_outputs.move_into_place(db_path_tmp, db_path)
+
+
+#
+# Partitioned (multi-node) build: the sectors are split into contiguous ranges (partitions),
+# each built into a partial db (and csv) independently, e.g., on separate machines.
+# The partials are then merged into the final db, identical to the one from a single-node build.
+#
+
+_PARTIAL_BUILD_INFO_TABLE = "partial_build_info"
+
+_PARTIAL_DB_GLOB = f"{Path(TCESTATS_DBNAME).stem}.part-*-of-*.db"
+
+
+def _partial_filename(partition, num_partitions, ext):
+    # e.g., tess_tcestats.part-000-of-004.db
+    return f"{Path(TCESTATS_DBNAME).stem}.part-{partition:03d}-of-{num_partitions:03d}.{ext}"
+
+
+def _get_partition(sector_sources, partition, num_partitions):
+    """Return the sector sources of the given partition (0-based).
+
+    The partitions are contiguous ranges of the sources, so that the partials concatenated in the order
+    of the partitions are in the same order as the ones of a single-node build.
+    """
+    if not 0 <= partition < num_partitions:
+        raise ValueError(f"partition must be in [0, {num_partitions}), actual={partition}")
+    if num_partitions > len(sector_sources):
+        raise ValueError(f"num_partitions {num_partitions} is more than the number of sectors {len(sector_sources)}")
+    start = len(sector_sources) * partition // num_partitions
+    end = len(sector_sources) * (partition + 1) // num_partitions
+    return sector_sources[start:end]
+
+
+def build_partial_db(
+    partition,
+    num_partitions,
+    minimal_db=False,
+    extract_source_urls=True,
+    num_workers=None,
+    compression=None,
+    partial_dir=None,
+    source_archive=None,
+    quantize=False,
+):
+    """Build the partial db and csv of the given partition (0-based) of the sectors, for a multi-node build.
+
+    Only the sources of the partition are downloaded. The partial db and csv are written to
+    ``partial_dir`` (default: the data dir), to be combined with ``merge_partial_dbs()``.
+
+    ``source_archive``: read the sources from the archive(s) instead, see ``download_all_data()``.
+
+    ``quantize``: see ``download_all_data()``. All the partials of a build need to be built with the same one.
+
+    Returns the path of the partial db.
+    """
+    if partial_dir is None:
+        partial_dir = DATA_BASE_DIR
+
+    if extract_source_urls:
+        spec.extract_and_save_source_urls_to_file()
+
+    if source_archive is None:
+        # the partition is determined from the spec, as the local paths are resolved after the download
+        sources_of_partition = _get_partition(_get_sector_sources(), partition, num_partitions)
+        _download_sources([s["dv_sh_url"] for s in sources_of_partition], compression)
+        _download_sources([s["tcestats_url"] for s in sources_of_partition], compression)
+
+    sector_sources = _get_partition(_get_sector_sources(source_archive), partition, num_partitions)
+    with build_profiler.stage("hash_sources") as st:
+        sector_infos = {s["sectors_val"]: _get_sector_source_info(s) for s in sector_sources}
+        st.set_rows(len(sector_infos))
+
+    # the tcestats go through the csv, as in a single-node build, so that the values in the db are the same
+    csv_path = f"{partial_dir}/{_partial_filename(partition, num_partitions, 'csv')}"
+    Path(f"{csv_path}.tmp").unlink(missing_ok=True)
+    for source, df in _get_sector_tcestats_of_sources(sector_sources, num_workers):
+        print(f"DEBUG appending to partial tcestats csv from: {source['tcestats_path']}")
+        _append_to_tcestats_csv(df, f"{csv_path}.tmp")
+        sector_infos[source["sectors_val"]]["num_rows"] = len(df)
+    shutil.move(f"{csv_path}.tmp", csv_path)
+
+    db_path = f"{partial_dir}/{_partial_filename(partition, num_partitions, 'db')}"
+    Path(f"{db_path}.tmp").unlink(missing_ok=True)
+    with build_profiler.stage("export_db"):
+        usecols = None if not minimal_db else _MIN_DB_COLS
+        df = _to_db_df(_read_tcestats_csv(csv_path, usecols=usecols), minimal_db, quantize)
+
+        con = db_utils.connect_for_bulk_load(f"{db_path}.tmp")
+        try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
+            with build_profiler.stage("db_insert") as st:
+                _create_tcestats_tables_of_df(con, df)
+                _insert_tcestats(con, df.sort_values(_DB_PRIMARY_KEY))
+                st.set_rows(len(df))
+
+            # the info needed to merge the partials: the sql types are those of the values of the partition,
+            # to be merged with the ones of the other partitions to get the ones of the whole table
+            info = dict(
+                partition=partition,
+                num_partitions=num_partitions,
+                minimal_db=minimal_db,
+                quantize=quantize,
+                sql_types=_get_sql_types_of_df(df),
+                sectors=sector_infos,
+            )
             cursor = con.cursor()
-            cursor.executescript("""\
-ALTER TABLE tess_tcestats
-ADD COLUMN dvs GENERATED ALWAYS AS
-('tess' || _dv_date_time || '-' || sectors || '-' || substr('0000000000000000'|| ticid, -16, 16)  || '-' ||  substr('00' || tce_plnt_num, -2, 2) || '-' ||  substr('00000' || _dv_pin, -5, 5) || '_dvs.pdf');
-
-ALTER TABLE tess_tcestats
-ADD COLUMN dvm GENERATED ALWAYS AS
-('tess' || _dv_date_time || '-' || sectors || '-' || substr('0000000000000000'|| ticid, -16, 16)  || '-' ||  substr('00000' || _dv_pin, -5, 5) || '_dvm.pdf');
-
-ALTER TABLE tess_tcestats
-ADD COLUMN dvr GENERATED ALWAYS AS
-('tess' || _dv_date_time || '-' || sectors || '-' || substr('0000000000000000'|| ticid, -16, 16)  || '-' ||  substr('00000' || _dv_pin, -5, 5) || '_dvr.pdf');
-            """)
+            cursor.execute(f"create table {_PARTIAL_BUILD_INFO_TABLE}(key text, value text);")
+            cursor.executemany(
+                f"insert into {_PARTIAL_BUILD_INFO_TABLE} (key, value) values (?, ?);",
+                [(k, json.dumps(v)) for k, v in info.items()],
+            )
             cursor.close()
+            con.commit()
+        finally:
+            con.close()
+    shutil.move(f"{db_path}.tmp", db_path)
+
+    return db_path
 
-        _save_high_watermarks_to_db(con)
 
-        con.commit()
+def _read_partial_build_info(db_path):
+    con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = con.execute(f"select key, value from {_PARTIAL_BUILD_INFO_TABLE};").fetchall()
     finally:
         con.close()
+    return {k: json.loads(v) for k, v in rows}
+
+
+def merge_partial_dbs(partial_db_paths=None):
+    """Merge the partial dbs (and csvs, if all are present) from ``build_partial_db()`` into the final
+    db (and master csv). The result is the same as the one of a single-node build.
+
+    ``partial_db_paths``: default is all the partial dbs in the data dir.
+    """
+    if partial_db_paths is None:
+        partial_db_paths = sorted(str(p) for p in Path(DATA_BASE_DIR).glob(_PARTIAL_DB_GLOB))
+    if len(partial_db_paths) == 0:
+        raise ValueError("No partial db to merge")
+
+    infos = [_read_partial_build_info(p) for p in partial_db_paths]
+    partials = sorted(zip(infos, partial_db_paths), key=lambda info_path: info_path[0]["partition"])
+    num_partitions = partials[0][0]["num_partitions"]
+    minimal_db = partials[0][0]["minimal_db"]
+    quantize = partials[0][0].get("quantize", False)
+    if [info["partition"] for info, _ in partials] != list(range(num_partitions)) or any(
+        info["num_partitions"] != num_partitions for info, _ in partials
+    ):
+        raise ValueError(
+            f"The partial dbs do not make up all partitions: {[(i['partition'], i['num_partitions']) for i in infos]}"
+        )
+    if any(info["minimal_db"] != minimal_db for info, _ in partials):
+        raise ValueError("The partial dbs are a mix of minimal and full dbs")
+    if any(info.get("quantize", False) != quantize for info, _ in partials):
+        raise ValueError("The partial dbs are a mix of quantized and non-quantized dbs")
+
+    sql_types = _merge_sql_types(info["sql_types"] for info, _ in partials)
+    main_cols, details_cols = _split_db_columns(sql_types)
+    cols_of_tables = {_DB_TABLE: main_cols}
+    if len(details_cols) > 0:
+        cols_of_tables[_DB_DETAILS_TABLE] = _DB_PRIMARY_KEY + details_cols
 
-    shutil.move(db_path_tmp, db_path)
+    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
+    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
+    Path(db_path_tmp).unlink(missing_ok=True)
+    con = db_utils.connect_for_bulk_load(db_path_tmp)
+    try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
+        _create_tcestats_table(con, sql_types)
+        for info, partial_db_path in partials:
+            with build_profiler.stage("db_insert", f"partition {info['partition']}"):
+                con.execute("attach database ? as partial;", (partial_db_path,))
+                for table, cols in cols_of_tables.items():
+                    col_names = ", ".join(f'"{col}"' for col in cols)
+                    con.execute(f"insert into {table} ({col_names}) select {col_names} from partial.{table};")
+                # ATTACH / DETACH cannot be run within a transaction
+                con.commit()
+                con.execute("detach database partial;")
+
+        with build_profiler.stage("db_finalize"):
+            _finalize_tcestats_db(con, minimal_db, quantize)
+    finally:
+        con.close()
+    staged_outputs.move_into_place(db_path_tmp, db_path)
+
+    # the master csv: the partial csvs concatenated in the order of the partitions
+    partial_csv_paths = [str(Path(p).with_suffix(".csv")) for _, p in partials]
+    master_csv = all(os.path.isfile(p) for p in partial_csv_paths)
+    if master_csv:
+        dest_csv_tmp = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}.tmp"
+        with open(dest_csv_tmp, "wb") as f_out:
+            for i, partial_csv_path in enumerate(partial_csv_paths):
+                with open(partial_csv_path, "rb") as f_in:
+                    if i > 0:
+                        f_in.readline()  # skip the header
+                    shutil.copyfileobj(f_in, f_out)
+        staged_outputs.move_into_place(dest_csv_tmp, f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}")
+
+    sector_infos = {}
+    for info, _ in partials:
+        sector_infos.update(info["sectors"])
+    _save_build_manifest(minimal_db, sector_infos, master_csv=master_csv, quantize=quantize)
 
 
 if __name__ == "__main__":
@@ -424,6 +1384,55 @@ if __name__ == "__main__":
         default=False,
         help="make the sqlite db minimal for typical use cases / webapp usage",
     )
+    parser.add_argument(
+        "--quantize",
+        dest="quantize",
+        action="store_true",
+        default=False,
+        help="store the numeric columns of known precision as scaled integers, for a smaller sqlite db",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        default=False,
+        help="only ingest the sectors that are new or changed since the last build",
+    )
+    parser.add_argument(
+        "--num_workers",
+        dest="num_workers",
+        type=int,
+        default=None,
+        help="number of worker processes to ingest the sectors in parallel. Default is serial.",
+    )
+    parser.add_argument(
+        "--stream_to_db",
+        dest="stream_to_db",
+        action="store_true",
+        default=False,
+        help="write each sector to the sqlite db directly, without converting from the master csv",
+    )
+    parser.add_argument(
+        "--no_csv",
+        dest="write_csv",
+        action="store_false",
+        default=True,
+        help="do not write the master csv. Only applicable with --stream_to_db",
+    )
+    parser.add_argument(
+        "--chunksize",
+        dest="chunksize",
+        type=int,
+        default=None,
+        help="convert the master csv to sqlite db in chunks of the given number of rows, to bound the memory needed",
+    )
+    parser.add_argument(
+        "--compression",
+        dest="compression",
+        choices=["gzip", "zstd", "auto"],
+        default=None,
+        help="store the downloaded csvs / scripts compressed. auto: zstd if package zstandard is installed, else gzip",
+    )
     parser.add_argument(
         "--db_only",
         dest="db_only",
@@ -431,6 +1440,41 @@ if __name__ == "__main__":
         default=False,
         help="only convert the local master csv to sqlite db, without rebuilding the csv from sources",
     )
+    parser.add_argument(
+        "--partition",
+        dest="partition",
+        default=None,
+        help="build the partial db of a partition of the sectors for a multi-node build, "
+        "in the form of <i>/<n>, 0-based, e.g., 0/4 for the first of 4 partitions",
+    )
+    parser.add_argument(
+        "--partial_dir",
+        dest="partial_dir",
+        default=None,
+        help="the directory to write the partial db / csv to. Default is the data directory",
+    )
+    parser.add_argument(
+        "--merge_partials",
+        dest="merge_partials",
+        nargs="*",
+        default=None,
+        help="merge the given partial dbs (default: all in the data directory) into the final db",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+        help=f"record the time, rows and peak memory of each build stage to {BUILD_PROFILE_FILENAME}",
+    )
+    parser.add_argument(
+        "--source_archive",
+        dest="source_archive",
+        nargs="+",
+        default=None,
+        help="read the sector csvs / dv scripts from the given tarballs / zip files, "
+        "without downloading or extracting them. The source URLs are from the local json config file",
+    )
 
     args = parser.parse_args()
     if not args.update:
@@ -438,9 +1482,38 @@ if __name__ == "__main__":
         parser.print_help()
         parser.exit()
 
-    if not args.db_only:
-        print(f"Downloading data to create master csv, minimal_db={args.minimal_db}")
-        download_all_data(minimal_db=args.minimal_db)
-    else:
-        print(f"Convert master csv to db, minimal_db={args.minimal_db}")
-        _export_tcestats_as_db(args.minimal_db)
+    with build_profiler.profiling("spoc", f"{DATA_BASE_DIR}/{BUILD_PROFILE_FILENAME}", enabled=args.profile):
+        if args.partition is not None:
+            partition, num_partitions = (int(v) for v in args.partition.split("/"))
+            print(f"Downloading data to create partial db {partition}/{num_partitions}, minimal_db={args.minimal_db}")
+            build_partial_db(
+                partition,
+                num_partitions,
+                minimal_db=args.minimal_db,
+                num_workers=args.num_workers,
+                compression=args.compression,
+                partial_dir=args.partial_dir,
+                extract_source_urls=args.source_archive is None,
+                source_archive=args.source_archive,
+                quantize=args.quantize,
+            )
+        elif args.merge_partials is not None:
+            print("Merge partial dbs to create the final db")
+            merge_partial_dbs(args.merge_partials if len(args.merge_partials) > 0 else None)
+        elif not args.db_only:
+            print(f"Downloading data to create master csv, minimal_db={args.minimal_db}")
+            download_all_data(
+                minimal_db=args.minimal_db,
+                incremental=args.incremental,
+                num_workers=args.num_workers,
+                stream_to_db=args.stream_to_db,
+                write_csv=args.write_csv,
+                chunksize=args.chunksize,
+                compression=args.compression,
+                extract_source_urls=args.source_archive is None,
+                source_archive=args.source_archive,
+                quantize=args.quantize,
+            )
+        else:
+            print(f"Convert master csv to db, minimal_db={args.minimal_db}")
+            _export_tcestats_as_db(args.minimal_db, chunksize=args.chunksize, quantize=args.quantize)
@@ -27,6 +27,97 @@ else:
 R_EARTH_TO_R_JUPITER = 6378.1 / 71492
 
 
+#
+# Sector coverage of the TCEs, i.e., the sectors a TCE has observations in, as integer bitmasks:
+# bit i of column tce_sectors_mask_<w> is set if sector 63 * w + i is covered.
+# 63 bits per mask, so that the masks are non-negative in SQLite (signed 64-bit integers).
+#
+SECTORS_MASK_BITS = 63
+SECTORS_MASK_COLUMNS = [f"tce_sectors_mask_{w}" for w in range(4)]  # up to sector 251
+
+# the bit pattern of the sectors in tce_sectors of the csvs covers sectors 0 - 79 only
+_TCE_SECTORS_NUM_SECTORS = 80
+
+
+def to_sectors_masks(tce_sectors, sectors):
+    """Convert the sector coverage of the TCEs to the bitmasks in ``SECTORS_MASK_COLUMNS``.
+
+    ``tce_sectors``: the bit pattern of the sectors covered, e.g., ``0111101111`` for sectors 1 - 4, 6 - 9.
+    ``sectors``: the sectors of the TCEs, e.g., ``s0001-s0009``.
+
+    ``tce_sectors`` in the csvs is truncated beyond sector 79. The coverage is rebuilt from ``sectors``
+    where ``tce_sectors`` is inaccurate:
+    - a single-sector TCE covers its sector,
+    - a multi-sector TCE is assumed to cover all of its sectors beyond sector 79 (or all if tce_sectors is missing),
+      i.e., the number of sectors is an upper bound for such TCEs.
+    """
+    sectors = pd.Series(sectors)
+    start = sectors.str.slice(1, 5).astype("int64").to_numpy()
+    end = sectors.str.slice(7, 11).astype("int64").to_numpy()
+    num_rows = len(sectors)
+    num_bits = SECTORS_MASK_BITS * len(SECTORS_MASK_COLUMNS)
+    if num_rows > 0 and end.max() >= num_bits:
+        raise ValueError(f"Sectors beyond the bitmasks (up to sector {num_bits - 1}): {sectors[end >= num_bits].iloc[0]}")
+
+    # the bit pattern as a (num_rows, num_bits) boolean matrix
+    tce_sectors = pd.Series(tce_sectors)
+    is_missing = tce_sectors.isna().to_numpy()
+    patterns = tce_sectors.fillna("").str.slice(0, _TCE_SECTORS_NUM_SECTORS).str.ljust(_TCE_SECTORS_NUM_SECTORS, "0")
+    covered = np.zeros((num_rows, num_bits), dtype=bool)
+    covered[:, :_TCE_SECTORS_NUM_SECTORS] = (
+        np.frombuffer("".join(patterns).encode("ascii"), dtype=np.uint8).reshape(num_rows, _TCE_SECTORS_NUM_SECTORS)
+        == ord("1")
+    )
+
+    sector_nums = np.arange(num_bits)
+    in_span = (sector_nums >= start[:, None]) & (sector_nums <= end[:, None])
+    is_single = start == end
+    covered[is_single] = in_span[is_single]
+    beyond_pattern = np.where(is_missing, 0, _TCE_SECTORS_NUM_SECTORS)
+    covered |= in_span & ~is_single[:, None] & (sector_nums >= beyond_pattern[:, None])
+
+    masks = {}
+    for w, col in enumerate(SECTORS_MASK_COLUMNS):
+        # the bits of the mask, padded to 64 bits, packed to a little-endian uint64
+        bits = np.zeros((num_rows, 64), dtype=bool)
+        bits[:, :SECTORS_MASK_BITS] = covered[:, w * SECTORS_MASK_BITS : (w + 1) * SECTORS_MASK_BITS]
+        masks[col] = np.packbits(bits, axis=1, bitorder="little").view("<u8").reshape(-1).astype("int64")
+    return pd.DataFrame(masks, index=sectors.index)
+
+
+def _popcount(values):
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):  # numpy 2.0+
+        return np.bitwise_count(values).astype("int64")
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1).astype("int64")
+
+
+def count_sectors(df):
+    """Return the number of sectors covered by the TCEs, from the bitmasks in ``SECTORS_MASK_COLUMNS``."""
+    return sum(_popcount(df[col].to_numpy()) for col in SECTORS_MASK_COLUMNS)
+
+
+def _to_mask_bit(sector):
+    """Return the index of the mask in ``SECTORS_MASK_COLUMNS`` and the bit of the sector in the mask."""
+    sector = int(sector)
+    num_bits = SECTORS_MASK_BITS * len(SECTORS_MASK_COLUMNS)
+    if not 0 <= sector < num_bits:
+        raise ValueError(f"Sector beyond the bitmasks (0 - {num_bits - 1}): {sector}")
+    return divmod(sector, SECTORS_MASK_BITS)
+
+
+def covers_sector(df, sector):
+    """Return a boolean array of whether the TCEs cover the given sector, from the bitmasks."""
+    w, i = _to_mask_bit(sector)
+    return (df[SECTORS_MASK_COLUMNS[w]].to_numpy() >> i) & 1 == 1
+
+
+def sql_covers_sector(sector):
+    """Return the sql condition of whether the TCEs cover the given sector, from the bitmasks."""
+    w, i = _to_mask_bit(sector)
+    return f"({SECTORS_MASK_COLUMNS[w]} >> {i}) & 1 = 1"
+
+
 # Common Pandas Display formatters
 def format_exomast_id(id_str):
     """Format exomast_id as a clickable link."""
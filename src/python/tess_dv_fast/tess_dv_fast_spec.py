@@ -14,6 +14,75 @@ DATA_BASE_DIR = str((Path(_BASE_PATH) / "data" / "tess_dv_fast").resolve())
 TCESTATS_FILENAME = "tess_tcestats.csv"
 TCESTATS_DBNAME = "tess_tcestats.db"
 SOURCE_URLS_FILENAME = "tess_dv_fast_spec.json"
+BUILD_MANIFEST_FILENAME = "tess_tcestats_manifest.json"
+BUILD_PROFILE_FILENAME = "tess_tcestats_build_profile.json"
+# the pre-rendered html of the TCEs of both SPOC and TESS-SPOC for the webapp, see tce_html
+TCE_HTML_DBNAME = "tess_tce_html.db"
+
+# Declared dtypes of the columns of the tcestats csvs, both the raw sector csvs and the master csv,
+# applied at parse time so that pandas does not infer them (int64 / object for everything non-float).
+# The columns not listed are floats.
+TCESTATS_CSV_DTYPES = {
+    "exomast_id": str,
+    "tceid": str,
+    "ticid": "int64",  # TIC ids can be over the range of int32
+    "tce_plnt_num": "int32",  # part of the key of a TCE, never blank
+    "sectors": str,
+    "lastUpdate": str,
+    "tce_limbdark_mod": "category",
+    "tce_trans_mod": "category",
+    # the flags and the counts are nullable, so that a blank value does not fail the parsing
+    "tce_full_conv": "boolean",
+    "tcet_full_conv": "boolean",
+    # counts
+    "tce_num_transits": "Int32",
+    "tce_chisqgofdof": "Int32",
+    "tce_ntoi": "Int32",
+    "tcet_model_dof": "Int32",
+    "bootstrap_transit_count": "Int32",
+    # keep the bit pattern as is, e.g., "01" for sector 1,
+    # rather than having it parsed as an integer
+    "tce_sectors": str,
+    # provenance of the stellar parameters, a handful of distinct values such as "TIC8.1", "Solar"
+    "tce_steff_prov": "category",
+    "tce_slogg_prov": "category",
+    "tce_smet_prov": "category",
+    "tce_sradius_prov": "category",
+    "tce_sdensity_prov": "category",
+    # filenames of the DV products in the master csv
+    "dvs": str,
+    "dvm": str,
+    "dvr": str,
+    "dvr_xml": str,
+    "dvt": str,
+}
+
+# Columns that can be read as float32 when low precision is acceptable, e.g., for exploratory analysis.
+# The periods, epochs, depths, etc., are kept as float64.
+TCESTATS_CSV_LOW_PRECISION_COLS = [
+    # the uncertainties
+    "tce_period_err", "tce_time0bt_err", "tce_time0_err", "tce_ror_err", "tce_dor_err",
+    "tce_incl_err", "tce_impact_err", "tce_duration_err", "tce_ingress_err", "tce_depth_err",
+    "tce_eccen_err", "tce_longp_err", "tce_prad_err", "tce_sma_err", "tce_eqt_err", "tce_insol_err",
+    "tce_steff_err", "tce_slogg_err", "tce_smet_err", "tce_sradius_err", "tce_sdensity_err",
+    "tcet_period_err", "tcet_time0bt_err", "tcet_time0_err", "tcet_duration_err", "tcet_ingress_err",
+    "tcet_depth_err", "tce_albedo_err", "tce_ptemp_err",
+    "tce_dicco_mra_err", "tce_dicco_mdec_err", "tce_dicco_msky_err",
+    "tce_ditco_mra_err", "tce_ditco_mdec_err", "tce_ditco_msky_err",
+    "tce_ditco_jra_err", "tce_ditco_jdec_err", "tce_ditco_jsky_err",
+    # the stellar parameters and the derived quantities
+    "tce_steff", "tce_slogg", "tce_smet", "tce_sradius", "tce_sdensity",
+    "tce_eqt", "tce_insol", "tce_albedo", "tce_ptemp",
+    "tce_ldm_coeff1", "tce_ldm_coeff2", "tce_ldm_coeff3", "tce_ldm_coeff4",
+]
+
+
+def get_tcestats_csv_dtypes(low_precision: bool = False) -> dict:
+    """Return the `dtype` argument of `pd.read_csv()` for the tcestats csvs."""
+    dtypes = TCESTATS_CSV_DTYPES.copy()
+    if low_precision:
+        dtypes.update({col: "float32" for col in TCESTATS_CSV_LOW_PRECISION_COLS})
+    return dtypes
 
 # csv source: https://archive.stsci.edu/tess/bulk_downloads/bulk_downloads_tce.html
 # sh source: https://archive.stsci.edu/tess/bulk_downloads/bulk_downloads_ffi-tp-lc-dv.html
@@ -1,23 +1,25 @@
 from functools import cache
+import hashlib
 import logging
+import os
 import re
 
 from flask import Flask
-from flask import request
+from flask import make_response, request
 from markupsafe import escape
 
 from . import tess_dv_fast  # standard SPOC TCEs
 from . import tess_spoc_dv_fast  # HLSP TESS-SPOC TCEs
+from . import tce_html
 
 
 app = Flask(__name__)
 log = logging.getLogger(__name__)
 
 # Configuration constants
-SPOC_SORTABLE_COLUMNS = [0, 4, 5, 6, 7, 8, 9, 10, 11]
-SPOC_TABLE_ID = "table_spoc"
-TESS_SPOC_TABLE_ID = "table_tess_spoc"
 EXOFOP_BASE_URL = "https://exofop.ipac.caltech.edu/tess/target.php"
+# serve the pre-rendered html of the TCEs if available, see tce_html
+USE_PRERENDERED_HTML = os.environ.get("TESS_TCES_PRERENDERED_HTML", "").lower() in ("1", "true")
 
 
 @cache
@@ -97,77 +99,6 @@ def _render_home():
     )
 
 
-def _apply_table_styling(
-    content: str, table_id: str, sortable_cols: list = None
-) -> str:
-    """Apply standard table styling and sorting to rendered content.
-
-    Args:
-        content: HTML content from display_tce_infos()
-        table_id: ID to assign to the table
-        sortable_cols: List of column indices to make sortable
-
-    Returns:
-        Styled HTML content
-    """
-    # custom id for the table for javascript functions
-    content = re.sub('<table id="[^"]+"', f'<table id="{table_id}"', content)
-
-    if sortable_cols:
-        # make table searchable / sortable by https://github.com/javve/list.js
-        content = content.replace("<tbody", '<tbody class="list"')
-        for i in sortable_cols:
-            content = content.replace(
-                f'class="col_heading level0 col{i}"',
-                f'class="col_heading level0 col{i} sort" data-sort="col{i}"',
-            )
-
-    return content
-
-
-def _render_spoc_content(df_spoc):
-    """Render SPOC TCE content as HTML.
-
-    Returns:
-        HTML content string
-    """
-    spoc_content = tess_dv_fast.display_tce_infos(
-        df_spoc, return_as="html", no_tce_html="No SPOC TCE"
-    )
-    spoc_content = _apply_table_styling(
-        spoc_content, SPOC_TABLE_ID, SPOC_SORTABLE_COLUMNS
-    )
-    return spoc_content
-
-
-def _render_tess_spoc_content(df_tess_spoc):
-    """Render TESS-SPOC TCE content as HTML.
-
-    Returns:
-        HTML content with TESS-SPOC table and duplicate-hiding controls
-    """
-    if len(df_tess_spoc) < 1:
-        # no TESS-SPOC: render nothing
-        return ""
-
-    # case have TESS-SPOC content
-    tess_spoc_content = tess_spoc_dv_fast.display_tce_infos(
-        df_tess_spoc, return_as="html"
-    )
-    tess_spoc_content = _apply_table_styling(tess_spoc_content, TESS_SPOC_TABLE_ID)
-
-    tess_spoc_content = f"""
-<hr>
-<h2>TESS-SPOC TCEs</h2>
-<div id="tessSpocDupCtr">
-  <span id="tessSpocDupMsg"></span>
-  <button id="hideShowInSpocCtl" onclick="document.body.classList.toggle('show_in_spoc');"></button>
-</div>
-{tess_spoc_content}
-"""
-    return tess_spoc_content
-
-
 def _render_error(error_msg: str, status_code: int = 400) -> tuple:
     """Render error page with given message and status code.
 
@@ -213,23 +144,48 @@ def _render_error(error_msg: str, status_code: int = 400) -> tuple:
     )
 
 
-@app.route("/tces")
-def tces():
-    """Main search endpoint for TESS TCEs."""
-    tic = request.args.get("tic", None)
+def _get_etag(key: str):
+    """Return the ETag of the page of the given key, e.g., the TIC. The page is the same until either db
+    (or the webapp) is rebuilt, so it is derived from the build ids of the dbs, without querying the data.
 
-    # case return search form
-    if tic is None:
-        return _render_home()
+    Returns:
+        The ETag, or None if the build ids are not available, e.g., dbs of older builds
+    """
+    try:
+        build_ids = [
+            (metadata or {}).get("build_id")
+            for metadata in [tess_dv_fast.get_db_metadata(), tess_spoc_dv_fast.get_db_metadata()]
+        ]
+    except Exception as e:
+        log.error(f"Reading db metadata failed: {type(e).__name__}: {e}")
+        return None
+    if None in build_ids:
+        return None
+    return hashlib.sha256("|".join(build_ids + [get_build_sha(), key]).encode("utf-8")).hexdigest()[:32]
 
-    # Validate TIC input
-    tic = tic.strip() if isinstance(tic, str) else tic
-    if not tic:
-        return _render_error("TIC cannot be empty.")
-    if not re.match(r"^\d+$", tic):
-        return _render_error(f"Invalid TIC: {escape(tic)}. Must be a positive integer.")
 
-    # case do actual search by tic
+def _not_modified_response(etag):
+    """Return the 304 Not Modified response if the client has the page of the ETag cached, None otherwise."""
+    if etag is None or not request.if_none_match.contains(etag):
+        return None
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
+
+
+def _response_with_etag(html: str, etag):
+    response = make_response(html)
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def _query_and_render(tic):
+    """Query the TCEs of the TIC and render them.
+
+    Returns:
+        ``tce_html.TceHtml``, or the error page tuple of (HTML content, status code) on failure
+    """
     try:
         df_spoc = tess_dv_fast.get_tce_infos_of_tic(tic)
         df_tess_spoc = tess_spoc_dv_fast.get_tce_infos_of_tic(tic)
@@ -240,10 +196,8 @@ def tces():
             status_code=500,
         )
 
-    # Render content
     try:
-        spoc_content = _render_spoc_content(df_spoc)
-        tess_spoc_content = _render_tess_spoc_content(df_tess_spoc)
+        return tce_html.render_tce_html(df_spoc, df_tess_spoc)
     except Exception as e:
         log.error(f"Content rendering failed for TIC {tic}: {type(e).__name__}: {e}")
         return _render_error(
@@ -251,14 +205,117 @@ def tces():
             status_code=500,
         )
 
+
+@app.route("/tces/details")
+def tce_details():
+    """All the parameters of a SPOC TCE, fetched on demand, e.g., /tces/details?id=TIC261136679S0001S0001TCE1"""
+    tce_id = request.args.get("id", "").strip()
+    if not re.match(r"^TIC\d+S\d{4}S\d{4}TCE\d+$", tce_id, re.IGNORECASE):
+        return _render_error(f"Invalid TCE id: {escape(tce_id)}. Must be in the form of TIC261136679S0001S0001TCE1.")
+
+    etag = _get_etag(f"details={tce_id.upper()}")
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        tce = tess_dv_fast.get_tce_details(tce_id)
+    except Exception as e:
+        log.exception(f"Query failed for TCE {tce_id}: {type(e).__name__}: {e}")
+        return _render_error(
+            f"Database query failed. Please try again later. (Details: {escape(str(e))})",
+            status_code=500,
+        )
+    if tce is None:
+        return _render_error(f"TCE not found: {escape(tce_id)}", status_code=404)
+
+    # the values as is, rather than rounded to the display precision of pandas. They are escaped by to_html()
+    df_tce = tce.astype(str).to_frame(name="value")
+    params_html = df_tce.to_html(border=0)
+    tce_id_escaped = escape(tce["exomast_id"])
+    html = f"""\
+<!DOCTYPE html>
+<html>
+    <head>
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <link rel="icon" href="data:,">
+        <title>TCE {tce_id_escaped}</title>
+        <style type="text/css">
+            body {{
+                margin-left: 16px;
+                font-family: sans-serif;
+            }}
+            table {{
+                border-collapse: collapse;
+                font-size: 0.9rem;
+            }}
+            th, td {{
+                padding: 3px 10px;
+                text-align: left;
+            }}
+            tbody tr:nth-child(even) {{
+                background-color: #f5f5f5
+            }}
+        </style>
+    </head>
+    <body>
+        <h1>TCE {tce_id_escaped}</h1>
+        {params_html}
+        <hr>
+        <footer>
+            <a href="/tces?tic={escape(str(tce["ticid"]))}">All TCEs of the TIC</a> |
+            <a href="/tces">New Search</a>
+        </footer>
+    </body>
+</html>
+"""
+    return _response_with_etag(html, etag)
+
+
+@app.route("/tces")
+def tces():
+    """Main search endpoint for TESS TCEs."""
+    tic = request.args.get("tic", None)
+
+    # case return search form
+    if tic is None:
+        return _render_home()
+
+    # Validate TIC input
+    tic = tic.strip() if isinstance(tic, str) else tic
+    if not tic:
+        return _render_error("TIC cannot be empty.")
+    if not re.match(r"^\d+$", tic):
+        return _render_error(f"Invalid TIC: {escape(tic)}. Must be a positive integer.")
+
+    etag = _get_etag(f"tic={tic}")
+    not_modified = _not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
+    # case do actual search by tic
+    rendered = None
+    if USE_PRERENDERED_HTML:
+        try:
+            rendered = tce_html.get_prerendered_tce_html(tic)
+        except Exception as e:
+            # fall back to query and render the TCEs
+            log.error(f"Reading pre-rendered html failed for TIC {tic}: {type(e).__name__}: {e}")
+
+    if rendered is None:
+        rendered = _query_and_render(tic)
+        if not isinstance(rendered, tce_html.TceHtml):
+            return rendered  # the error page
+    spoc_content, tess_spoc_content = rendered.spoc_html, rendered.tess_spoc_html
+
     # Escape TIC for safe display in HTML (XSS protection)
     # - be extra defensive, as it's been validated as a number in earlier codes.
     tic_escaped = escape(tic)
-    total_num_tces = len(df_spoc) + len(df_tess_spoc)
+    total_num_tces = rendered.num_spoc_tces + rendered.num_tess_spoc_tces
 
     # Log successful query
     log.info(
-        f"Query for TIC {tic}: found {len(df_spoc)} SPOC TCEs, {len(df_tess_spoc)} TESS-SPOC TCEs"
+        f"Query for TIC {tic}: found {rendered.num_spoc_tces} SPOC TCEs, {rendered.num_tess_spoc_tces} TESS-SPOC TCEs"
     )
 
     # Generate CSS for styling
@@ -379,7 +436,7 @@ addHideShowForTessSpocDupRows();
 """
 
     # assemble the overall result HTML
-    return f"""\
+    html = f"""\
 <!DOCTYPE html>
 <html>
     <head>
@@ -415,3 +472,4 @@ addHideShowForTessSpocDupRows();
     </body>
 </html>
 """
+    return _response_with_etag(html, etag)
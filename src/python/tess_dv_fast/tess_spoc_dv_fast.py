@@ -18,6 +18,7 @@ from typing import Callable, Optional, Union
 import numpy as np
 import pandas as pd
 
+from . import db_utils
 from .tess_dv_fast_common import ARRAY_LIKE_TYPES
 from .tess_spoc_dv_fast_spec import (
     DATA_BASE_DIR,
@@ -38,12 +39,23 @@ def _query_tcestats_from_db(sql: str, **kwargs) -> pd.DataFrame:
         return df
 
 
+# the standard sort order of TCEs: by ticid, then the ones spanning more sectors first
+# (see `sectors_span` in _add_helpful_columns_to_tcestats()), then by id.
+# - sectors_span is from the sectors table of the db, e.g., for s0014-s0086, it is 86 - 14 + 1 = 73
+# - id is the same as the one generated by _add_helpful_columns_to_tcestats()
+_SQL_ORDER_BY = (
+    "order by ticid,"
+    " sectors_span desc,"
+    " 'TIC' || ticid || upper(replace(sectors, '-', '')) || 'TCE' || tce_plnt_num || '_F'"
+)
+
+
 def _get_tcestats_of_tic_from_db(
     tic: Union[int, float, str, tuple, list],
 ) -> pd.DataFrame:
     if isinstance(tic, (int, float, str)) or np.isscalar(tic):
         return _query_tcestats_from_db(
-            "select * from tess_spoc_tcestats where ticid = ?",
+            f"select * from tess_spoc_tcestats where ticid = ? {_SQL_ORDER_BY}",
             params=[int(tic)],
         )
     elif isinstance(tic, ARRAY_LIKE_TYPES):
@@ -55,7 +67,7 @@ def _get_tcestats_of_tic_from_db(
         tic = [int(v) for v in tic]
         in_params_place_holder = ",".join(["?" for i in range(len(tic))])
         return _query_tcestats_from_db(
-            f"select * from tess_spoc_tcestats where ticid in ({in_params_place_holder})",
+            f"select * from tess_spoc_tcestats where ticid in ({in_params_place_holder}) {_SQL_ORDER_BY}",
             params=tic,
         )
     else:
@@ -108,7 +120,8 @@ def _add_helpful_columns_to_tcestats(df: pd.DataFrame) -> None:
         ticid = str(ticid).zfill(16)
         return f"hlsp_tess-spoc_tess_phot_{ticid}-{sectors}_tess_v1_dvr.pdf"
 
-    df["sectors_span"] = [get_sectors_span(s) for s in df["sectors"]]
+    if "sectors_span" not in df.columns:  # it is resolved from the sectors table by the db query
+        df["sectors_span"] = [get_sectors_span(s) for s in df["sectors"]]
     df["dvs"] = [dvs_fname(r) for _, r in df.iterrows()]
     df["dvm"] = [dvm_fname(r) for _, r in df.iterrows()]
     df["dvr"] = [dvr_fname(r) for _, r in df.iterrows()]
@@ -123,13 +136,10 @@ def get_tce_infos_of_tic(
 ) -> pd.DataFrame:
     # df = _read_tcestats_csv()  # for testing without db
     # df = df[df["ticid"] == tic]
+    # the result is in the standard sort order, sorted by the query,
+    # so that it is predictable for tce_filter_func
     df = _get_tcestats_of_tic_from_db(tic)
     _add_helpful_columns_to_tcestats(df)
-    # sort the result to the standard form
-    # so that it is predictable for tce_filter_func
-    df = df.sort_values(
-        by=["ticid", "sectors_span", "id"], ascending=[True, False, True]
-    )
     if tce_filter_func is not None and len(df) > 0:
         df = tce_filter_func(df)
 
@@ -226,3 +236,14 @@ def get_high_watermarks() -> dict[str, str]:
             high_watermarks_dict[row[0]] = row[1]
         cursor.close()
     return high_watermarks_dict
+
+
+def get_db_metadata() -> Optional[dict]:
+    """Return the metadata of the TESS-SPOC db: ``schema_version``, ``build_id`` (unique to a build),
+    ``build_time``, ``minimal_db``, ``num_rows_of_sectors``, ``sources_hash``, etc.
+    None for a db of an older build without the metadata.
+
+    It is cached until the db is replaced, e.g., by a new build, i.e., it is cheap to call per request,
+    e.g., to key the caches of the query results by ``build_id``.
+    """
+    return db_utils.read_metadata(f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}")
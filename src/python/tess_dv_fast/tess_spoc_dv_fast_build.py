@@ -1,19 +1,22 @@
 """Build and manage TESS-SPOC TCE master CSV and SQLite database."""
 
+from concurrent.futures import ProcessPoolExecutor
 import os
 from pathlib import Path
 import re
-import sqlite3
 import shutil
 
+import numpy as np
 import pandas as pd
 
 from .tess_spoc_dv_fast_spec import (
+    BUILD_PROFILE_FILENAME,
     DATA_BASE_DIR,
     TCESTATS_FILENAME,
     TCESTATS_DBNAME,
 )
 
+from . import build_profiler, db_utils, download_utils, staged_outputs
 from . import tess_spoc_dv_fast_spec as spec
 
 
@@ -25,8 +28,9 @@ def _filename(url):
         raise ValueError(f"Failed to extract filename from url: {url}")
 
 
-def _get_tess_dv_products_of_sectors(sectors):
+def _get_dv_script_path(sectors, source_archive=None):
     # sectors: the value of sectors column in csv, e.g., s0001-s0001, s0002-s0072
+    # source_archive: the archive(s) to read the script from, if specified
     sector_start, sector_end = sectors.split("-")
     if sector_start == sector_end:
         # case single sector
@@ -38,54 +42,121 @@ def _get_tess_dv_products_of_sectors(sectors):
         script_name = (
             f"{DATA_BASE_DIR}/hlsp_tess-spoc_tess_phot_{sectors}_tess_v1_dl-dv.sh"
         )
-
-    df = pd.read_csv(
-        script_name,
-        comment="#",
-        sep=" ",
-        names=["curl", "f", "create_dirs", "C", "output", "filename", "url"],
+    # the script could have been downloaded compressed
+    return download_utils.resolve_local_filename(script_name, source_archive)
+
+
+# dvs filenames in hlsp_tess-spoc_*_dl-dv.sh are in a fixed layout, e.g.,
+#   hlsp_tess-spoc_tess_phot_0000000033979459-s0056-s0069_tess_v1_dvs-01.pdf
+#   hlsp_tess-spoc_tess_phot_0000000033979459-s0036_tess_v1_dvs-01.pdf
+#   ^                        ^                                  ^ ^
+#   0                        25 (ticid)                       -7 -6 (tce_plnt_num, from the end)
+# format reference: https://archive.stsci.edu/hlsp/tess-spoc
+#
+# the regex matches the dvs filename in the output field, i.e., the one followed by the url (a space),
+# not the one at the end of the url. The literal prefix lets the regex engine skip to the candidates quickly.
+_DVS_FILENAME_REGEX = rb"hlsp_tess-spoc_tess_phot_\d{16}-s\d{4}(?:-s\d{4})?_tess_v1_dvs-\d+\.pdf(?= )"
+
+
+def _parse_dvs_filenames(script_name):
+    """Parse the dvs filenames in a hlsp_tess-spoc_*_dl-dv.sh in a single pass.
+
+    Returns a table of the TCEs of the dvs, with columns ``ticid`` and ``tce_plnt_num``, in the order of the script.
+    """
+    with download_utils.open_file(script_name) as f:
+        # each line is in the form of: curl -f --create-dirs --output <filename> <url>
+        # extract only the dvs filenames with a regex over the entire content, much faster than
+        # reading all the columns of all the products, and parsing the filenames line by line
+        filenames = re.findall(_DVS_FILENAME_REGEX, f.read())
+
+    # extract the ticid and tce_plnt_num from their fixed positions in the filenames,
+    # as a 2D array of characters (padded with null bytes)
+    names = np.array(filenames, dtype="S")
+    chars = names.view(np.uint8).reshape(len(names), names.itemsize)
+    rows = np.arange(len(names))
+    lengths = np.char.str_len(names)
+
+    if len(names) > 0 and not (chars[rows, lengths - 7] == ord("-")).all():
+        # the position of tce_plnt_num is from the end, assuming it is 2 digits
+        raise ValueError(f"Unexpected dvs filename layout in {script_name}: tce_plnt_num is not 2 digits")
+
+    def to_int(digits):
+        digits = digits.astype(np.int64) - ord("0")
+        return digits @ (10 ** np.arange(digits.shape[1] - 1, -1, -1, dtype=np.int64))
+
+    return pd.DataFrame(
+        {
+            "ticid": to_int(chars[:, 25:41]),
+            "tce_plnt_num": to_int(np.stack([chars[rows, lengths - 6], chars[rows, lengths - 5]], axis=1)),
+        }
     )
-    df = df[["filename"]]
-
-    return df
 
 
-def _get_tess_tcestats_csv(sectors_val):
-    filename = _get_tess_dv_products_of_sectors(sectors_val)["filename"]
-    # convert the list of filenames to a table that is subset of the SPOC csv,
+def _get_tess_tcestats_csv(sectors_val, source_archive=None):
+    with build_profiler.stage("parse_dv_script", sectors_val) as st:
+        dvs = _parse_dvs_filenames(_get_dv_script_path(sectors_val, source_archive))
+        st.set_rows(len(dvs))
+    # convert the dvs filenames to a table that is subset of the SPOC csv,
     # - with columns ticid, tce_plnt_num, sectors,
     # - columns dvs, dvm, dvr skipped, as they can be dynamically created
 
-    # we can get all the info needed from dvs pdf names
-    dvs_filename = filename[filename.str.contains("_dvs")]
-    dvs = dvs_filename.str.extract(
-        rf"hlsp_tess-spoc_tess_phot_0+?(?P<ticid>[1-9]\d+)-s.+_tess_v1_dvs-0+?(?P<tce_plnt_num>[1-9]\d*).pdf"
-    )
-    dvs.ticid = dvs.ticid.astype("int64")
-    dvs.tce_plnt_num = dvs.tce_plnt_num.astype(int)
-
     # in case multiple runs for the same TIC-sector, use the last one only
-    dvs = dvs.groupby(by=["ticid", "tce_plnt_num"], as_index=False).last()
+    dvs = dvs.drop_duplicates(subset=["ticid", "tce_plnt_num"], keep="last")
+    dvs = dvs.sort_values(["ticid", "tce_plnt_num"]).reset_index(drop=True)
     dvs["sectors"] = sectors_val
 
     return dvs
 
 
-def _append_to_tcestats_csv(sectors_val, dest):
-    print(f"DEBUG appending to master tess_spoc tcestats csv from: {sectors_val}")
-
-    # the tcestats csv of a sector
-    df = _get_tess_tcestats_csv(sectors_val)
-
-    # only write header when the file is first created
-    write_header = not os.path.isfile(dest)
-    df.to_csv(dest, index=False, header=write_header, mode="a")
-
-
-def download_all_data(extract_source_urls=True):
-    """Download all relevant data locally."""
-    from . import download_utils
-
+def _get_tess_tcestats_of_sectors(sectors_vals, source_archive=None, num_workers=None):
+    """Yield the tcestats of the given sectors, in the same order as the sectors.
+
+    If ``num_workers`` is greater than 1, the dv scripts are parsed in parallel in a process pool.
+    """
+    if num_workers is None or num_workers <= 1:
+        for sectors_val in sectors_vals:
+            yield sectors_val, _get_tess_tcestats_csv(sectors_val, source_archive)
+        return
+
+    # the tcestats of a sector is small (3 columns), so the results are not bounded as in the SPOC build
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(
+                build_profiler.call_profiled,
+                build_profiler.is_enabled(),
+                _get_tess_tcestats_csv,
+                sectors_val,
+                source_archive,
+            )
+            for sectors_val in sectors_vals
+        ]
+        for sectors_val, future in zip(sectors_vals, futures):
+            df, stage_records = future.result()
+            build_profiler.add_records(stage_records)
+            yield sectors_val, df
+
+
+def _append_to_tcestats_csv(df, dest):
+    with build_profiler.stage("append_csv", df["sectors"].iloc[0] if len(df) > 0 else None) as st:
+        # only write header when the file is first created
+        write_header = not os.path.isfile(dest)
+        df.to_csv(dest, index=False, header=write_header, mode="a")
+        st.set_rows(len(df))
+
+
+def download_all_data(extract_source_urls=True, compression=None, source_archive=None, num_workers=None):
+    """Download all relevant data locally.
+
+    ``compression``: if specified (``"gzip"``, ``"zstd"`` or ``"auto"``), the downloaded
+    dv sh scripts are stored compressed. They are read without being decompressed to disk.
+
+    ``source_archive``: if specified, the path (or a list of paths) of the tarballs / zip files
+    of the dv sh scripts, e.g., for offline builds. The scripts are read from the archives directly,
+    without being downloaded or extracted to disk.
+
+    If ``num_workers`` is greater than 1, the dv sh scripts are parsed in parallel with
+    the given number of worker processes. The result is identical to the serial build.
+    """
     def get_sectors_val(filename):
         # eg, hlsp_tess-spoc_tess_phot_s0036_tess_v1_dl-dv.sh
         match = re.search(r"_(s\d{4})_tess", filename)
@@ -104,29 +175,28 @@ def download_all_data(extract_source_urls=True):
 
     # dv products download scripts (for urls to the products)
     # - they need to be first downloaded: as creating master csv below relies on the scripts
-    filename_list = []
-    for url in spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector:
-        filename = _filename(url)
-        filepath, is_cache_used = download_utils.download_file(
-            url,
-            filename=filename,
-            download_dir=DATA_BASE_DIR,
-            return_is_cache_used=True,
-        )
-        if not is_cache_used:
-            print(f"DEBUG Downloaded to {filepath} from: {url}")
-
-        filename_list.append(filename)
+    urls = spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector
+    filename_list = [_filename(url) for url in urls]
+    if source_archive is None:
+        with build_profiler.stage("download") as st:
+            results = download_utils.download_files(
+                zip(urls, filename_list),
+                download_dir=DATA_BASE_DIR,
+                progress_func=download_utils.print_download_progress,
+                compression=compression,
+            )
+            st.set_rows(sum(1 for _, is_cache_used in results if not is_cache_used))  # the number of files downloaded
 
     # for tce stats csv files, download and merge them to a single csv
     # - first write to a temporary master csv. Once done, overwrite the existing master (if any)
     dest_csv_tmp = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}.tmp"
     dest_csv = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
     Path(dest_csv_tmp).unlink(missing_ok=True)
-    for filename in filename_list:
-        sectors_val = get_sectors_val(filename)
-        _append_to_tcestats_csv(sectors_val, dest_csv_tmp)
-    shutil.move(dest_csv_tmp, dest_csv)
+    sectors_vals = [get_sectors_val(filename) for filename in filename_list]
+    for sectors_val, df in _get_tess_tcestats_of_sectors(sectors_vals, source_archive, num_workers):
+        print(f"DEBUG appending to master tess_spoc tcestats csv from: {sectors_val}")
+        _append_to_tcestats_csv(df, dest_csv_tmp)
+    staged_outputs.move_into_place(dest_csv_tmp, dest_csv)
 
     # convert the master csv into a sqlite db for speedier query by ticid
     print(f"DEBUG Convert master tess-spoc tcestats csv to sqlite db...")
@@ -162,35 +232,60 @@ def _save_high_watermarks_to_db(con):
 
 def _read_tcestats_csv():
     # the master csv is barebone, and meant to be used internally for converting to sqlite db
-    csv_path = f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}"
+    # the master csv of the current build, if it is not put in place yet
+    csv_path = staged_outputs.current_path(f"{DATA_BASE_DIR}/{TCESTATS_FILENAME}")
     return pd.read_csv(csv_path, comment="#")
 
 
-def _export_tcestats_as_db():
-    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
-    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
-
-    df = _read_tcestats_csv()
+# the table of the tcestats rows. They are queried with the view ``tess_spoc_tcestats``
+_DB_TABLE = "tess_spoc_tcestats_data"
 
-    Path(db_path_tmp).unlink(missing_ok=True)
-    con = sqlite3.connect(db_path_tmp)
-    try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
-        df.to_sql("tess_spoc_tcestats", con, if_exists="replace", index=False)
 
-        sql_index = (
-            "create index tess_spoc_tcestats_ticid on tess_spoc_tcestats(ticid);"
-        )
-        cursor = con.cursor()
-        cursor.execute(sql_index)
-        cursor.close()
+def _save_db_metadata(con):
+    # the db has all the data of the sources, there is no minimal db of TESS-SPOC
+    sources = spec.sources_dv_sh_single_sector + spec.sources_dv_sh_multi_sector
+    db_utils.save_metadata(
+        con, db_utils.new_build_metadata("tess_spoc", con, _DB_TABLE, sources=sources, minimal_db=False)
+    )
 
-        _save_high_watermarks_to_db(con)
 
-        con.commit()
-    finally:
-        con.close()
+def _export_tcestats_as_db():
+    db_path_tmp = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}.tmp"
+    db_path = f"{DATA_BASE_DIR}/{TCESTATS_DBNAME}"
 
-    shutil.move(db_path_tmp, db_path)
+    with build_profiler.stage("export_db"):
+        with build_profiler.stage("read_master_csv") as st:
+            df = _read_tcestats_csv()
+            st.set_rows(len(df))
+
+        # replace the sectors (text) with the id in the sectors table, in place
+        df.insert(df.columns.get_loc("sectors"), "sectors_id", db_utils.to_sectors_id(df["sectors"]).to_numpy())
+        df = df.drop(columns=["sectors"])
+
+        Path(db_path_tmp).unlink(missing_ok=True)
+        con = db_utils.connect_for_bulk_load(db_path_tmp)
+        try:  # use try / finally instead of with ... because sqlite3 context manager does not close the connection
+            with build_profiler.stage("db_insert") as st:
+                # clustered by the primary key, so that the TCEs of a TIC are stored together.
+                # No separate index on ticid is needed: it is the leading column of the primary key
+                primary_key = ["ticid", "sectors_id", "tce_plnt_num"]
+                db_utils.create_table(con, _DB_TABLE, df, primary_key=primary_key)
+                db_utils.insert_df(con, _DB_TABLE, df.sort_values(primary_key))
+                st.set_rows(len(df))
+
+            with build_profiler.stage("db_finalize"):
+                # the rows reference the sectors table by sectors_id.
+                # the view, named as the table was, has the sectors (text), so that the queries of the db are unchanged
+                db_utils.create_sectors_table(con, _DB_TABLE)
+                db_utils.create_view_with_sectors(con, "tess_spoc_tcestats", _DB_TABLE)
+                _save_high_watermarks_to_db(con)
+                _save_db_metadata(con)
+
+                db_utils.finalize_db(con)
+        finally:
+            con.close()
+
+        staged_outputs.move_into_place(db_path_tmp, db_path)
 
 
 # Build and update the DB / master csv from command line
@@ -204,6 +299,20 @@ if __name__ == "__main__":
         action="store_true",
         help="Update master csv and sqlite db.",
     )
+    parser.add_argument(
+        "--compression",
+        dest="compression",
+        choices=["gzip", "zstd", "auto"],
+        default=None,
+        help="store the downloaded scripts compressed. auto: zstd if package zstandard is installed, else gzip",
+    )
+    parser.add_argument(
+        "--num_workers",
+        dest="num_workers",
+        type=int,
+        default=None,
+        help="number of worker processes to parse the dv scripts in parallel. Default is serial.",
+    )
     parser.add_argument(
         "--db_only",
         dest="db_only",
@@ -211,6 +320,21 @@ if __name__ == "__main__":
         default=False,
         help="only convert the local master csv to sqlite db, without rebuilding the csv from sources",
     )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+        help=f"record the time, rows and peak memory of each build stage to {BUILD_PROFILE_FILENAME}",
+    )
+    parser.add_argument(
+        "--source_archive",
+        dest="source_archive",
+        nargs="+",
+        default=None,
+        help="read the dv scripts from the given tarballs / zip files, "
+        "without downloading or extracting them. The source URLs are from the local json config file",
+    )
 
     args = parser.parse_args()
     if not args.update:
@@ -218,10 +342,16 @@ if __name__ == "__main__":
         parser.print_help()
         parser.exit()
 
-    if not args.db_only:
-        print(f"Downloading data to create master csv and sqlite db")
-        download_all_data()
-    else:
-        # primarily for debugging
-        print(f"Convert master tess-spoc csv to db")
-        _export_tcestats_as_db()
+    with build_profiler.profiling("tess-spoc", f"{DATA_BASE_DIR}/{BUILD_PROFILE_FILENAME}", enabled=args.profile):
+        if not args.db_only:
+            print(f"Downloading data to create master csv and sqlite db")
+            download_all_data(
+                extract_source_urls=args.source_archive is None,
+                compression=args.compression,
+                source_archive=args.source_archive,
+                num_workers=args.num_workers,
+            )
+        else:
+            # primarily for debugging
+            print(f"Convert master tess-spoc csv to db")
+            _export_tcestats_as_db()
@@ -14,6 +14,7 @@ DATA_BASE_DIR = str((Path(_BASE_PATH) / "data" / "tess_dv_fast").resolve())
 TCESTATS_FILENAME = "tess_spoc_tcestats.csv"
 TCESTATS_DBNAME = "tess_spoc_tcestats.db"
 SOURCE_URLS_FILENAME = "tess_spoc_dv_fast_spec.json"
+BUILD_PROFILE_FILENAME = "tess_spoc_tcestats_build_profile.json"
 
 
 # Sources at: https://archive.stsci.edu/hlsp/tess-spoc
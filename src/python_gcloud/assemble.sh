@@ -29,6 +29,13 @@ mkdir -p $dest/data/tess_dv_fast
 # --update --archive
 cp --update --archive  $proj_base/data/tess_dv_fast/tess_tcestats.db  $dest/data/tess_dv_fast
 cp --update --archive  $proj_base/data/tess_dv_fast/tess_spoc_tcestats.db  $dest/data/tess_dv_fast
+# the pre-rendered html of the TCEs, if built, served with env var TESS_TCES_PRERENDERED_HTML=1
+prerendered_html_db=$proj_base/data/tess_dv_fast/tess_tce_html.db
+if [ -f "$prerendered_html_db" ]; then
+    cp --update --archive  $prerendered_html_db  $dest/data/tess_dv_fast
+else
+    rm -f $dest/data/tess_dv_fast/tess_tce_html.db
+fi
 
 cp --update --archive  $base/*  $dest
 cp --update --archive  $base/.*  $dest
@@ -40,7 +47,7 @@ cp --update --archive  $proj_base/src/python/tess_dv_fast/*.py  $dest/tess_dv_fa
 echo $commit_sha > $dest/build.txt
 
 echo SQLite database included in the deployment:
-ls -l $dest/data/tess_dv_fast/tess*_tcestats.db
+ls -l $dest/data/tess_dv_fast/*.db
 
 echo
 echo Sources assembled. You can do the following for actual deployment:
@@ -49,4 +56,9 @@ echo cd $dest
 echo "# sanity test locally"
 echo python main.py
 echo "# actual deployment with Google Cloud SDK"
-echo gcloud run deploy --source .
+if [ -f "$prerendered_html_db" ]; then
+    echo "# to serve the pre-rendered html of the TCEs"
+    echo gcloud run deploy --source . --set-env-vars TESS_TCES_PRERENDERED_HTML=1
+else
+    echo gcloud run deploy --source .
+fi
@@ -0,0 +1,64 @@
+from importlib import reload
+from pathlib import Path
+
+import pytest
+
+from tess_dv_fast import tess_spoc_dv_fast_spec, tess_spoc_dv_fast_build, tess_spoc_dv_fast
+from tess_dv_fast import tess_dv_fast_spec, tess_dv_fast_build, tess_dv_fast
+
+
+def _write_dv_script(path, sectors, tces):
+    """Write a hlsp_tess-spoc_*_dl-dv.sh of the given TCEs, (ticid, tce_plnt_num), in the MAST layout."""
+    base_url = "https://archive.stsci.edu/hlsps/tess-spoc"
+    lines = ["#!/bin/sh"]
+    for ticid, tce_plnt_num in tces:
+        prefix = f"hlsp_tess-spoc_tess_phot_{ticid:016d}-{sectors}_tess_v1"
+        target_dir = f"{sectors.split('-')[0]}/target/{ticid:016d}"
+        for suffix in [f"dvs-{tce_plnt_num:02d}.pdf", "dvm.pdf", "dvr.pdf", "dvr.xml"]:
+            lines.append(
+                f"curl -f --create-dirs --output ./{target_dir}/{prefix}_{suffix} {base_url}/{target_dir}/{prefix}_{suffix}"
+            )
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def tess_spoc_data_dir(tmp_path, monkeypatch):
+    """TESS-SPOC data dir with synthetic dv scripts of 2 single-sectors and 1 multi-sector."""
+    scripts = {
+        "s0036": [(33979459, 1), (33979459, 2), (261136679, 1), (9006668, 1)],
+        "s0037": [(9006668, 1), (261136679, 1), (261136679, 1)],  # a duplicate run of a TCE
+        "s0036-s0069": [(1234567890, 3), (33979459, 1)],
+    }
+    for sectors, tces in scripts.items():
+        _write_dv_script(tmp_path / f"hlsp_tess-spoc_tess_phot_{sectors}_tess_v1_dl-dv.sh", sectors, tces)
+
+    monkeypatch.setattr(tess_spoc_dv_fast_spec, "DATA_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(tess_spoc_dv_fast_build, "DATA_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(tess_spoc_dv_fast, "DATA_BASE_DIR", str(tmp_path))
+    url_base = "https://archive.stsci.edu/hlsps/tess-spoc/download_scripts"
+    monkeypatch.setattr(
+        tess_spoc_dv_fast_spec,
+        "sources_dv_sh_single_sector",
+        [f"{url_base}/hlsp_tess-spoc_tess_phot_{s}_tess_v1_dl-dv.sh" for s in ["s0036", "s0037"]],
+    )
+    monkeypatch.setattr(
+        tess_spoc_dv_fast_spec,
+        "sources_dv_sh_multi_sector",
+        [f"{url_base}/hlsp_tess-spoc_tess_phot_s0036-s0069_tess_v1_dl-dv.sh"],
+    )
+    return tmp_path
+
+
+@pytest.fixture
+def spoc_data_dir():
+    """Use the SPOC test data, along with the synthetic TESS-SPOC ones."""
+    tess_dv_fast_spec.DATA_BASE_DIR = str((Path(__file__).parent / "data" / "tess_dv_fast").resolve())
+    reload(tess_dv_fast_build)
+    reload(tess_dv_fast)
+
+    yield Path(tess_dv_fast_spec.DATA_BASE_DIR)
+
+    reload(tess_dv_fast_spec)
+    reload(tess_dv_fast_build)
+    reload(tess_dv_fast)
@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+from importlib import reload
+
+import pytest
+
+from tess_dv_fast import build_all, staged_outputs
+from tess_dv_fast import tess_dv_fast_spec, tess_dv_fast_build, tess_spoc_dv_fast_spec, tess_spoc_dv_fast_build
+
+
+@pytest.fixture
+def specs_for_test(tmp_path, monkeypatch):
+    """Use the SPOC test data, and an empty data dir for TESS-SPOC"""
+    tess_dv_fast_spec.DATA_BASE_DIR = str((Path(__file__).parent / "data" / "tess_dv_fast").resolve())
+    reload(tess_dv_fast_build)
+
+    tess_spoc_dir = tmp_path / "tess_spoc"
+    tess_spoc_dir.mkdir()
+    monkeypatch.setattr(tess_spoc_dv_fast_spec, "sources_dv_sh_single_sector", [])
+    monkeypatch.setattr(tess_spoc_dv_fast_spec, "sources_dv_sh_multi_sector", [])
+    monkeypatch.setattr(tess_spoc_dv_fast_spec, "DATA_BASE_DIR", str(tess_spoc_dir))
+    monkeypatch.setattr(tess_spoc_dv_fast_build, "DATA_BASE_DIR", str(tess_spoc_dir))
+
+    yield
+
+    reload(tess_dv_fast_spec)
+    reload(tess_dv_fast_build)
+
+
+def _spoc_output_paths():
+    data_dir = tess_dv_fast_spec.DATA_BASE_DIR
+    return [
+        f"{data_dir}/{name}"
+        for name in [
+            tess_dv_fast_spec.TCESTATS_FILENAME,
+            tess_dv_fast_spec.TCESTATS_DBNAME,
+            tess_dv_fast_spec.BUILD_MANIFEST_FILENAME,
+        ]
+    ]
+
+
+def _build_tess_spoc_stub(compression):
+    with staged_outputs.deferred() as moves:
+        db_path = f"{tess_spoc_dv_fast_spec.DATA_BASE_DIR}/{tess_spoc_dv_fast_spec.TCESTATS_DBNAME}"
+        Path(f"{db_path}.tmp").write_text("stub")
+        staged_outputs.move_into_place(f"{db_path}.tmp", db_path)
+    return moves
+
+
+def test_build_all(specs_for_test, monkeypatch):
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False)
+    inodes_before = [os.stat(p).st_ino for p in _spoc_output_paths()]
+
+    monkeypatch.setattr(build_all, "_build_tess_spoc", _build_tess_spoc_stub)
+    build_all.build_all(minimal_db=True, extract_source_urls=False)
+
+    # the outputs of both builds are put in place
+    assert [os.stat(p).st_ino for p in _spoc_output_paths()] != inodes_before
+    for p in _spoc_output_paths():
+        assert not os.path.exists(f"{p}.tmp")
+    assert Path(f"{tess_spoc_dv_fast_spec.DATA_BASE_DIR}/{tess_spoc_dv_fast_spec.TCESTATS_DBNAME}").read_text() == "stub"
+
+
+def test_build_all_one_fails(specs_for_test):
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False)
+    inodes_before = [os.stat(p).st_ino for p in _spoc_output_paths()]
+
+    # TESS-SPOC build fails, as there is no source
+    with pytest.raises(FileNotFoundError):
+        build_all.build_all(minimal_db=True, extract_source_urls=False)
+
+    # the existing SPOC outputs are intact, and the ones of the build are discarded
+    assert [os.stat(p).st_ino for p in _spoc_output_paths()] == inodes_before
+    for p in _spoc_output_paths():
+        assert not os.path.exists(f"{p}.tmp")
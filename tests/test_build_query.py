@@ -1,10 +1,29 @@
 from pathlib import Path
 from importlib import reload
+import gzip
+import json
+import re
+import shutil
+import sqlite3
+import sys
+import tarfile
+import zipfile
 
-from numpy.testing import assert_equal, assert_almost_equal
+import numpy as np
+from numpy.testing import assert_allclose, assert_equal, assert_almost_equal
+import pandas as pd
+from pandas.testing import assert_frame_equal
 import pytest
 
 from tess_dv_fast import tess_dv_fast_spec, tess_dv_fast_build, tess_dv_fast
+from tess_dv_fast import archive_utils, build_profiler, db_utils
+from tess_dv_fast.tess_dv_fast_common import (
+    SECTORS_MASK_COLUMNS,
+    count_sectors,
+    covers_sector,
+    sql_covers_sector,
+    to_sectors_masks,
+)
 
 @pytest.fixture(scope="module", autouse=True)
 def spec_for_test():
@@ -65,6 +84,21 @@ def test_build_query(minimal_db):
     # 1 TCE for each single sector, 2 TCEs for each multi-sector
     assert_equal(len(df), 6, "expected number of TCEs for pi Men in test data")
 
+    # in the standard sort order: the TCEs spanning more sectors first
+    assert_equal(
+        list(df["exomast_id"]),
+        [
+            "TIC261136679S0001S0096TCE1",
+            "TIC261136679S0001S0096TCE2",
+            "TIC261136679S0001S0009TCE1",
+            "TIC261136679S0001S0009TCE2",
+            "TIC261136679S0001S0001TCE1",
+            "TIC261136679S0095S0095TCE1",
+        ],
+    )
+    df_multi_tics = tess_dv_fast.get_tce_infos_of_tic([471013582, 261136679])
+    assert_equal(list(df_multi_tics["ticid"]), [261136679] * 6 + [471013582] * 3)
+
     # use  s0001-s0096
     _df = df[df["exomast_id"] == "TIC261136679S0001S0096TCE1"]
     assert_tic_offsets(_df, 20.8, 24.5, 24.5)
@@ -77,3 +111,636 @@ def test_build_query(minimal_db):
     high_watermarks_expected = {'single_sector': 's0095', 'multi_sector': 's0001-s0096'}
     high_watermarks_actual = tess_dv_fast.get_high_watermarks()
     assert_equal(high_watermarks_actual, high_watermarks_expected, "expected high watermarks")
+
+
+def _read_tcestats_from_test_db():
+    db_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.TCESTATS_DBNAME}"
+    con = sqlite3.connect(db_path)
+    try:
+        # all the columns, i.e., with the ones of the details table of the full db
+        (is_full_db,) = con.execute("select count(*) from sqlite_master where name = 'tess_tcestats_full';").fetchone()
+        df = pd.read_sql(f"select * from {'tess_tcestats_full' if is_full_db else 'tess_tcestats'}", con)
+    finally:
+        con.close()
+    return df.sort_values("exomast_id").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_build_incremental(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    df_full_build = _read_tcestats_from_test_db()
+
+    manifest = tess_dv_fast_build._read_build_manifest()
+    assert_equal(manifest["minimal_db"], minimal_db)
+    assert_equal(
+        list(manifest["sectors"].keys()),
+        ["s0001-s0001", "s0095-s0095", "s0001-s0009", "s0001-s0096"],
+    )
+    assert_equal(manifest["sectors"]["s0001-s0001"]["num_rows"], 5)
+
+    # case no changes in sources
+    sectors_changed, sectors_removed = tess_dv_fast_build._get_sectors_to_ingest(
+        manifest, manifest["sectors"]
+    )
+    assert_equal(sectors_changed, [])
+    assert_equal(sectors_removed, [])
+
+    # case a changed sector, a new sector (absent in the manifest), and a removed sector
+    manifest["sectors"]["s0001-s0009"]["tcestats"]["sha256"] = "changed"
+    del manifest["sectors"]["s0001-s0096"]
+    manifest["sectors"]["s0001-s0013"] = manifest["sectors"]["s0001-s0001"]
+    manifest_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.BUILD_MANIFEST_FILENAME}"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    tess_dv_fast_build.download_all_data(
+        minimal_db=minimal_db, extract_source_urls=False, incremental=True
+    )
+    df_incremental_build = _read_tcestats_from_test_db()
+    assert_frame_equal(df_incremental_build, df_full_build)
+
+    manifest = tess_dv_fast_build._read_build_manifest()
+    assert "s0001-s0013" not in manifest["sectors"]
+    assert_equal(manifest["sectors"]["s0001-s0096"]["num_rows"], 6)
+
+    df_csv = tess_dv_fast.read_tcestats_csv()
+    assert_equal(len(df_csv), len(df_full_build))
+
+
+def test_build_parallel_identical_to_serial():
+    data_dir = Path(tess_dv_fast_spec.DATA_BASE_DIR)
+    csv_path = data_dir / tess_dv_fast_spec.TCESTATS_FILENAME
+
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False)
+    csv_serial, db_serial = csv_path.read_bytes(), _dump_test_db()
+
+    tess_dv_fast_build.download_all_data(
+        minimal_db=True, extract_source_urls=False, num_workers=2
+    )
+    assert csv_path.read_bytes() == csv_serial
+    assert _dump_test_db() == db_serial
+
+
+def test_parse_dv_products_script():
+    script_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/tesscurl_sector_1_dv.sh"
+    df = tess_dv_fast_build._parse_dv_products_script(script_path)
+
+    assert_equal(len(df), 40)
+    assert_equal(
+        df["product_type"].value_counts().to_dict(),
+        {"dvs.pdf": 8, "dvm.pdf": 8, "dvr.pdf": 8, "dvr.xml": 8, "dvt.fits": 8},
+    )
+
+    row = df[(df["ticid"] == 261136679) & (df["product_type"] == "dvs.pdf")].iloc[0]
+    assert_equal(row["tce_plnt_num"], 1)
+    assert_equal(row["sectors"], "s0001-s0001")
+    assert_equal(row["date_time"], "2018206190142")
+    assert_equal(row["pin"], 366)
+    assert_equal(row["filename"], "tess2018206190142-s0001-s0001-0000000261136679-01-00366_dvs.pdf")
+
+    df_products = tess_dv_fast_build._get_dv_products_of_sectors("s0001-s0001", script_path)
+    assert_equal(
+        list(df_products.columns), ["ticid", "tce_plnt_num", "dvs", "dvm", "dvr", "dvr_xml", "dvt"]
+    )
+    # 5 TCEs, with the products of the last run for the TCEs with multiple runs
+    assert_equal(len(df_products), 5)
+    row = df_products[df_products["ticid"] == 261136679].iloc[0]
+    assert_equal(row["dvs"], "tess2018206190142-s0001-s0001-0000000261136679-01-00106_dvs.pdf")
+    assert_equal(row["dvr"], "tess2018206190142-s0001-s0001-0000000261136679-00366_dvr.pdf")
+
+
+def test_parse_dv_products_script_empty(tmp_path):
+    script_path = tmp_path / "tesscurl_sector_1_dv.sh"
+    script_path.write_text("#!/bin/sh\n")
+    df_full = tess_dv_fast_build._parse_dv_products_script(f"{tess_dv_fast_spec.DATA_BASE_DIR}/tesscurl_sector_1_dv.sh")
+    df = tess_dv_fast_build._parse_dv_products_script(str(script_path))
+
+    assert_equal(len(df), 0)
+    assert_equal(list(df.columns), list(df_full.columns))
+    assert_equal(df.dtypes.to_dict(), df_full.dtypes.to_dict())
+
+    df_products = tess_dv_fast_build._get_dv_products_of_sectors("s0001-s0001", str(script_path))
+    assert_equal(len(df_products), 0)
+    assert_equal(
+        list(df_products.columns), ["ticid", "tce_plnt_num", "dvs", "dvm", "dvr", "dvr_xml", "dvt"]
+    )
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_build_stream_to_db(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    df_from_csv = _read_tcestats_from_test_db()
+
+    csv_path = Path(tess_dv_fast_spec.DATA_BASE_DIR) / tess_dv_fast_spec.TCESTATS_FILENAME
+    csv_path.unlink()
+    tess_dv_fast_build.download_all_data(
+        minimal_db=minimal_db, extract_source_urls=False, stream_to_db=True, write_csv=False
+    )
+    assert not csv_path.exists()
+    assert_frame_equal(_read_tcestats_from_test_db(), df_from_csv)
+
+    # the master csv as a side output
+    tess_dv_fast_build.download_all_data(
+        minimal_db=minimal_db, extract_source_urls=False, stream_to_db=True
+    )
+    assert_equal(len(tess_dv_fast.read_tcestats_csv()), len(df_from_csv))
+
+
+def _dump_test_db():
+    db_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.TCESTATS_DBNAME}"
+    con = sqlite3.connect(db_path)
+    try:
+        # except the metadata unique to a build
+        return [
+            line
+            for line in con.iterdump()
+            if not re.match(r"""INSERT INTO "db_metadata" VALUES\('(build_id|build_time)'""", line)
+        ]
+    finally:
+        con.close()
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_export_db_chunked(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    db_dump = _dump_test_db()
+
+    # use a chunksize that does not divide the rows evenly
+    tess_dv_fast_build._export_tcestats_as_db(minimal_db=minimal_db, chunksize=4)
+    assert _dump_test_db() == db_dump
+
+
+def test_get_sql_types_of_chunks():
+    chunks = [
+        pd.DataFrame({"i": [1, 2], "f": [1, 2], "s": [np.nan, np.nan], "b": [True, False], "n": [np.nan, np.nan]}),
+        pd.DataFrame({"i": [3, 4], "f": [np.nan, 2.5], "s": ["Solar", "TIC8.2"], "b": [False, np.nan], "n": [np.nan, np.nan]}),
+    ]
+    assert_equal(
+        tess_dv_fast_build._get_sql_types_of_chunks(chunks),
+        {"i": "INTEGER", "f": "REAL", "s": "TEXT", "b": "INTEGER", "n": "REAL"},
+    )
+
+
+def test_read_tcestats_csv_dtypes():
+    tess_dv_fast_build.download_all_data(extract_source_urls=False)
+
+    df = tess_dv_fast.read_tcestats_csv()
+    assert_equal(df["tce_sectors"].iloc[0], "01")  # the bit pattern is not parsed as an integer
+    assert_equal(str(df["tce_plnt_num"].dtype), "int32")
+    assert_equal(str(df["tce_num_transits"].dtype), "Int32")
+    assert_equal(str(df["tce_full_conv"].dtype), "boolean")
+    assert_equal(str(df["tce_sradius_prov"].dtype), "category")
+    assert_equal(str(df["tce_steff_err"].dtype), "float64")
+
+    df_low = tess_dv_fast.read_tcestats_csv(low_precision=True)
+    assert_equal(str(df_low["tce_steff_err"].dtype), "float32")
+    assert_equal(str(df_low["tce_period"].dtype), "float64")
+    assert_almost_equal(df_low["tce_steff"].to_numpy(), df["tce_steff"].to_numpy(), decimal=2)
+
+    # the dtype specified by the caller takes precedence
+    df = tess_dv_fast.read_tcestats_csv(dtype={"tce_sradius_prov": str}, usecols=["ticid", "tce_sradius_prov"])
+    assert_equal(list(df.columns), ["ticid", "tce_sradius_prov"])
+    assert str(df["tce_sradius_prov"].dtype) != "category"
+
+
+def test_read_tcestats_csv_dtypes_blank_values(tmp_path):
+    # the counts and the flags are nullable, a blank value is read as NA
+    csv_name = "tess2018206190142-s0001-s0001_dvr-tcestats.csv"
+    lines = (Path(tess_dv_fast_spec.DATA_BASE_DIR) / csv_name).read_text().splitlines()
+    header_idx = next(i for i, line in enumerate(lines) if not line.startswith("#"))
+    columns = lines[header_idx].split(",")
+    values = lines[header_idx + 1].split(",")
+    blank_cols = ["tce_num_transits", "tce_ntoi", "bootstrap_transit_count", "tce_full_conv", "tcet_full_conv"]
+    for col in blank_cols:
+        values[columns.index(col)] = ""
+    lines[header_idx + 1] = ",".join(values)
+    (tmp_path / csv_name).write_text("\n".join(lines) + "\n")
+
+    df = tess_dv_fast_build._read_raw_sector_tcestats_csv(str(tmp_path / csv_name))
+    df_orig = tess_dv_fast_build._read_raw_sector_tcestats_csv(f"{tess_dv_fast_spec.DATA_BASE_DIR}/{csv_name}")
+    assert df.loc[0, blank_cols].isna().all()
+    assert_frame_equal(df.drop(columns=blank_cols), df_orig.drop(columns=blank_cols))
+    assert_frame_equal(df.loc[1:, blank_cols], df_orig.loc[1:, blank_cols])
+
+
+def test_read_compressed_sources(tmp_path):
+    data_dir = Path(tess_dv_fast_spec.DATA_BASE_DIR)
+    csv_name = "tess2018206190142-s0001-s0001_dvr-tcestats.csv"
+    sh_name = "tesscurl_sector_1_dv.sh"
+    for name in [csv_name, sh_name]:
+        with open(data_dir / name, "rb") as f_in, gzip.open(tmp_path / f"{name}.gz", "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+    # the compressed files are read directly, with the same results
+    assert_frame_equal(
+        tess_dv_fast_build._read_raw_sector_tcestats_csv(str(tmp_path / f"{csv_name}.gz")),
+        tess_dv_fast_build._read_raw_sector_tcestats_csv(str(data_dir / csv_name)),
+    )
+    assert_frame_equal(
+        tess_dv_fast_build._parse_dv_products_script(str(tmp_path / f"{sh_name}.gz")),
+        tess_dv_fast_build._parse_dv_products_script(str(data_dir / sh_name)),
+    )
+
+    # the build manifest records the same info, regardless of the compression
+    url = f"https://example.com/{csv_name}"
+    assert_equal(
+        tess_dv_fast_build._file_info(url, str(tmp_path / f"{csv_name}.gz")),
+        tess_dv_fast_build._file_info(url, str(data_dir / csv_name)),
+    )
+
+
+def test_build_profiler_without_resource(monkeypatch):
+    # e.g., on Windows: no /proc and no module resource, the peak RSS is not available
+    real_open = open
+
+    def open_no_proc(file, *args, **kwargs):
+        if str(file).startswith("/proc/"):
+            raise OSError("no /proc")
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", open_no_proc)
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert build_profiler._read_peak_rss() == 0
+
+
+@pytest.mark.parametrize("num_workers", [None, 2])
+def test_build_profile(tmp_path, num_workers):
+    report_path = tmp_path / "profile.json"
+    with build_profiler.profiling("spoc", str(report_path)):
+        tess_dv_fast_build.download_all_data(
+            minimal_db=True, extract_source_urls=False, num_workers=num_workers
+        )
+    assert not build_profiler.is_enabled()
+
+    with open(report_path, "r") as f:
+        report = json.load(f)
+    stage_names = [
+        "download",
+        "parse_tcestats_csv",
+        "parse_dv_script",
+        "merge",
+        "append_csv",
+        "export_db",
+        "db_insert",
+        "db_finalize",
+    ]
+    assert set(stage_names).issubset(report["summary"].keys())
+
+    # the stages of each sector, including the ones in the worker processes
+    num_sectors = len(tess_dv_fast_spec.sources_tcestats_single_sector + tess_dv_fast_spec.sources_tcestats_multi_sector)
+    for name in ["parse_tcestats_csv", "parse_dv_script", "merge", "append_csv"]:
+        assert report["summary"][name]["count"] == num_sectors
+    num_rows = len(tess_dv_fast.read_tcestats_csv())
+    assert report["summary"]["append_csv"]["rows"] == num_rows
+    assert report["summary"]["db_insert"]["rows"] == num_rows
+
+    for r in report["stages"]:
+        assert r["wall_s"] >= 0 and r["cpu_s"] >= 0 and r["peak_rss_mb"] > 0
+
+    # profiling is disabled by default: no stage is recorded
+    assert build_profiler.stage("download") is build_profiler.stage("merge")
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_build_partitioned(tmp_path, minimal_db):
+    data_dir = Path(tess_dv_fast_spec.DATA_BASE_DIR)
+    csv_path = data_dir / tess_dv_fast_spec.TCESTATS_FILENAME
+    db_path = data_dir / tess_dv_fast_spec.TCESTATS_DBNAME
+
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    csv_single_node = csv_path.read_bytes()
+    dump_single_node = _dump_test_db()
+    manifest_single_node = tess_dv_fast_build._read_build_manifest()
+    csv_path.unlink()
+    db_path.unlink()
+
+    num_partitions = 3
+    partial_db_paths = [
+        tess_dv_fast_build.build_partial_db(
+            i, num_partitions, minimal_db=minimal_db, extract_source_urls=False, partial_dir=str(tmp_path)
+        )
+        for i in range(num_partitions)
+    ]
+    # the order of the partials given does not matter
+    tess_dv_fast_build.merge_partial_dbs(partial_db_paths[::-1])
+
+    assert _dump_test_db() == dump_single_node
+    assert csv_path.read_bytes() == csv_single_node
+    assert tess_dv_fast_build._read_build_manifest() == manifest_single_node
+
+    # case some partition is missing
+    with pytest.raises(ValueError, match="partitions"):
+        tess_dv_fast_build.merge_partial_dbs(partial_db_paths[:2])
+
+
+@pytest.mark.parametrize("archive_format", ["tar", "gztar", "zip"])
+def test_build_from_source_archive(tmp_path, archive_format):
+    data_dir = Path(tess_dv_fast_spec.DATA_BASE_DIR)
+    csv_path = data_dir / tess_dv_fast_spec.TCESTATS_FILENAME
+
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False)
+    csv_expected = csv_path.read_bytes()
+    dump_expected = _dump_test_db()
+    manifest_expected = tess_dv_fast_build._read_build_manifest()
+
+    # the sources in an archive, in a sub directory, some of them compressed
+    source_names = [
+        Path(s[key]).name for s in tess_dv_fast_build._get_sector_sources() for key in ["tcestats_path", "dv_sh_path"]
+    ]
+    src_dir = tmp_path / "src" / "mast"
+    src_dir.mkdir(parents=True)
+    for i, name in enumerate(source_names):
+        if i % 2 == 0:
+            shutil.copy(data_dir / name, src_dir / name)
+        else:
+            with open(data_dir / name, "rb") as f_in, gzip.open(src_dir / f"{name}.gz", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+    archive_path = shutil.make_archive(str(tmp_path / "sources"), archive_format, root_dir=tmp_path / "src")
+    assert tarfile.is_tarfile(archive_path) or zipfile.is_zipfile(archive_path)
+
+    sector_sources = tess_dv_fast_build._get_sector_sources(archive_path)
+    for s in sector_sources:
+        for key in ["tcestats_path", "dv_sh_path"]:
+            archive_of_source, member_name = archive_utils.split_member_path(s[key])
+            assert archive_of_source == archive_path and "mast/" in member_name
+
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False, source_archive=archive_path)
+    assert csv_path.read_bytes() == csv_expected
+    assert _dump_test_db() == dump_expected
+    assert tess_dv_fast_build._read_build_manifest() == manifest_expected
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_db_generated_columns_match_source_names(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    df_db = _read_tcestats_from_test_db()
+
+    # the DV product filenames as listed in the raw tesscurl scripts
+    df_products = pd.concat(
+        [
+            tess_dv_fast_build._get_dv_products_of_sectors(s["sectors_val"], s["dv_sh_path"]).assign(sectors=s["sectors_val"])
+            for s in tess_dv_fast_build._get_sector_sources()
+        ]
+    )
+    df_expected = pd.merge(df_db[["ticid", "tce_plnt_num", "sectors"]], df_products, on=["ticid", "tce_plnt_num", "sectors"])
+    assert_equal(len(df_expected), len(df_db))
+
+    product_cols = ["dvs", "dvm", "dvr"] if minimal_db else ["dvs", "dvm", "dvr", "dvr_xml", "dvt"]
+    if minimal_db:
+        # the minimal db derives the products of the TCE from the run of its dvs
+        assert_equal(df_db["dvs"].to_list(), df_expected["dvs"].to_list())
+        assert df_db["dvm"].str.endswith("_dvm.pdf").all() and df_db["dvr"].str.endswith("_dvr.pdf").all()
+    else:
+        # the full db has the same filenames as the raw ones, including the products of other runs of the TIC
+        assert (df_expected["dvs"].str[-13:-8] != df_expected["dvr"].str[-13:-8]).any()
+        for col in product_cols:
+            assert_equal(df_db[col].to_list(), df_expected[col].to_list())
+
+    df_csv = tess_dv_fast.read_tcestats_csv().sort_values("exomast_id").reset_index(drop=True)
+    assert_equal(df_db["exomast_id"].to_list(), df_csv["exomast_id"].to_list())
+
+    # they are not stored as literal strings in the table
+    con = sqlite3.connect(f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.TCESTATS_DBNAME}")
+    try:
+        table_cols = [row[1] for row in con.execute(f"pragma table_info({tess_dv_fast_build._DB_TABLE});")]
+    finally:
+        con.close()
+    assert not set(["exomast_id"] + product_cols).intersection(table_cols)
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_build_quantized(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    df_orig = _read_tcestats_from_test_db()
+
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False, quantize=True)
+    df = _read_tcestats_from_test_db()
+
+    # the view has the same columns, with the quantized ones decoded to the values rounded to their precision
+    assert_equal(list(df.columns), list(df_orig.columns))
+    quantized_cols = list(tess_dv_fast_build._DB_QUANTIZED_COLUMNS)
+    for col, decimals in tess_dv_fast_build._DB_QUANTIZED_COLUMNS.items():
+        assert_allclose(df[col], df_orig[col], rtol=0, atol=0.5 * 10**-decimals * (1 + 1e-6), err_msg=col)
+        assert_equal(df[col].to_numpy(), df[col].round(decimals).to_numpy(), err_msg=col)
+    assert_equal(df_orig["tce_ditco_jsky_err"].min(), -1)  # the sentinel of no joint offset is kept as is
+    # the ones derived from the quantized columns, e.g., tce_prad_jup, are derived from the decoded values
+    derived_cols = ["tce_prad_jup", "tce_depth_pct", "tce_tic_offset"] + [c for c in df.columns if c.endswith("_sig")]
+    assert_allclose(df["tce_depth_pct"], df["tce_depth"] / 10000)
+    assert_frame_equal(
+        df.drop(columns=quantized_cols + derived_cols), df_orig.drop(columns=quantized_cols + derived_cols)
+    )
+
+    db_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.TCESTATS_DBNAME}"
+    con = sqlite3.connect(db_path)
+    try:
+        col_types = {row[1]: row[2] for row in con.execute(f"pragma table_info({tess_dv_fast_build._DB_TABLE});")}
+    finally:
+        con.close()
+    assert_equal({col_types[c] for c in quantized_cols}, {"INTEGER"})
+
+    df_infos = tess_dv_fast.get_tce_infos_of_tic(261136679)
+    assert_equal(
+        sorted(df_infos["tce_time0bt"]), sorted(df_orig[df_orig["ticid"] == 261136679]["tce_time0bt"])
+    )  # the epochs have 2 decimals in the sources
+
+    # the same db from a chunked export
+    db_dump = _dump_test_db()
+    tess_dv_fast_build._export_tcestats_as_db(minimal_db=minimal_db, chunksize=4, quantize=True)
+    assert _dump_test_db() == db_dump
+
+    # an incremental build of a different quantize is a full build
+    manifest = tess_dv_fast_build._read_build_manifest()
+    assert manifest["quantize"]
+    assert not tess_dv_fast_build._can_build_incrementally(manifest, minimal_db)
+
+
+def test_to_sectors_masks():
+    df = to_sectors_masks(
+        ["0111101111", "0" * 80, None, "0" * 14 + "1" * 66],
+        ["s0001-s0009", "s0095-s0095", "s0002-s0004", "s0014-s0086"],
+    )
+    # the single-sector TCE covers its sector even if tce_sectors does not show it,
+    # and the missing / truncated (beyond sector 79) bits are rebuilt from the span of the sectors
+    assert_equal(count_sectors(df), [8, 1, 3, 73])
+    assert_equal(covers_sector(df, 5), [False, False, False, False])
+    assert_equal(covers_sector(df, 6), [True, False, False, False])
+    assert_equal(covers_sector(df, 95), [False, True, False, False])  # in the 2nd mask
+    assert_equal(covers_sector(df, 86), [False, False, False, True])
+    assert (df.to_numpy() >= 0).all()
+
+    with pytest.raises(ValueError, match="beyond"):
+        to_sectors_masks(["0"], ["s0001-s0300"])
+
+    # the sector is within the bitmasks, sectors 0 - 251
+    assert_equal(covers_sector(df, 251), [False, False, False, False])
+    assert sql_covers_sector(251) == "(tce_sectors_mask_3 >> 62) & 1 = 1"
+    for sector in [-1, 252, 300]:
+        with pytest.raises(ValueError, match="beyond"):
+            covers_sector(df, sector)
+        with pytest.raises(ValueError, match="beyond"):
+            sql_covers_sector(sector)
+
+
+def test_to_sectors_masks_empty():
+    df_tcestats = tess_dv_fast.read_tcestats_csv().iloc[:0]
+    df = to_sectors_masks(df_tcestats["tce_sectors"], df_tcestats["sectors"])
+    assert list(df.columns) == SECTORS_MASK_COLUMNS
+    assert len(df) == 0
+    assert (df.dtypes == "int64").all()
+    assert_equal(count_sectors(df), [])
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_sector_coverage(minimal_db):
+    _build_test_db(minimal_db=minimal_db)
+
+    df = tess_dv_fast.get_tce_infos_of_tic(261136679)
+    assert_equal(list(df["sectors"]), ["s0001-s0096"] * 2 + ["s0001-s0009"] * 2 + ["s0001-s0001", "s0095-s0095"])
+    # s0001-s0096: 19 sectors up to sector 79, and (assumed) all of sectors 80 - 96
+    assert_equal(list(df["tce_num_sectors"]), [19 + 17] * 2 + [3] * 2 + [1, 1])
+    # the bit pattern string is not in the minimal db, and in the details of the TCEs of the full db
+    assert "tce_sectors" not in df.columns
+
+    df = tess_dv_fast.get_tce_infos_covering_sector(4, tic=261136679)
+    assert_equal(list(df["sectors"]), ["s0001-s0096"] * 2 + ["s0001-s0009"] * 2)
+    df = tess_dv_fast.get_tce_infos_covering_sector(95, tic=[261136679])
+    assert_equal(list(df["sectors"]), ["s0001-s0096"] * 2 + ["s0095-s0095"])
+
+    df = tess_dv_fast.get_tce_infos_covering_sector(95)
+    df_all = tess_dv_fast.read_tcestats_csv()
+    assert_equal(len(df), len(df_all[df_all["sectors"].isin(["s0001-s0096", "s0095-s0095"])]))
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_db_derived_columns(minimal_db):
+    _build_test_db(minimal_db=minimal_db)
+
+    # the derived columns precomputed in the db are the same as the ones derived by the query module
+    df = tess_dv_fast.get_tce_infos_of_tic([261136679, 471013582])
+    derived_cols = [
+        "tce_num_sectors",
+        "sectors_span",
+        "tce_prad_jup",
+        "tce_depth_pct",
+        "tce_ditco_msky_sig",
+        "tce_ditco_jsky_sig",
+        "tce_dicco_msky_sig",
+        "tce_tic_offset",
+        "tce_tic_offset_sig",
+    ]
+    df_derived = df.drop(columns=derived_cols)
+    tess_dv_fast._add_helpful_columns_to_tcestats(df_derived)
+    assert_frame_equal(df_derived[derived_cols], df[derived_cols], check_dtype=False)
+
+    # the TicOffset shown: the one from the joint difference image unless there is none (error -1)
+    is_jsky = df["tce_ditco_jsky_err"] >= 0
+    assert is_jsky.any() and not is_jsky.all()
+    assert_equal(df["tce_tic_offset"].to_numpy(), df["tce_ditco_jsky"].where(is_jsky, df["tce_ditco_msky"]).to_numpy())
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+@pytest.mark.parametrize("quantize", [False, True])
+def test_db_derived_columns_zero_errors(minimal_db, quantize, monkeypatch):
+    _build_test_db(minimal_db=minimal_db)
+
+    # the ratios of a zero error are the same as the ones of pandas: +/-inf, or NaN for 0 / 0
+    read_tcestats_csv = tess_dv_fast_build._read_tcestats_csv
+
+    def read_tcestats_csv_with_zero_errors(*args, **kwargs):
+        df = read_tcestats_csv(*args, **kwargs)
+        rows = df.index[df["ticid"] == 261136679]
+        df.loc[rows[0], ["tce_ditco_msky_err", "tce_dicco_msky_err"]] = 0
+        df.loc[rows[1], ["tce_ditco_msky", "tce_ditco_msky_err", "tce_ditco_jsky_err"]] = 0
+        df.loc[rows[2], ["tce_dicco_msky", "tce_dicco_msky_err"]] = [-1, 0]
+        return df
+
+    monkeypatch.setattr(tess_dv_fast_build, "_read_tcestats_csv", read_tcestats_csv_with_zero_errors)
+    tess_dv_fast_build._export_tcestats_as_db(minimal_db=minimal_db, quantize=quantize)
+
+    df = tess_dv_fast.get_tce_infos_of_tic(261136679)
+    derived_cols = ["tce_ditco_msky_sig", "tce_ditco_jsky_sig", "tce_dicco_msky_sig", "tce_tic_offset_sig"]
+    df_derived = df.drop(columns=derived_cols)
+    tess_dv_fast._add_helpful_columns_to_tcestats(df_derived)
+    assert_frame_equal(df_derived[derived_cols], df[derived_cols], check_dtype=False)
+    assert np.isinf(df[["tce_ditco_msky_sig", "tce_dicco_msky_sig"]].to_numpy()).sum() >= 3
+    assert df["tce_ditco_msky_sig"].isna().any()
+
+    # restore the db of the test data for the other tests
+    monkeypatch.undo()
+    tess_dv_fast_build._export_tcestats_as_db(minimal_db=minimal_db)
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_db_split_details(minimal_db):
+    _build_test_db(minimal_db=minimal_db)
+    df_csv = tess_dv_fast.read_tcestats_csv()
+
+    # the TCEs of a TIC has the same columns (the ones for display) for both minimal and full dbs
+    df = tess_dv_fast.get_tce_infos_of_tic(261136679)
+    assert not {"tce_sectors", "tce_sradius_prov", "tce_model_snr", "dvr_xml"}.intersection(df.columns)
+
+    tce = tess_dv_fast.get_tce_details("TIC261136679S0001S0009TCE2")
+    assert_equal(tce["exomast_id"], "TIC261136679S0001S0009TCE2")
+    assert_equal(tce["tce_period"], df.loc[df["exomast_id"] == tce["exomast_id"], "tce_period"].iloc[0])
+    if minimal_db:
+        # only the parameters in the db
+        assert_equal(set(tce.index), set(df.columns))
+    else:
+        # all the parameters of the master csv
+        tce_csv = df_csv[df_csv["exomast_id"] == tce["exomast_id"]].iloc[0]
+        assert not set(tce_csv.index) - set(tce.index)
+        for col in ["tce_sectors", "tce_sradius_prov", "tce_model_snr", "dvr_xml", "dvt"]:
+            assert_equal(tce[col], tce_csv[col])
+
+        db_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.TCESTATS_DBNAME}"
+        with sqlite3.connect(db_path) as con:
+            main_cols = [row[1] for row in con.execute(f"pragma table_info({tess_dv_fast_build._DB_TABLE});")]
+            details_cols = [row[1] for row in con.execute(f"pragma table_info({tess_dv_fast_build._DB_DETAILS_TABLE});")]
+            df_full = pd.read_sql("select * from tess_tcestats_full", con)
+        # the main table has the columns of the minimal db (and the overrides of the products in the view)
+        assert "tce_model_snr" not in main_cols and "tce_model_snr" in details_cols
+        assert_equal(set(main_cols) & set(details_cols), set(tess_dv_fast_build._DB_PRIMARY_KEY))
+        assert_equal(len(df_full), len(df_csv))
+
+    assert tess_dv_fast.get_tce_details("TIC261136679S0001S0009TCE9") is None
+    with pytest.raises(ValueError, match="Invalid TCE id"):
+        tess_dv_fast.get_tce_details("261136679")
+
+
+@pytest.mark.parametrize("minimal_db", [True, False])
+def test_db_metadata(minimal_db):
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+
+    metadata = tess_dv_fast.get_db_metadata()
+    assert_equal(metadata["schema_version"], db_utils.SCHEMA_VERSIONS["spoc"])
+    assert_equal(metadata["minimal_db"], minimal_db)
+    assert_equal(metadata["quantize"], False)
+    df_csv = tess_dv_fast.read_tcestats_csv()
+    assert_equal(metadata["num_rows_of_sectors"], df_csv["sectors"].value_counts().sort_index().to_dict())
+    assert len(metadata["build_id"]) == 32 and len(metadata["sources_hash"]) == 64
+
+    # cached, with a copy for each call
+    metadata["build_id"] = "modified"
+    assert tess_dv_fast.get_db_metadata()["build_id"] != "modified"
+
+    # a new build id for each build, while the ones of the data are the same
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False)
+    metadata_rebuilt = tess_dv_fast.get_db_metadata()
+    assert metadata_rebuilt["build_id"] != metadata["build_id"]
+    for key in ["num_rows_of_sectors", "sources_hash", "minimal_db"]:
+        assert_equal(metadata_rebuilt[key], metadata[key])
+
+    # no new build id for an incremental build with no changes, as the db is not updated
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False, incremental=True)
+    assert_equal(tess_dv_fast.get_db_metadata()["build_id"], metadata_rebuilt["build_id"])
+
+    # an incremental update of a (changed) sector
+    manifest = tess_dv_fast_build._read_build_manifest()
+    manifest["sectors"]["s0001-s0009"]["tcestats"]["sha256"] = "changed"
+    manifest_path = f"{tess_dv_fast_spec.DATA_BASE_DIR}/{tess_dv_fast_spec.BUILD_MANIFEST_FILENAME}"
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    tess_dv_fast_build.download_all_data(minimal_db=minimal_db, extract_source_urls=False, incremental=True)
+    metadata_updated = tess_dv_fast.get_db_metadata()
+    assert metadata_updated["build_id"] != metadata_rebuilt["build_id"]
+    assert_equal(metadata_updated["num_rows_of_sectors"], metadata["num_rows_of_sectors"])
@@ -0,0 +1,103 @@
+
+from numpy.testing import assert_equal
+from pandas.testing import assert_frame_equal
+import pytest
+
+from tess_dv_fast import tess_spoc_dv_fast_spec, tess_spoc_dv_fast_build, tess_spoc_dv_fast
+from tess_dv_fast import tess_dv_fast_spec, tess_dv_fast_build, tess_dv_fast, tce_html, tce_html_build, db_utils
+
+
+def test_parse_dvs_filenames(tess_spoc_data_dir):
+    df = tess_spoc_dv_fast_build._parse_dvs_filenames(
+        str(tess_spoc_data_dir / "hlsp_tess-spoc_tess_phot_s0036-s0069_tess_v1_dl-dv.sh")
+    )
+    assert_equal(df["ticid"].to_list(), [1234567890, 33979459])
+    assert_equal(df["tce_plnt_num"].to_list(), [3, 1])
+
+    # the duplicate run of a TCE is dropped, sorted by ticid and tce_plnt_num
+    df = tess_spoc_dv_fast_build._get_tess_tcestats_csv("s0037-s0037")
+    assert_equal(list(df.columns), ["ticid", "tce_plnt_num", "sectors"])
+    assert_equal(df["ticid"].to_list(), [9006668, 261136679])
+    assert_equal(df["tce_plnt_num"].to_list(), [1, 1])
+    assert_equal(df["sectors"].to_list(), ["s0037-s0037"] * 2)
+
+    # unexpected layout: tce_plnt_num not zero-padded to 2 digits
+    with open(tess_spoc_data_dir / "bad_dl-dv.sh", "w") as f:
+        f.write("curl -f --create-dirs --output hlsp_tess-spoc_tess_phot_0000000033979459-s0036_tess_v1_dvs-1.pdf url\n")
+    with pytest.raises(ValueError, match="Unexpected"):
+        tess_spoc_dv_fast_build._parse_dvs_filenames(str(tess_spoc_data_dir / "bad_dl-dv.sh"))
+
+
+def test_build_parallel_identical_to_serial(tess_spoc_data_dir):
+    csv_path = tess_spoc_data_dir / tess_spoc_dv_fast_spec.TCESTATS_FILENAME
+
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    csv_serial = csv_path.read_bytes()
+    df = tess_spoc_dv_fast_build._read_tcestats_csv()
+    assert_equal(len(df), 4 + 2 + 2)
+    assert_equal(df["sectors"].unique().tolist(), ["s0036-s0036", "s0037-s0037", "s0036-s0069"])
+
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False, num_workers=2)
+    assert csv_path.read_bytes() == csv_serial
+    assert_frame_equal(tess_spoc_dv_fast_build._read_tcestats_csv(), df)
+
+
+def test_build_query(tess_spoc_data_dir):
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+
+    df = tess_spoc_dv_fast.get_tce_infos_of_tic(33979459)
+    # the multi-sector TCE comes first
+    assert_equal(df["sectors"].to_list(), ["s0036-s0069", "s0036-s0036", "s0036-s0036"])
+    assert_equal(df["sectors_span"].to_list(), [34, 1, 1])
+    assert_equal(df["id"].to_list(), ["TIC33979459S0036S0069TCE1_F", "TIC33979459S0036S0036TCE1_F", "TIC33979459S0036S0036TCE2_F"])
+    assert_equal(df["dvs"].iloc[0], "hlsp_tess-spoc_tess_phot_0000000033979459-s0036-s0069_tess_v1_dvs-01.pdf")
+
+
+@pytest.mark.parametrize("num_workers", [None, 2])
+def test_prerendered_tce_html(tess_spoc_data_dir, spoc_data_dir, monkeypatch, num_workers):
+    tess_dv_fast_build.download_all_data(minimal_db=True, extract_source_urls=False)
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    monkeypatch.setattr(tce_html, "DATA_BASE_DIR", str(tess_spoc_data_dir))
+
+    assert tce_html.get_prerendered_tce_html(261136679) is None  # no pre-rendered db yet
+
+    tce_html_build.build_tce_html_db(num_workers=num_workers, batch_num_tics=4)
+    assert not (tess_spoc_data_dir / f"{tess_dv_fast_spec.TCE_HTML_DBNAME}.tmp").exists()
+    metadata = db_utils.read_metadata(str(tess_spoc_data_dir / tess_dv_fast_spec.TCE_HTML_DBNAME))
+    assert_equal(metadata["schema_version"], db_utils.SCHEMA_VERSIONS["tce_html"])
+    assert_equal(
+        metadata["source_build_ids"],
+        {
+            "spoc": tess_dv_fast.get_db_metadata()["build_id"],
+            "tess_spoc": tess_spoc_dv_fast.get_db_metadata()["build_id"],
+        },
+    )
+
+    # both SPOC and TESS-SPOC, SPOC only, TESS-SPOC only
+    for tic in [261136679, 471013582, 1234567890]:
+        expected = tce_html.render_tce_html(
+            tess_dv_fast.get_tce_infos_of_tic(tic), tess_spoc_dv_fast.get_tce_infos_of_tic(tic)
+        )
+        assert tce_html.get_prerendered_tce_html(tic) == expected
+    assert tce_html.get_prerendered_tce_html(261136679).num_tess_spoc_tces == 2
+    assert tce_html.get_prerendered_tce_html(471013582).tess_spoc_html == ""
+    assert "No SPOC TCE" in tce_html.get_prerendered_tce_html(1234567890).spoc_html
+
+    assert tce_html.get_prerendered_tce_html(12345) is None  # a TIC with no TCE
+
+    # stale once either db is rebuilt
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    assert tce_html.get_prerendered_tce_html(261136679) is None
+
+
+def test_db_metadata(tess_spoc_data_dir):
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+
+    metadata = tess_spoc_dv_fast.get_db_metadata()
+    assert_equal(metadata["schema_version"], db_utils.SCHEMA_VERSIONS["tess_spoc"])
+    assert_equal(metadata["num_rows_of_sectors"], {"s0036-s0036": 4, "s0036-s0069": 2, "s0037-s0037": 2})
+
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    metadata_rebuilt = tess_spoc_dv_fast.get_db_metadata()
+    assert metadata_rebuilt["build_id"] != metadata["build_id"]
+    assert_equal(metadata_rebuilt["sources_hash"], metadata["sources_hash"])
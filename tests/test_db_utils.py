@@ -0,0 +1,91 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from tess_dv_fast import db_utils
+
+
+def _dump_table(db_path, table_name):
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute(f'select * from "{table_name}"').fetchall()
+    finally:
+        con.close()
+
+
+def test_bulk_load_same_as_to_sql(tmp_path):
+    df = pd.DataFrame(
+        {
+            "ticid": np.array([1, 2, 3], dtype="int64"),
+            "tce_plnt_num": np.array([1, 2, 1], dtype="int32"),
+            "tce_depth": [100.5, np.nan, 300.25],
+            "tce_steff_err": np.array([10.5, 20.25, np.nan], dtype="float32"),
+            "tce_sradius_prov": pd.Categorical(["Solar", None, "TIC8.1"]),
+            "sectors": ["s0001-s0001", "s0002-s0002", None],
+            "tce_full_conv": [True, False, True],
+        }
+    )
+
+    db_path_expected = str(tmp_path / "to_sql.db")
+    con = sqlite3.connect(db_path_expected)
+    df.to_sql("tess_tcestats", con, index=False)
+    con.commit()
+    con.close()
+
+    db_path = str(tmp_path / "bulk_load.db")
+    con = db_utils.connect_for_bulk_load(db_path)
+    try:
+        db_utils.create_table(con, "tess_tcestats", df)
+        db_utils.insert_df(con, "tess_tcestats", df, batch_size=2)  # batch size not dividing the rows evenly
+        db_utils.finalize_db(con)
+    finally:
+        con.close()
+
+    assert _dump_table(db_path, "tess_tcestats") == _dump_table(db_path_expected, "tess_tcestats")
+
+    con = sqlite3.connect(db_path)
+    try:
+        assert con.execute("pragma page_size;").fetchone()[0] == db_utils.DEFAULT_PAGE_SIZE
+        sql_schema = con.execute("select sql from sqlite_master where name = 'tess_tcestats';").fetchone()[0]
+        assert con.execute("select count(*) from sqlite_master where name = 'sqlite_stat1';").fetchone()[0] == 1
+    finally:
+        con.close()
+
+    con = sqlite3.connect(db_path_expected)
+    try:
+        assert sql_schema == con.execute("select sql from sqlite_master where name = 'tess_tcestats';").fetchone()[0]
+    finally:
+        con.close()
+
+
+def test_sectors_table_and_view(tmp_path):
+    df = pd.DataFrame(
+        {
+            "ticid": [1, 1, 2],
+            "sectors": ["s0014-s0086", "s0001-s0001", "s0001-s0001"],
+            "tce_plnt_num": [1, 1, 2],
+        }
+    )
+    df.insert(1, "sectors_id", db_utils.to_sectors_id(df["sectors"]).to_numpy())
+    np.testing.assert_equal(df["sectors_id"].to_list(), [140086, 10001, 10001])
+
+    con = sqlite3.connect(tmp_path / "test.db")
+    try:
+        db_utils.create_table(con, "tcestats_data", df.drop(columns=["sectors"]), primary_key=["ticid", "sectors_id", "tce_plnt_num"])
+        db_utils.insert_df(con, "tcestats_data", df.drop(columns=["sectors"]))
+        db_utils.create_sectors_table(con, "tcestats_data")
+        db_utils.create_view_with_sectors(con, "tcestats", "tcestats_data", extra_columns=[("tic_str", "'TIC' || ticid")])
+
+        assert con.execute("select * from sectors order by id;").fetchall() == [
+            (10001, "s0001-s0001", 1, 1, 1, 0),
+            (140086, "s0014-s0086", 14, 86, 73, 1),
+        ]
+        # the view has the sectors (text) in place of sectors_id
+        df_view = pd.read_sql("select * from tcestats order by ticid, sectors_span desc", con)
+        assert list(df_view.columns) == ["ticid", "sectors", "tce_plnt_num", "tic_str", "sectors_span"]
+        assert df_view["sectors"].to_list() == ["s0014-s0086", "s0001-s0001", "s0001-s0001"]
+        assert df_view["sectors_span"].to_list() == [73, 1, 1]
+        assert df_view["tic_str"].to_list() == ["TIC1", "TIC1", "TIC2"]
+    finally:
+        con.close()
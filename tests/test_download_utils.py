@@ -0,0 +1,262 @@
+import hashlib
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+
+import pytest
+import requests
+
+from tess_dv_fast import download_utils
+
+
+_LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """A local stand-in of the MAST server, serving the contents in `server.files`.
+
+    It supports conditional requests (ETag / Last-Modified) and range requests.
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so that connection reuse can be observed
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.client_ports.add(self.client_address[1])
+            server.num_requests[self.path] = server.num_requests.get(self.path, 0) + 1
+            server.request_headers.setdefault(self.path, []).append(dict(self.headers))
+            num_failures_left = server.num_failures.get(self.path, 0)
+            if num_failures_left > 0:
+                server.num_failures[self.path] = num_failures_left - 1
+            num_truncations_left = server.num_truncations.get(self.path, 0)
+            if num_truncations_left > 0:
+                server.num_truncations[self.path] = num_truncations_left - 1
+
+        if num_failures_left > 0:
+            self._send(503, b"Service Unavailable")
+        elif self.path in server.files:
+            body = server.files[self.path]
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            range_header, if_range = self.headers.get("Range"), self.headers.get("If-Range")
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", etag=etag)
+            elif range_header is not None and if_range in (None, etag, _LAST_MODIFIED):
+                start = int(range_header[len("bytes=") : -len("-")])
+                if start >= len(body):
+                    self._send(416, b"Range Not Satisfiable")
+                else:
+                    content_range = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                    self._send(206, body[start:], etag=etag, content_range=content_range)
+            else:
+                self._send(200, body, etag=etag, truncate=num_truncations_left > 0)
+        else:
+            self._send(404, b"Not Found")
+
+    def _send(self, status_code, body, etag=None, content_range=None, truncate=False):
+        self.send_response(status_code)
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", _LAST_MODIFIED)
+        if content_range is not None:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+        if truncate:
+            # simulate a connection dropped in the middle of the transfer
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep the test output clean
+
+
+@pytest.fixture
+def http_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.lock = threading.Lock()
+    server.files = {f"/sector_{i}.csv": f"ticid,sector\n{i},{i}\n".encode() for i in range(1, 9)}
+    server.num_failures = {}
+    server.num_truncations = {}
+    server.request_headers = {}
+    server.num_requests = {}
+    server.client_ports = set()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_files(http_server, tmp_path):
+    url_filename_list = [
+        (f"{http_server.base_url}{path}", None) for path in sorted(http_server.files.keys())
+    ]
+    progress = []
+
+    results = download_utils.download_files(
+        url_filename_list,
+        download_dir=str(tmp_path),
+        max_workers=2,
+        progress_func=lambda *args: progress.append(args),
+    )
+
+    # results are in the same order of the list
+    for (url, _), (local_filename, is_cache_used) in zip(url_filename_list, results):
+        path = url.replace(http_server.base_url, "")
+        assert local_filename == str(tmp_path / path.lstrip("/"))
+        assert not is_cache_used
+        with open(local_filename, "rb") as f:
+            assert f.read() == http_server.files[path]
+
+    assert [p[3] for p in progress] == list(range(1, 9))  # num_done
+    assert all(p[4] == 8 for p in progress)  # num_total
+
+    # connections are reused, i.e., not one connection per file
+    assert len(http_server.client_ports) <= 2
+
+    # files already downloaded are not re-downloaded with the default cache policy
+    results = download_utils.download_files(url_filename_list, download_dir=str(tmp_path))
+    assert all(is_cache_used for _, is_cache_used in results)
+    assert all(n == 1 for n in http_server.num_requests.values())
+
+
+def test_download_files_retry(http_server, tmp_path):
+    http_server.num_failures["/sector_1.csv"] = 2
+    url_filename_list = [(f"{http_server.base_url}/sector_1.csv", "s1.csv")]
+
+    with pytest.warns(UserWarning, match="Retry"):
+        results = download_utils.download_files(
+            url_filename_list, download_dir=str(tmp_path), backoff_factor=0.01
+        )
+    assert results == [(str(tmp_path / "s1.csv"), False)]
+    assert http_server.num_requests["/sector_1.csv"] == 3
+
+    # case too many failures
+    http_server.num_failures["/sector_2.csv"] = 3
+    url_filename_list = [(f"{http_server.base_url}/sector_2.csv", None)]
+    with pytest.warns(UserWarning, match="Retry"):
+        with pytest.raises(requests.HTTPError):
+            download_utils.download_files(
+                url_filename_list, download_dir=str(tmp_path), max_retries=2, backoff_factor=0.01
+            )
+
+    # case non-transient errors are not retried
+    url_filename_list = [(f"{http_server.base_url}/no_such_file.csv", None)]
+    with pytest.raises(requests.HTTPError):
+        download_utils.download_files(url_filename_list, download_dir=str(tmp_path))
+    assert http_server.num_requests["/no_such_file.csv"] == 1
+
+
+def test_download_file_revalidate(http_server, tmp_path):
+    url = f"{http_server.base_url}/sector_1.csv"
+    revalidate = download_utils.CachePolicy.REVALIDATE
+
+    # initial download: the validators are saved with the file
+    local_filename, is_cache_used = download_utils.download_file(
+        url, download_dir=str(tmp_path), cache_policy_func=revalidate, return_is_cache_used=True
+    )
+    assert not is_cache_used
+    assert os.path.isfile(f"{local_filename}.validators.json")
+
+    # not modified: 304, the local file is used
+    _, is_cache_used = download_utils.download_file(
+        url, download_dir=str(tmp_path), cache_policy_func=revalidate, return_is_cache_used=True
+    )
+    assert is_cache_used
+    assert http_server.request_headers["/sector_1.csv"][-1].get("If-None-Match") is not None
+    assert http_server.num_requests["/sector_1.csv"] == 2
+
+    # modified: downloaded again
+    http_server.files["/sector_1.csv"] = b"ticid,sector\n1,1\n2,1\n"
+    _, is_cache_used = download_utils.download_file(
+        url, download_dir=str(tmp_path), cache_policy_func=revalidate, return_is_cache_used=True
+    )
+    assert not is_cache_used
+    with open(local_filename, "rb") as f:
+        assert f.read() == http_server.files["/sector_1.csv"]
+
+
+def test_download_file_resume(http_server, tmp_path):
+    http_server.files["/multisector_dv.sh"] = b"".join(
+        f"curl -f -o tess_{i:06d}_dvs.pdf https://example.com/{i}\n".encode() for i in range(2000)
+    )
+    http_server.num_truncations["/multisector_dv.sh"] = 1
+    url = f"{http_server.base_url}/multisector_dv.sh"
+
+    with pytest.warns(UserWarning, match="Retry"):
+        local_filename = download_utils.download_file(
+            url, download_dir=str(tmp_path), max_retries=1, backoff_factor=0.01
+        )
+    with open(local_filename, "rb") as f:
+        assert f.read() == http_server.files["/multisector_dv.sh"]
+    assert not os.path.exists(f"{local_filename}.download")
+
+    # the retry resumes from where the dropped connection left off
+    headers_of_retry = http_server.request_headers["/multisector_dv.sh"][1]
+    assert headers_of_retry["Range"] == f"bytes={len(http_server.files['/multisector_dv.sh']) // 2}-"
+
+    # case the file has changed since the partial download: the whole new file is downloaded
+    with open(f"{local_filename}.download", "wb") as f:
+        f.write(b"stale partial content")
+    with open(f"{local_filename}.download.validators.json", "w") as f:
+        json.dump(dict(url=url, etag='"stale-etag"', last_modified=None), f)
+    os.remove(local_filename)
+    download_utils.download_file(url, download_dir=str(tmp_path))
+    with open(local_filename, "rb") as f:
+        assert f.read() == http_server.files["/multisector_dv.sh"]
+
+
+def test_zstd_without_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_utils, "_HAS_ZSTANDARD", False)
+    assert download_utils.resolve_compression("auto") == "gzip"
+    with pytest.raises(ImportError, match=r"requires package zstandard.*tess-dv-fast\"\[zstd\]\""):
+        download_utils.resolve_compression("zstd")
+
+    # a .zst source, e.g., from another machine, is not read without it
+    filename = str(tmp_path / "tesscurl_sector_1_dv.sh.zst")
+    with open(filename, "wb") as f:
+        f.write(b"\x28\xb5\x2f\xfd")
+    with pytest.raises(ImportError, match="tesscurl_sector_1_dv.sh.zst requires package zstandard"):
+        download_utils.open_file(filename)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_download_file_compressed(http_server, tmp_path, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    http_server.files["/multisector_dv.sh"] = b"".join(
+        f"curl -f -o tess_{i:06d}_dvs.pdf https://example.com/{i}\n".encode() for i in range(2000)
+    )
+    # the connection is dropped in the middle of the first transfer, to be resumed
+    http_server.num_truncations["/multisector_dv.sh"] = 1
+    url = f"{http_server.base_url}/multisector_dv.sh"
+
+    with pytest.warns(UserWarning, match="Retry"):
+        local_filename = download_utils.download_file(
+            url, download_dir=str(tmp_path), max_retries=1, backoff_factor=0.01, compression=compression
+        )
+    assert local_filename == str(tmp_path / f"multisector_dv.sh{download_utils.COMPRESSION_EXTENSIONS[compression]}")
+    assert os.path.getsize(local_filename) < len(http_server.files["/multisector_dv.sh"]) / 4
+    assert download_utils.resolve_local_filename(str(tmp_path / "multisector_dv.sh")) == local_filename
+    with download_utils.open_file(local_filename) as f:
+        assert f.read() == http_server.files["/multisector_dv.sh"]
+    headers_of_retry = http_server.request_headers["/multisector_dv.sh"][1]
+    assert headers_of_retry["Range"] == f"bytes={len(http_server.files['/multisector_dv.sh']) // 2}-"
+
+    # the compressed file is used as the cache
+    _, is_cache_used = download_utils.download_file(
+        url, download_dir=str(tmp_path), compression=compression, return_is_cache_used=True
+    )
+    assert is_cache_used
+
+    # a subsequent uncompressed download replaces the compressed one
+    local_filename_uncompressed = download_utils.download_file(url, download_dir=str(tmp_path))
+    assert not os.path.exists(local_filename)
+    assert download_utils.resolve_local_filename(str(tmp_path / "multisector_dv.sh")) == local_filename_uncompressed
@@ -0,0 +1,85 @@
+import subprocess
+import sys
+
+import pytest
+
+from tess_dv_fast import tess_spoc_dv_fast_build, tess_dv_fast_build, tess_dv_fast, tce_html, tce_html_build
+
+pytest.importorskip("flask")
+from tess_dv_fast import tess_dv_fast_webapp  # noqa: E402
+
+
+@pytest.fixture
+def client(tess_spoc_data_dir, spoc_data_dir, monkeypatch):
+    """The webapp with the full SPOC db of the test data and the synthetic TESS-SPOC db."""
+    tess_dv_fast_build.download_all_data(minimal_db=False, extract_source_urls=False)
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    monkeypatch.setattr(tce_html, "DATA_BASE_DIR", str(tess_spoc_data_dir))
+    monkeypatch.setattr(tess_dv_fast_webapp, "USE_PRERENDERED_HTML", False)
+    return tess_dv_fast_webapp.app.test_client()
+
+
+def test_tce_details(client):
+    response = client.get("/tces/details?id=TIC261136679S0001S0001TCE1")
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert "<title>TCE TIC261136679S0001S0001TCE1</title>" in html
+    assert "tce_period" in html
+    # a parameter only in the details table of the full db
+    assert "tce_model_snr" in html
+
+    assert client.get("/tces/details?id=TIC12345S0001S0001TCE1").status_code == 404
+    assert client.get("/tces/details?id=TIC261136679S1S1TCE1").status_code == 400
+    assert client.get("/tces/details?id=<script>").status_code == 400
+
+
+def test_tces_prerendered_html(client, monkeypatch):
+    tics = [261136679, 471013582, 1234567890]
+    live_pages = {tic: client.get(f"/tces?tic={tic}").get_data() for tic in tics}
+
+    tce_html_build.build_tce_html_db()
+    monkeypatch.setattr(tess_dv_fast_webapp, "USE_PRERENDERED_HTML", True)
+
+    # the pre-rendered pages are identical to the live ones, without querying the TCEs
+    with monkeypatch.context() as m:
+        m.setattr(tess_dv_fast, "get_tce_infos_of_tic", None)
+        for tic in tics:
+            response = client.get(f"/tces?tic={tic}")
+            assert response.status_code == 200
+            assert response.get_data() == live_pages[tic]
+
+    # the pre-rendered html is stale once the db is rebuilt, the pages are rendered live instead
+    tess_dv_fast_build.download_all_data(minimal_db=False, extract_source_urls=False)
+    assert tce_html.get_prerendered_tce_html(261136679) is None
+    assert client.get("/tces?tic=261136679").get_data() == live_pages[261136679]
+
+
+@pytest.mark.parametrize("url", ["/tces?tic=261136679", "/tces/details?id=TIC261136679S0001S0001TCE1"])
+def test_etag_not_modified(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == etag
+
+    assert client.get(url, headers={"If-None-Match": '"some-other-etag"'}).status_code == 200
+
+    # a new ETag once the db is rebuilt
+    tess_spoc_dv_fast_build.download_all_data(extract_source_urls=False)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_webapp_imports_no_build_modules():
+    # the serving processes load neither the build-only modules, nor the modules of them, e.g., resource
+    code = (
+        "import sys; import tess_dv_fast.tess_dv_fast_webapp; "
+        "loaded = [m for m in sys.modules if m.endswith('_build') or m in "
+        "('tess_dv_fast.build_profiler', 'tess_dv_fast.staged_outputs', 'resource')]; "
+        "assert not loaded, loaded"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)